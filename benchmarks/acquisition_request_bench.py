@@ -0,0 +1,95 @@
+"""
+Compares memory use and (de)serialization speed of `AcquisitionRequest` with its previous,
+`__dict__` based implementation.
+
+Run from the project's root: `python -m benchmarks.acquisition_request_bench`
+"""
+
+import json
+import time
+import tracemalloc
+import uuid
+
+from data_acquisition.acquisition_request import AcquisitionRequest
+
+ENTRY_COUNT = 100000
+
+
+class DictAcquisitionRequest:
+    """The way `AcquisitionRequest` used to be implemented."""
+
+    def __init__(self, title, orgUUID, publicRequest, source, category, #pylint: disable=too-many-arguments
+                 state='NEW', id=None, timestamps=None, **_): #pylint: disable=redefined-builtin
+        self.orgUUID = orgUUID #pylint: disable=invalid-name
+        self.publicRequest = publicRequest #pylint: disable=invalid-name
+        self.source = source
+        self.category = category
+        self.title = title
+        self.state = state
+        self.id = id or str(uuid.uuid4()) #pylint: disable=invalid-name
+        self.timestamps = dict(timestamps) if timestamps else {}
+
+    def __str__(self):
+        return json.dumps(self.__dict__)
+
+
+def _request_dicts():
+    return [
+        {
+            'orgUUID': str(uuid.uuid4()),
+            'publicRequest': True,
+            'source': 'http://example.com/data-set-{}.csv'.format(entry_number),
+            'category': 'other',
+            'title': 'Data set {}'.format(entry_number),
+            'state': 'DOWNLOADED',
+            'id': str(uuid.uuid4()),
+            'timestamps': {'VALIDATED': 1449523225, 'DOWNLOADED': 1449523230},
+        }
+        for entry_number in range(ENTRY_COUNT)
+    ]
+
+
+def _measure_memory(create_request, req_dicts):
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    requests = [create_request(req_dict) for req_dict in req_dicts]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename'))
+    return allocated / len(requests)
+
+
+def _measure_time(function, items):
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return time.perf_counter() - start
+
+
+def main():
+    req_dicts = _request_dicts()
+    dict_requests = [DictAcquisitionRequest(**req_dict) for req_dict in req_dicts]
+    slotted_requests = [AcquisitionRequest.from_dict(req_dict) for req_dict in req_dicts]
+    dict_jsons = [str(req) for req in dict_requests]
+    slotted_jsons = [req.to_json() for req in slotted_requests]
+
+    results = [
+        ('bytes per object',
+         _measure_memory(lambda req_dict: DictAcquisitionRequest(**req_dict), req_dicts),
+         _measure_memory(AcquisitionRequest.from_dict, req_dicts)),
+        ('serialization [s]',
+         _measure_time(str, dict_requests),
+         _measure_time(AcquisitionRequest.to_json, slotted_requests)),
+        ('deserialization [s]',
+         _measure_time(lambda req_json: DictAcquisitionRequest(**json.loads(req_json)), dict_jsons),
+         _measure_time(AcquisitionRequest.from_json, slotted_jsons)),
+    ]
+
+    print('{} requests'.format(ENTRY_COUNT))
+    print('{:<22}{:>14}{:>14}'.format('', '__dict__', '__slots__'))
+    for name, dict_result, slotted_result in results:
+        print('{:<22}{:>14.3f}{:>14.3f}'.format(name, dict_result, slotted_result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Compares the worker making calls to a slow local stub of Downloader with fixed concurrency
+(too low and too high) and with the concurrency adapted to the calls' latency.
+The stub handles a few requests at full speed. Above that the requests share its capacity
+and it also slows down from the overload.
+The job queue and the requests store are in memory.
+
+Run from the project's root: `python -m benchmarks.adaptive_concurrency_bench`
+"""
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import threading
+import time
+
+from data_acquisition.cf_app_utils import AdaptiveConcurrencyLimiter, HttpClient
+from data_acquisition.job_queue import ServiceCall
+from data_acquisition.worker import JobWorker
+
+JOB_COUNT = 600
+STUB_CAPACITY = 8
+STUB_SERVICE_TIME = 0.02
+# the stub's slowdown per request above its capacity
+STUB_OVERLOAD_PENALTY = 0.05
+MAX_CONCURRENCY = 32
+
+
+class SlowStubHandler(BaseHTTPRequestHandler):
+    """Accepts any POST, taking longer the more requests are being handled."""
+
+    protocol_version = 'HTTP/1.1'
+    active_requests = 0
+    active_requests_lock = threading.Lock()
+
+    def do_POST(self): #pylint: disable=invalid-name
+        self.rfile.read(int(self.headers['Content-Length']))
+        with self.active_requests_lock:
+            SlowStubHandler.active_requests += 1
+            active_requests = SlowStubHandler.active_requests
+        overload = max(0, active_requests - STUB_CAPACITY)
+        time.sleep(STUB_SERVICE_TIME
+                   * max(1, active_requests / STUB_CAPACITY)
+                   * (1 + STUB_OVERLOAD_PENALTY * overload))
+        with self.active_requests_lock:
+            SlowStubHandler.active_requests -= 1
+        self.send_response(202)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args): #pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingHttpServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MemoryJobQueue:
+    """Holds the jobs in memory and stops the worker when all of them are finished."""
+
+    def __init__(self, jobs):
+        self._jobs = deque(jobs)
+        self._taken = {}
+        self._unfinished = len(jobs)
+        self._lock = threading.Lock()
+        self.worker = None
+
+    def take(self, consumer_name, timeout): #pylint: disable=unused-argument
+        with self._lock:
+            if self._jobs:
+                self._taken[consumer_name] = self._jobs.popleft()
+                return self._taken[consumer_name]
+        time.sleep(0.01)
+        return None
+
+    def finish(self, consumer_name): #pylint: disable=unused-argument
+        with self._lock:
+            self._unfinished -= 1
+            if not self._unfinished:
+                self.worker.stop()
+
+    def postpone(self, consumer_name):
+        with self._lock:
+            self._jobs.append(self._taken.pop(consumer_name))
+
+    def renew_lease(self, worker_id, ttl):
+        pass
+
+    def release_lease(self, worker_id):
+        pass
+
+    def requeue_abandoned(self):
+        return 0
+
+    def report_worker_stats(self, worker_id, worker_stats, ttl):
+        pass
+
+
+class TimedHttpClient(HttpClient):
+    """Records the latencies of the calls."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def post(self, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().post(url, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+class NullRequestStore:
+    def transition(self, req_id, new_state):
+        raise AssertionError('No call should fail, request {} is {}'.format(req_id, new_state))
+
+
+def _measure(stub_url, concurrency_limiter):
+    """
+    :return: Jobs done per second, the median and 95th percentile of the calls' latency
+        (in seconds) and the final concurrency limit.
+    :rtype: (float, float, float, int)
+    """
+    jobs = [ServiceCall(stub_url, {'source': 'http://example.com/{}'.format(index)},
+                        'bearer fake-token', str(index), 'bench-org', time.time())
+            for index in range(JOB_COUNT)]
+    job_queue = MemoryJobQueue(jobs)
+    http_client = TimedHttpClient(pool_size=MAX_CONCURRENCY)
+    worker = JobWorker(job_queue, NullRequestStore(), http_client, MAX_CONCURRENCY, 'bench',
+                       concurrency_limiters={stub_url: concurrency_limiter})
+    job_queue.worker = worker
+
+    start = time.perf_counter()
+    worker.run()
+    total_time = time.perf_counter() - start
+
+    latencies = sorted(http_client.latencies)
+    return (JOB_COUNT / total_time,
+            latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.95)],
+            worker.stats()['concurrency'][stub_url]['limit'])
+
+
+def main():
+    stub = ThreadingHttpServer(('localhost', 0), SlowStubHandler)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = 'http://localhost:{}/rest/downloader/requests'.format(stub.server_port)
+
+    results = [
+        ('fixed 4', _measure(stub_url, AdaptiveConcurrencyLimiter(4, 4))),
+        ('fixed {}'.format(MAX_CONCURRENCY),
+         _measure(stub_url, AdaptiveConcurrencyLimiter(MAX_CONCURRENCY, MAX_CONCURRENCY))),
+        ('adaptive 2-{}'.format(MAX_CONCURRENCY),
+         _measure(stub_url, AdaptiveConcurrencyLimiter(2, MAX_CONCURRENCY))),
+    ]
+    stub.shutdown()
+
+    print('{} jobs, stub handles {} requests at full speed in {} ms'.format(
+        JOB_COUNT, STUB_CAPACITY, STUB_SERVICE_TIME * 1000))
+    print('{:<16}{:>12}{:>16}{:>16}{:>12}'.format(
+        '', 'jobs/s', 'median [ms]', 'p95 [ms]', 'end limit'))
+    for name, (throughput, median, p95, limit) in results:
+        print('{:<16}{:>12.1f}{:>16.1f}{:>16.1f}{:>12}'.format(
+            name, throughput, median * 1000, p95 * 1000, limit))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compares the per-request overhead of authentication and authorization when the org checker
+parses the token again (like it used to) and when it uses the claims verified by the middleware.
+The user's organizations come from the checker's cache, so no service is called.
+
+Run from the project's root: `python -m benchmarks.auth_bench`
+"""
+
+import time
+
+from falcon import Request
+from falcon.testing.helpers import create_environ
+
+from data_acquisition.cf_app_utils.auth import UserOrgAccessChecker
+from data_acquisition.cf_app_utils.auth.falcon import JwtMiddleware, get_token_claims
+from tests.consts import RSA_2048_PUB_KEY, TEST_AUTH_HEADER, TEST_ORG_UUID
+
+REQUEST_COUNT = 10000
+
+
+class LocalOrgAccessChecker(UserOrgAccessChecker):
+    """Doesn't call User Management, the user is always in the test organization."""
+
+    def _fetch_user_orgs(self, user_token):
+        return frozenset([TEST_ORG_UUID])
+
+
+def _measure(auth_middleware, org_checker, use_claims):
+    """
+    :return: Average times (in seconds) of the whole authentication and authorization
+        and of the access check alone.
+    :rtype: (float, float)
+    """
+    requests = [Request(create_environ(headers={'Authorization': TEST_AUTH_HEADER}))
+                for _ in range(REQUEST_COUNT)]
+    check_time = 0
+    start = time.perf_counter()
+    for req in requests:
+        auth_middleware.process_resource(req, None, None, None)
+        check_start = time.perf_counter()
+        token_claims = get_token_claims(req) if use_claims else None
+        org_checker.validate_access(req.auth, [TEST_ORG_UUID], token_claims)
+        check_time += time.perf_counter() - check_start
+    total_time = time.perf_counter() - start
+    return total_time / REQUEST_COUNT, check_time / REQUEST_COUNT
+
+
+def main():
+    auth_middleware = JwtMiddleware()
+    auth_middleware._add_verification_key( #pylint: disable=protected-access
+        {'value': RSA_2048_PUB_KEY})
+    org_checker = LocalOrgAccessChecker('http://user-management', cache_size=10)
+
+    results = [
+        ('token parsed again', _measure(auth_middleware, org_checker, use_claims=False)),
+        ('verified claims reused', _measure(auth_middleware, org_checker, use_claims=True)),
+    ]
+
+    print('{} requests, average times [us]'.format(REQUEST_COUNT))
+    print('{:<26}{:>16}{:>16}'.format('', 'whole auth', 'access check'))
+    for name, (total_time, check_time) in results:
+        print('{:<26}{:>16.1f}{:>16.1f}'.format(name, total_time * 10**6, check_time * 10**6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares the Redis memory taken by requests stored as JSON (like by the older versions of the app)
+and in the compact storage format.
+Needs a Redis instance with an empty database it can use.
+
+Run from the project's root:
+`python -m benchmarks.storage_format_bench [--port 6379] [--db 15] [--count 1000000]`
+"""
+
+import argparse
+import json
+import uuid
+
+import redis
+
+from data_acquisition.acquisition_request import (AcquisitionRequest, AcquisitionRequestStore,
+                                                  encode_request)
+
+BATCH_SIZE = 10000
+
+
+def _generate_requests(count):
+    for entry_number in range(count):
+        acquisition_req = AcquisitionRequest(
+            title='Data set {}'.format(entry_number),
+            orgUUID=str(uuid.UUID(int=entry_number % 100)),
+            publicRequest=bool(entry_number % 2),
+            source='http://example.com/data-set-{}.csv'.format(entry_number),
+            category='other')
+        acquisition_req.set_validated()
+        acquisition_req.set_downloaded()
+        yield acquisition_req
+
+
+def _measure(redis_client, count, encode):
+    """
+    :return: Bytes of encoded entries and the growth of Redis memory after storing them.
+    :rtype: (int, int)
+    """
+    memory_before = redis_client.info('memory')['used_memory']
+    encoded_size = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for entry_number, acquisition_req in enumerate(_generate_requests(count), start=1):
+        entry = encode(acquisition_req)
+        encoded_size += len(entry)
+        pipe.hset(AcquisitionRequestStore.REDIS_HASH_NAME,
+                  AcquisitionRequestStore.get_request_redis_id(acquisition_req),
+                  entry)
+        if entry_number % BATCH_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+    memory_growth = redis_client.info('memory')['used_memory'] - memory_before
+    redis_client.delete(AcquisitionRequestStore.REDIS_HASH_NAME)
+    return encoded_size, memory_growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6379)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--count', type=int, default=1000000)
+    args = parser.parse_args()
+
+    redis_client = redis.Redis(host=args.host, port=args.port, db=args.db)
+    if redis_client.dbsize():
+        raise SystemExit('Redis database {} is not empty, refusing to use it.'.format(args.db))
+
+    results = [
+        ('JSON', _measure(redis_client, args.count,
+                          lambda req: json.dumps(req.to_dict()).encode())),
+        ('compact', _measure(redis_client, args.count, encode_request)),
+    ]
+
+    print('{} requests'.format(args.count))
+    print('{:<10}{:>18}{:>22}'.format('format', 'entry bytes', 'Redis memory growth'))
+    for name, (encoded_size, memory_growth) in results:
+        print('{:<10}{:>18}{:>22}'.format(name, encoded_size, memory_growth))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Measures the CPU time per request of polling the status of an acquisition request
+(GET on the request's path, always with the same token), with and without the cache
+of verified tokens in `JwtMiddleware`.
+The requests store and the user's organizations are served from memory.
+
+Run from the project's root: `python -m benchmarks.token_cache_bench`
+"""
+
+import time
+
+from falcon.testing import StartResponseMock, create_environ
+
+from data_acquisition.acquisition_request import AcquisitionRequest
+from data_acquisition.app import DasApi
+from data_acquisition.cf_app_utils.auth.falcon import JwtMiddleware
+from data_acquisition.config import DasConfig
+from data_acquisition.consts import GET_REQUEST_PATH
+from tests.consts import RSA_2048_PUB_KEY, TEST_AUTH_HEADER, TEST_ACQUISITION_REQ_JSON
+
+REQUEST_COUNT = 5000
+
+
+class MemoryRequestStore:
+    """Holds a single acquisition request."""
+
+    def __init__(self, acquisition_req):
+        self._acquisition_req = acquisition_req
+
+    def get(self, req_id): #pylint: disable=unused-argument
+        return self._acquisition_req
+
+
+def _get_app(token_cache_size):
+    acquisition_req = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+    config = DasConfig(user_management_url='http://user-management', permissions_cache_size=10)
+    auth_middleware = JwtMiddleware(token_cache_size)
+    auth_middleware._add_verification_key( #pylint: disable=protected-access
+        {'value': RSA_2048_PUB_KEY})
+    das_api = DasApi(MemoryRequestStore(acquisition_req), None, config, auth_middleware)
+    das_api.org_checker._fetch_user_orgs = ( #pylint: disable=protected-access
+        lambda user_token: frozenset([acquisition_req.orgUUID]))
+    return das_api.api, acquisition_req.id
+
+
+def _measure(token_cache_size):
+    """
+    :return: CPU time per request in seconds.
+    :rtype: float
+    """
+    app, req_id = _get_app(token_cache_size)
+    environs = [create_environ(path=GET_REQUEST_PATH.format(req_id=req_id),
+                               headers={'Authorization': TEST_AUTH_HEADER})
+                for _ in range(REQUEST_COUNT)]
+    start_response = StartResponseMock()
+    start = time.process_time()
+    for environ in environs:
+        app(environ, start_response)
+    assert start_response.status == '200 OK'
+    return (time.process_time() - start) / REQUEST_COUNT
+
+
+def main():
+    results = [
+        ('verified every time', _measure(token_cache_size=0)),
+        ('verified tokens cached', _measure(token_cache_size=10000)),
+    ]
+
+    print('{} polls with the same token'.format(REQUEST_COUNT))
+    print('{:<26}{:>20}'.format('', 'CPU us per request'))
+    for name, cpu_time in results:
+        print('{:<26}{:>20.1f}'.format(name, cpu_time * 10**6))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,27 +2,188 @@
 Things related to types of requests that come in and out of the app.
 """
 
+from enum import Enum
 import json
+import re
 import time
 import uuid
 
+import msgpack
+
 
 class RequestNotFoundError(Exception):
     """Signals that a request wasn't found in a `AcquisitionRequestStore`."""
     pass
 
 
+class RequestIdTakenError(Exception):
+    """Signals that a request with the same ID, but another organization, is already stored
+    in a `AcquisitionRequestStore`."""
+    pass
+
+
+class InvalidCursorError(Exception):
+    """Signals that a pagination cursor given to a `AcquisitionRequestStore` is malformed."""
+    pass
+
+
 class AcquisitionRequestStore:
     """Abstraction over Redis for storage and retrieval of `AcquisitionRequest` objects.
 
+    Requests are kept in a single hash under "<org UUID>:<request ID>" fields.
+    A secondary hash maps request IDs to those fields, so that a single request can be fetched
+    without knowing its organization. Requests missing from it (e.g. stored by instances running
+    an older version during a rolling deploy) are looked up in the requests hash and indexed
+    when they're fetched or transitioned. Each organization also has a set of its requests' fields,
+    so that listing an organization's requests doesn't touch the requests of other organizations.
+
+    Every change of a request is announced with its "<org UUID>:<request ID>" field
+    on a pub/sub channel, so that caches of the store can be invalidated.
+
+    Idempotency keys sent by clients with new requests map to the IDs of the requests,
+    so that retried submissions don't create duplicates.
+
     Args:
         redis_client (`redis.Redis`): Redis client.
     """
 
     REDIS_HASH_NAME = 'requests'
+    REDIS_ID_INDEX_NAME = 'requests_id_index'
+    REDIS_ORG_INDEX_PREFIX = 'requests_org_index:'
+    REDIS_INDEX_VERSION_KEY = 'requests_index_version'
+    REDIS_INVALIDATION_CHANNEL = 'requests_invalidations'
+    REDIS_IDEMPOTENCY_KEY_PREFIX = 'requests_idempotency_key:'
+    INDEX_VERSION = 2
+    INDEX_BUILD_BATCH_SIZE = 1000
+
+    # Stores the request and indexes it, unless its ID is already indexed for another field
+    # (a request of another organization). Returns 1 when the request was stored.
+    _PUT_SCRIPT = """
+        local field = redis.call('HGET', KEYS[2], ARGV[1])
+        if field and field ~= ARGV[2] then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+        redis.call('SADD', KEYS[3], ARGV[2])
+        redis.call('PUBLISH', ARGV[4], ARGV[2])
+        return 1
+    """
+    # Looks up the request's field in the ID index and gets the request in the same round trip.
+    _GET_SCRIPT = """
+        local field = redis.call('HGET', KEYS[2], ARGV[1])
+        if not field then
+            return false
+        end
+        return redis.call('HGET', KEYS[1], field)
+    """
+    # Gets all requests with fields from the index sets of the organizations (keys after the first
+    # one). HMGET is called in chunks, because Lua's unpack can't handle arbitrarily long tables.
+    _GET_FOR_ORGS_SCRIPT = """
+        local entries = {}
+        for key_index = 2, #KEYS do
+            local fields = redis.call('SMEMBERS', KEYS[key_index])
+            for chunk_start = 1, #fields, 1000 do
+                local chunk_end = math.min(chunk_start + 999, #fields)
+                local values = redis.call('HMGET', KEYS[1], unpack(fields, chunk_start, chunk_end))
+                for _, value in ipairs(values) do
+                    if value then
+                        table.insert(entries, value)
+                    end
+                end
+            end
+        end
+        return entries
+    """
+    # Scans a part of an organization's index set and gets the requests found. Returns the next
+    # scan cursor and the requests.
+    _GET_PAGE_SCRIPT = """
+        local scan_result = redis.call('SSCAN', KEYS[2], ARGV[1], 'COUNT', ARGV[2])
+        local fields = scan_result[2]
+        local entries = {}
+        if #fields > 0 then
+            entries = redis.call('HMGET', KEYS[1], unpack(fields))
+        end
+        return {scan_result[1], entries}
+    """
+    # Changes the state of a request and records the time of the transition. Returns the updated
+    # request. Done server-side, so that concurrent transitions of a request can't overwrite
+    # each other. The entry is written back in the format it was stored in (see `encode_request`).
+    _TRANSITION_SCRIPT = """
+        local field = redis.call('HGET', KEYS[2], ARGV[1])
+        if not field then
+            return false
+        end
+        local entry = redis.call('HGET', KEYS[1], field)
+        if not entry then
+            return false
+        end
+        local state_name, timestamp, state_code = ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+        if string.byte(entry, 1) == tonumber(ARGV[5]) then
+            local fields = cmsgpack.unpack(string.sub(entry, 2))
+            local timestamps = fields[8]
+            fields[6] = state_code
+            local timestamp_set = false
+            for position = 1, #timestamps, 2 do
+                if timestamps[position] == state_code then
+                    timestamps[position + 1] = timestamp
+                    timestamp_set = true
+                end
+            end
+            if not timestamp_set then
+                table.insert(timestamps, state_code)
+                table.insert(timestamps, timestamp)
+            end
+            entry = string.sub(entry, 1, 1) .. cmsgpack.pack(fields)
+        else
+            local acquisition_req = cjson.decode(entry)
+            if type(acquisition_req['timestamps']) ~= 'table' then
+                acquisition_req['timestamps'] = {}
+            end
+            acquisition_req['state'] = state_name
+            acquisition_req['timestamps'][state_name] = timestamp
+            entry = cjson.encode(acquisition_req)
+        end
+        redis.call('HSET', KEYS[1], field, entry)
+        redis.call('PUBLISH', ARGV[6], field)
+        return entry
+    """
+
+    # Claims the idempotency key for the request, if it's free. Otherwise, returns the ID
+    # of the request the key was claimed for and the request, if it's stored.
+    _CLAIM_IDEMPOTENCY_KEY_SCRIPT = """
+        local req_id = redis.call('GET', KEYS[1])
+        if not req_id then
+            redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+            return false
+        end
+        local field = redis.call('HGET', KEYS[3], req_id)
+        if field then
+            local entry = redis.call('HGET', KEYS[2], field)
+            if entry then
+                return {req_id, entry}
+            end
+        end
+        return {req_id}
+    """
+    # Frees the idempotency key, if it's still claimed for the request.
+    _RELEASE_IDEMPOTENCY_KEY_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            redis.call('DEL', KEYS[1])
+        end
+    """
 
     def __init__(self, redis_client):
         self._redis = redis_client
+        self._put_script = self._redis.register_script(self._PUT_SCRIPT)
+        self._get_script = self._redis.register_script(self._GET_SCRIPT)
+        self._get_for_orgs_script = self._redis.register_script(self._GET_FOR_ORGS_SCRIPT)
+        self._get_page_script = self._redis.register_script(self._GET_PAGE_SCRIPT)
+        self._transition_script = self._redis.register_script(self._TRANSITION_SCRIPT)
+        self._claim_idempotency_key_script = self._redis.register_script(
+            self._CLAIM_IDEMPOTENCY_KEY_SCRIPT)
+        self._release_idempotency_key_script = self._redis.register_script(
+            self._RELEASE_IDEMPOTENCY_KEY_SCRIPT)
 
     @staticmethod
     def get_request_redis_id(acquisition_req):
@@ -35,17 +196,105 @@ class AcquisitionRequestStore:
         """
         return '{}:{}'.format(acquisition_req.orgUUID, acquisition_req.id)
 
+    @classmethod
+    def get_org_index_name(cls, org_id):
+        """
+        Args:
+            org_id (str): Organization's UUID.
+
+        Returns:
+            str: Key of the set with Redis IDs of the organization's requests.
+        """
+        return cls.REDIS_ORG_INDEX_PREFIX + org_id
+
+    @classmethod
+    def get_idempotency_key_name(cls, org_id, idempotency_key):
+        """
+        Args:
+            org_id (str): Organization's UUID.
+            idempotency_key (str): Key sent by a client with a new request.
+
+        Returns:
+            str: Key holding the ID of the request the idempotency key was used for.
+                Idempotency keys are scoped to organizations.
+        """
+        return '{}{}:{}'.format(cls.REDIS_IDEMPOTENCY_KEY_PREFIX, org_id, idempotency_key)
+
+    def claim_idempotency_key(self, org_id, idempotency_key, req_id, ttl):
+        """Claims the idempotency key for a new request, unless it was claimed before.
+        Takes a single round trip to Redis, also when the key was used.
+
+        Args:
+            org_id (str): UUID of the request's organization.
+            idempotency_key (str): Key sent by the client with the request.
+            req_id (str): ID of the new request.
+            ttl (int): Seconds after which the key can be used again.
+
+        Returns:
+            (str, `AcquisitionRequest`): None if the key was claimed for the new request.
+                Otherwise, the ID of the request the key was used for and the request, which
+                is None if it isn't stored (it's being submitted or it was deleted).
+        """
+        result = self._claim_idempotency_key_script(
+            keys=[self.get_idempotency_key_name(org_id, idempotency_key),
+                  self.REDIS_HASH_NAME, self.REDIS_ID_INDEX_NAME],
+            args=[req_id, ttl])
+        if result is None:
+            return None
+        original_req_id = result[0].decode()
+        if len(result) == 1:
+            return original_req_id, None
+        return original_req_id, decode_request(result[1])
+
+    def release_idempotency_key(self, org_id, idempotency_key, req_id):
+        """Frees the idempotency key claimed for a request that wasn't submitted after all,
+        so that the submission can be retried with it.
+
+        Args:
+            org_id (str): UUID of the request's organization.
+            idempotency_key (str): Key sent by the client with the request.
+            req_id (str): ID of the request the key was claimed for.
+        """
+        self._release_idempotency_key_script(
+            keys=[self.get_idempotency_key_name(org_id, idempotency_key)],
+            args=[req_id])
+
+    def build_index(self):
+        """Adds requests stored before the current index version to the indexes.
+        Needs to be called before the store is used. Does nothing if the indexes are up to date.
+        """
+        if self._redis.get(self.REDIS_INDEX_VERSION_KEY) == str(self.INDEX_VERSION).encode():
+            return
+
+        pipe = self._redis.pipeline(transaction=False)
+        fields = self._redis.hscan_iter(self.REDIS_HASH_NAME, count=self.INDEX_BUILD_BATCH_SIZE)
+        for entry_number, (field, _) in enumerate(fields, start=1):
+            org_id, req_id = field.decode().split(':', 1)
+            pipe.hset(self.REDIS_ID_INDEX_NAME, req_id, field)
+            pipe.sadd(self.get_org_index_name(org_id), field)
+            if entry_number % self.INDEX_BUILD_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.set(self.REDIS_INDEX_VERSION_KEY, self.INDEX_VERSION)
+        pipe.execute()
+
     def put(self, acquisition_req):
-        """Put an acquisition request in the store (Redis).
+        """Put an acquisition request in the store (Redis). Takes a single round trip to Redis.
 
         Args:
             acquisition_req (`AcquisitionRequest`): A request that will be put in store.
+
+        Raises:
+            `RequestIdTakenError`: A request of another organization has the same ID.
         """
-        self._redis.hset(
-            self.REDIS_HASH_NAME,
-            self.get_request_redis_id(acquisition_req),
-            str(acquisition_req)
-        )
+        request_redis_id = self.get_request_redis_id(acquisition_req)
+        stored = self._put_script(
+            keys=[self.REDIS_HASH_NAME, self.REDIS_ID_INDEX_NAME,
+                  self.get_org_index_name(acquisition_req.orgUUID)],
+            args=[acquisition_req.id, request_redis_id, encode_request(acquisition_req),
+                  self.REDIS_INVALIDATION_CHANNEL])
+        if not stored:
+            raise RequestIdTakenError('ID {} is taken by another request'.format(
+                acquisition_req.id))
 
     def get(self, req_id):
         """Get an acquisition request in the store (Redis).
@@ -59,13 +308,62 @@ class AcquisitionRequestStore:
         Raises:
             `RequestNotFoundError`: Request with the given ID doesn't exist.
         """
-        entries = self._redis.hgetall(self.REDIS_HASH_NAME)
-        try:
-            entry = next(value for key, value in entries.items() if key.endswith(req_id.encode()))
-        except StopIteration:
+        keys = [self.REDIS_HASH_NAME, self.REDIS_ID_INDEX_NAME]
+        entry = self._get_script(keys=keys, args=[req_id])
+        if entry is None and self._index_unindexed_request(req_id):
+            entry = self._get_script(keys=keys, args=[req_id])
+        if entry is None:
             raise RequestNotFoundError('No request for ID {}'.format(req_id))
-        req_json = json.loads(entry.decode())
-        return AcquisitionRequest(**req_json)
+        return decode_request(entry)
+
+    def _index_unindexed_request(self, req_id):
+        """Looks for a request missing from the ID index in the requests hash and adds it
+        to the indexes. Scans the whole hash, so it's only done after the index lookup fails.
+
+        Args:
+            req_id (str): Identifier of the individual request.
+
+        Returns:
+            bool: True if the request was found.
+        """
+        fields = self._redis.hscan_iter(self.REDIS_HASH_NAME,
+                                        match='*:' + _escape_glob(req_id),
+                                        count=self.INDEX_BUILD_BATCH_SIZE)
+        for field, _ in fields:
+            org_id, field_req_id = field.decode().split(':', 1)
+            if field_req_id != req_id:
+                continue
+            pipe = self._redis.pipeline()
+            pipe.hsetnx(self.REDIS_ID_INDEX_NAME, req_id, field)
+            pipe.sadd(self.get_org_index_name(org_id), field)
+            pipe.execute()
+            return True
+        return False
+
+    def transition(self, req_id, new_state):
+        """Atomically changes the state of a stored request and adds the timestamp of the state
+        transition. Takes a single round trip to Redis.
+
+        Args:
+            req_id (str): Identifier of the individual request.
+            new_state (`RequestState`): The new state.
+
+        Returns:
+            `AcquisitionRequest`: The request after the transition.
+
+        Raises:
+            `RequestNotFoundError`: Request with the given ID doesn't exist.
+        """
+        new_state = RequestState(new_state)
+        keys = [self.REDIS_HASH_NAME, self.REDIS_ID_INDEX_NAME]
+        args = [req_id, new_state.value, int(time.time()),
+                STATE_CODES[new_state], COMPACT_FORMAT_V1, self.REDIS_INVALIDATION_CHANNEL]
+        entry = self._transition_script(keys=keys, args=args)
+        if entry is None and self._index_unindexed_request(req_id):
+            entry = self._transition_script(keys=keys, args=args)
+        if entry is None:
+            raise RequestNotFoundError('No request for ID {}'.format(req_id))
+        return decode_request(entry)
 
     def delete(self, acquisition_req):
         """Delete an acquisition request from the store (Redis).
@@ -74,9 +372,13 @@ class AcquisitionRequestStore:
             acquisition_req (`AcquisitionRequest`): Request with the same ID will be deleted
                 from the store.
         """
-        self._redis.hdel(
-            self.REDIS_HASH_NAME,
-            self.get_request_redis_id(acquisition_req))
+        request_redis_id = self.get_request_redis_id(acquisition_req)
+        pipe = self._redis.pipeline()
+        pipe.hdel(self.REDIS_HASH_NAME, request_redis_id)
+        pipe.hdel(self.REDIS_ID_INDEX_NAME, acquisition_req.id)
+        pipe.srem(self.get_org_index_name(acquisition_req.orgUUID), request_redis_id)
+        pipe.publish(self.REDIS_INVALIDATION_CHANNEL, request_redis_id)
+        pipe.execute()
 
     def get_for_org(self, org_id):
         """
@@ -86,29 +388,163 @@ class AcquisitionRequestStore:
         Returns:
             list[`AcquisitionRequest`]: All requests for the given organization.
         """
-        entries = self._redis.hgetall(self.REDIS_HASH_NAME)
-        filtered = (value.decode() for key, value in entries.items()
-                    if key.startswith(org_id.encode()))
-        return [AcquisitionRequest(**json.loads(req_str)) for req_str in filtered]
+        return self.get_for_orgs([org_id])
+
+    def get_for_orgs(self, org_ids):
+        """Gets the requests of multiple organizations in a single round trip to Redis.
+
+        Args:
+            org_ids (list[str]): Organizations' UUIDs.
+
+        Returns:
+            list[`AcquisitionRequest`]: All requests for the given organizations,
+                grouped by organization in the order of `org_ids`.
+        """
+        if not org_ids:
+            return []
+        org_index_names = [self.get_org_index_name(org_id) for org_id in org_ids]
+        entries = self._get_for_orgs_script(keys=[self.REDIS_HASH_NAME] + org_index_names)
+        return [decode_request(entry) for entry in entries]
+
+    def get_page_for_orgs(self, org_ids, cursor=None, limit=100):
+        """Gets a page of the requests of the given organizations.
+        The organizations' indexes are read incrementally (with SSCAN), so a page costs a round trip
+        per organization it spans, no matter how many requests the organizations have.
+
+        Because of how SSCAN works, `limit` is a hint. A page can have slightly more entries,
+        or fewer, even if it's not the last one. Also, a request can be returned more than once
+        if the organization's requests are changed while paging.
+
+        Args:
+            org_ids (list[str]): Organizations' UUIDs.
+            cursor (str): Cursor returned with the previous page. None gets the first page.
+            limit (int): Approximate number of requests on the page.
+
+        Returns:
+            (list[`AcquisitionRequest`], str): Requests on the page and the cursor of the next
+                page. The cursor is None if there are no more pages.
+
+        Raises:
+            `InvalidCursorError`: The cursor is malformed.
+        """
+        org_position, scan_cursor = self._parse_cursor(cursor, len(org_ids))
+        page = []
+        while org_position < len(org_ids) and len(page) < limit:
+            scan_cursor, entries = self._get_page_script(
+                keys=[self.REDIS_HASH_NAME, self.get_org_index_name(org_ids[org_position])],
+                args=[scan_cursor, limit - len(page)])
+            page.extend(decode_request(entry)
+                        for entry in entries if entry)
+            scan_cursor = int(scan_cursor)
+            if scan_cursor == 0:
+                org_position += 1
+
+        if org_position >= len(org_ids):
+            return page, None
+        return page, '{}-{}'.format(org_position, scan_cursor)
+
+    @staticmethod
+    def _parse_cursor(cursor, org_count):
+        """
+        Args:
+            cursor (str): Cursor returned by `get_page_for_orgs` or None.
+            org_count (int): Number of organizations being paged through.
 
-    # TODO get all (for admin only)
+        Returns:
+            (int, int): Position of the organization in the list and the SSCAN cursor for
+                its index.
 
+        Raises:
+            `InvalidCursorError`: The cursor is malformed.
+        """
+        if cursor is None:
+            return 0, 0
+        try:
+            org_position, scan_cursor = (int(part) for part in cursor.split('-'))
+        except ValueError as ex:
+            raise InvalidCursorError('Malformed cursor: {}'.format(cursor)) from ex
+        if not 0 <= org_position < org_count or scan_cursor < 0:
+            raise InvalidCursorError('Cursor out of range: {}'.format(cursor))
+        return org_position, scan_cursor
 
-class AcquisitionRequest: #pylint: disable=too-many-instance-attributes
+    def iter_all(self, batch_size=1000):
+        """Iterates over all stored requests. The requests are read from Redis incrementally
+        (with HSCAN), so only a single batch of them is held in memory at a time.
+
+        A request can be returned more than once if the store is changed during the iteration.
+
+        Args:
+            batch_size (int): Approximate number of requests read from Redis at once.
+
+        Returns:
+            Iterator[`AcquisitionRequest`]: All requests in the store.
+        """
+        entries = self._redis.hscan_iter(self.REDIS_HASH_NAME, count=batch_size)
+        return (decode_request(entry) for _, entry in entries)
+
+
+class RequestState(str, Enum):
+    """States of an `AcquisitionRequest`.
+    Members compare equal to the plain strings used in the requests' JSON.
+    """
+    NEW = 'NEW'
+    VALIDATED = 'VALIDATED'
+    DOWNLOADED = 'DOWNLOADED'
+    FINISHED = 'FINISHED'
+    ERROR = 'ERROR'
+
+
+# Codes used for states in the compact storage format. Mustn't change, or stored requests will be
+# read wrong. New states can be appended.
+STATE_CODES = {
+    RequestState.NEW: 0,
+    RequestState.VALIDATED: 1,
+    RequestState.DOWNLOADED: 2,
+    RequestState.FINISHED: 3,
+    RequestState.ERROR: 4,
+}
+_STATES_BY_CODE = {code: state for state, code in STATE_CODES.items()}
+_STATE_CODES_BY_NAME = {state.value: code for state, code in STATE_CODES.items()}
+_STATES_BY_NAME = {state.value: state for state in RequestState}
+
+COMPACT_FORMAT_V1 = 1
+
+
+def _get_state(name):
+    """
+    Faster version of `RequestState(name)`.
+    :param str name: Name of one of `RequestState` members.
+    :rtype: `RequestState`
+    :raises ValueError: There's no state with the given name.
+    """
+    try:
+        return _STATES_BY_NAME[name]
+    except KeyError:
+        raise ValueError('{} is not a valid RequestState'.format(name)) from None
+
+
+class AcquisitionRequest:
 
     """
     Data set download request.
     """
 
+    __slots__ = ('orgUUID', 'publicRequest', 'source', 'category', 'title', '_state', 'id',
+                 'timestamps')
+
+    _JSON_TEMPLATE = ('{{"orgUUID":{},"publicRequest":{},"source":{},"category":{},"title":{},'
+                      '"state":"{}","id":{},"timestamps":{}}}')
+    _encode_str = staticmethod(json.encoder.encode_basestring_ascii)
+
     def __init__(self, title, orgUUID, publicRequest, source, category, #pylint: disable=too-many-arguments
-                 state='NEW', id=None, timestamps=None, **_): #pylint: disable=redefined-builtin
+                 state=RequestState.NEW, id=None, timestamps=None, **_): #pylint: disable=redefined-builtin
         """
         :param str title:
         :param str orgUUID:
         :param bool publicRequest:
         :param str source:
         :param str category:
-        :param str state:
+        :param str state: Name of one of `RequestState` members.
         :param str id:
         :param dict timestamps:
         :param __: Ignored keyword arguments. Eases deserialization with unknown fields.
@@ -128,14 +564,93 @@ class AcquisitionRequest: #pylint: disable=too-many-instance-attributes
         else:
             self.timestamps = dict(timestamps)
 
+    @classmethod
+    def from_dict(cls, req_dict):
+        """
+        Creates the request from its deserialized JSON, skipping the argument handling
+        of the constructor.
+        :param dict req_dict: The request's fields. Unknown ones are ignored.
+        :rtype: `AcquisitionRequest`
+        """
+        acquisition_req = cls.__new__(cls)
+        acquisition_req.orgUUID = req_dict['orgUUID']
+        acquisition_req.publicRequest = req_dict['publicRequest']
+        acquisition_req.source = req_dict['source']
+        acquisition_req.category = req_dict['category']
+        acquisition_req.title = req_dict['title']
+        acquisition_req._state = _get_state(req_dict.get('state', 'NEW')) #pylint: disable=protected-access
+        acquisition_req.id = req_dict.get('id') or str(uuid.uuid4())
+        acquisition_req.timestamps = dict(req_dict.get('timestamps') or {})
+        return acquisition_req
+
+    @classmethod
+    def from_json(cls, req_json):
+        """
+        :param str|bytes req_json: The request serialized with `to_json`.
+        :rtype: `AcquisitionRequest`
+        """
+        if isinstance(req_json, bytes):
+            req_json = req_json.decode()
+        return cls.from_dict(json.loads(req_json))
+
+    @property
+    def state(self):
+        """
+        :rtype: `RequestState`
+        """
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        """
+        :param str state: Name of one of `RequestState` members.
+        """
+        self._state = _get_state(state)
+
+    def to_dict(self):
+        """
+        :return: The request's fields, ready for JSON serialization.
+        :rtype: dict
+        """
+        return {
+            'orgUUID': self.orgUUID,
+            'publicRequest': self.publicRequest,
+            'source': self.source,
+            'category': self.category,
+            'title': self.title,
+            'state': self.state.value,
+            'id': self.id,
+            'timestamps': self.timestamps,
+        }
+
+    def to_json(self):
+        """
+        Serializes the request without building an intermediate dictionary.
+        :return: The request serialized as JSON.
+        :rtype: str
+        """
+        encode_str = self._encode_str
+        return self._JSON_TEMPLATE.format(
+            encode_str(self.orgUUID),
+            'true' if self.publicRequest else 'false',
+            encode_str(self.source),
+            encode_str(self.category),
+            encode_str(self.title),
+            self._state.value,
+            encode_str(self.id),
+            '{' + ','.join([encode_str(state) + ':' + _encode_timestamp(timestamp)
+                            for state, timestamp in self.timestamps.items()]) + '}')
+
     def __str__(self):
-        return json.dumps(self.__dict__)
+        return self.to_json()
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        if not isinstance(other, AcquisitionRequest):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
 
     def __repr__(self):
-        return '{}({})'.format(type(self), repr(self.__dict__))
+        return '{}({})'.format(type(self), repr(self.to_dict()))
 
     def __hash__(self):
         return hash(self.id)
@@ -144,31 +659,125 @@ class AcquisitionRequest: #pylint: disable=too-many-instance-attributes
         """
         Sets the state of the object to validated.
         """
-        self._set_state('VALIDATED')
+        self._set_state(RequestState.VALIDATED)
 
     def set_downloaded(self):
         """
         Sets the state of the object to downloaded.
         """
-        self._set_state('DOWNLOADED')
+        self._set_state(RequestState.DOWNLOADED)
 
     def set_finished(self):
         """
         Sets the state of the object to finished.
         """
-        self._set_state('FINISHED')
+        self._set_state(RequestState.FINISHED)
 
     def set_error(self):
         """
         Sets the state of the object to "error" after a failure.
         """
-        self._set_state('ERROR')
+        self._set_state(RequestState.ERROR)
 
     def _set_state(self, state):
         """
         Sets the state of the object and adds the timestamp of state transition.
-        :param str state: Name of the new state.
+        :param `RequestState` state: The new state.
         :rtype: None
         """
         self.state = state
-        self.timestamps[state] = int(time.time())
+        self.timestamps[state.value] = int(time.time())
+
+
+def _escape_glob(text):
+    """
+    :param str text: Text to be matched literally by a Redis glob-style pattern.
+    :return: The text with the pattern's special characters escaped.
+    :rtype: str
+    """
+    return re.sub(r'([*?\[\]\\])', r'\\\1', text)
+
+
+def _encode_timestamp(timestamp):
+    """
+    :param int timestamp: UNIX time of a state transition.
+    :return: The timestamp serialized as JSON. Values that aren't plain integers
+        (e.g. booleans passing validation as integers) go through `json.dumps`.
+    :rtype: str
+    """
+    if type(timestamp) is int: #pylint: disable=unidiomatic-typecheck
+        return str(timestamp)
+    return json.dumps(timestamp)
+
+
+def encode_request(acquisition_req):
+    """Encodes a request in the compact storage format.
+    That's a format byte (`COMPACT_FORMAT_V1`) followed by a MessagePack array of the request's
+    fields in a fixed order, with the state replaced by its code from `STATE_CODES`
+    and the timestamps flattened to a [state code, timestamp, ...] array. Timestamps of unknown
+    states (e.g. from old entries) keep the state's name instead of a code.
+
+    Args:
+        acquisition_req (`AcquisitionRequest`): The request to encode.
+
+    Returns:
+        bytes: The encoded request.
+    """
+    timestamps = []
+    for state_name, timestamp in acquisition_req.timestamps.items():
+        timestamps.append(_STATE_CODES_BY_NAME.get(state_name, state_name))
+        timestamps.append(timestamp)
+    fields = [
+        acquisition_req.orgUUID,
+        acquisition_req.publicRequest,
+        acquisition_req.source,
+        acquisition_req.category,
+        acquisition_req.title,
+        STATE_CODES[acquisition_req.state],
+        acquisition_req.id,
+        timestamps,
+    ]
+    return bytes((COMPACT_FORMAT_V1,)) + msgpack.packb(fields, use_bin_type=False)
+
+
+def _decode_timestamp_state(state):
+    """
+    :param int|str state: Code of a timestamp's state or the name of an unknown state.
+    :return: Name of the state.
+    :rtype: str
+    """
+    if isinstance(state, int):
+        return _STATES_BY_CODE[state].value
+    return state
+
+
+def decode_request(entry):
+    """Decodes a request stored either in the compact format (see `encode_request`) or as JSON,
+    like the requests stored by older versions of the app.
+
+    Args:
+        entry (bytes): The stored request.
+
+    Returns:
+        `AcquisitionRequest`: The decoded request.
+
+    Raises:
+        ValueError: The entry is in an unknown format.
+    """
+    if entry[0] == COMPACT_FORMAT_V1:
+        org_id, public_request, source, category, title, state_code, req_id, timestamps = \
+            msgpack.unpackb(entry[1:], encoding='utf-8')
+        return AcquisitionRequest.from_dict({
+            'orgUUID': org_id,
+            'publicRequest': public_request,
+            'source': source,
+            'category': category,
+            'title': title,
+            'state': _STATES_BY_CODE[state_code],
+            'id': req_id,
+            'timestamps': {_decode_timestamp_state(timestamps[position]): timestamps[position + 1]
+                           for position in range(0, len(timestamps), 2)},
+        })
+    elif entry.startswith(b'{'):
+        return AcquisitionRequest.from_json(entry)
+    raise ValueError('Unknown format of stored request: {}'.format(entry[:1]))
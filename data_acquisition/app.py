@@ -3,20 +3,25 @@ Application for downloading data sets from the web.
 This file is used to create the WSGI app that can be embedded in a container.
 """
 
-from concurrent.futures import ThreadPoolExecutor
 import logging
 
 import falcon
 import redis
 
-from .cf_app_utils.auth.falcon import JwtMiddleware
-from .cf_app_utils import configure_logging
+from .cf_app_utils.auth.falcon import JwtMiddleware, FalconUserOrgAccessChecker
+from .cf_app_utils import configure_logging, CircuitBreaker, HttpClient
 from .config import DasConfig
 from .consts import (ACQUISITION_PATH, DOWNLOAD_CALLBACK_PATH, UPLOADER_REQUEST_PATH,
-                     METADATA_PARSER_CALLBACK_PATH, GET_REQUEST_PATH)
+                     METADATA_PARSER_CALLBACK_PATH, GET_REQUEST_PATH, ADMIN_REQUESTS_PATH,
+                     STATS_PATH)
 from .acquisition_request import AcquisitionRequestStore
-from .resources import (AcquisitionResource, RequestManagementResource,
-                        DownloadCallbackResource, UploaderResource, MetadataCallbackResource)
+from .download_coalescer import DownloadCoalescer
+from .source_cache import AcquiredSourceCache
+from .job_queue import RedisJobQueue
+from .request_cache import CachedAcquisitionRequestStore
+from .resources import (AcquisitionResource, RequestManagementResource, AdminRequestsResource,
+                        StatsResource, DownloadCallbackResource, UploaderResource,
+                        MetadataCallbackResource)
 
 
 class DasApi:
@@ -25,20 +30,56 @@ class DasApi:
 
     Args:
         requests_store (`data_acquisition.acquisition_request.AcquisitionRequestStore`):
-        executor (`concurrent.futures.Executor`): Object that will run background jobs for the
-            application.
+        job_queue (`data_acquisition.job_queue.RedisJobQueue`): Queue of calls to other services,
+            which are made by the workers.
         config (`data_acquisition.DasConfig`): Configuration object for the application.
         middleware: An object conforming to Falcon middleware specifications.
+        stats_sources (dict): Names of the app's components mapped to the components, which have
+            a `stats` method. Their statistics will be exposed through the API.
+        redis_client (`redis.Redis`): Client of the Redis in which the cache of users' permissions
+            can be shared with other processes.
+        http_client (`data_acquisition.cf_app_utils.HttpClient`): Client for calls to User
+            Management.
+        download_coalescer (`data_acquisition.download_coalescer.DownloadCoalescer`): Makes
+            concurrent acquisitions of the same source share a download.
+        source_cache (`data_acquisition.source_cache.AcquiredSourceCache`): Cache of recently
+            downloaded sources, which aren't downloaded again.
     """
 
-    def __init__(self, requests_store, executor, config, middleware=None):
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            requests_store,
+            job_queue,
+            config,
+            middleware=None,
+            stats_sources=None,
+            redis_client=None,
+            http_client=None,
+            download_coalescer=None,
+            source_cache=None):
         self.middleware = middleware
-
-        self.acquisition_res = AcquisitionResource(requests_store, executor, config)
-        self.request_management_res = RequestManagementResource(requests_store, config)
-        self.download_callback_res = DownloadCallbackResource(requests_store, executor, config)
+        self.org_checker = FalconUserOrgAccessChecker(
+            config.user_management_url,
+            config.permissions_cache_size,
+            config.permissions_cache_ttl,
+            redis_client if config.permissions_shared_cache_ttl else None,
+            config.permissions_shared_cache_ttl,
+            http_client,
+            CircuitBreaker(config.circuit_breaker_failure_threshold,
+                           config.circuit_breaker_reset_timeout))
+        stats_sources = dict(stats_sources or {}, permissions=self.org_checker)
+
+        self.acquisition_res = AcquisitionResource(requests_store, job_queue, config,
+                                                   self.org_checker, download_coalescer,
+                                                   source_cache)
+        self.request_management_res = RequestManagementResource(requests_store, config,
+                                                                self.org_checker)
+        self.admin_requests_res = AdminRequestsResource(requests_store, config, self.org_checker)
+        self.stats_res = StatsResource(stats_sources, config, self.org_checker)
+        self.download_callback_res = DownloadCallbackResource(requests_store, job_queue, config,
+                                                              download_coalescer, source_cache)
         self.metadata_callback_res = MetadataCallbackResource(requests_store, config)
-        self.uploader_res = UploaderResource(requests_store, executor, config)
+        self.uploader_res = UploaderResource(requests_store, job_queue, config)
 
         api = falcon.API(middleware=self.middleware)
         self._add_routes(api)
@@ -47,6 +88,8 @@ class DasApi:
     def _add_routes(self, api):
         api.add_route(ACQUISITION_PATH, self.acquisition_res)
         api.add_route(GET_REQUEST_PATH, self.request_management_res)
+        api.add_route(ADMIN_REQUESTS_PATH, self.admin_requests_res)
+        api.add_route(STATS_PATH, self.stats_res)
         api.add_route(DOWNLOAD_CALLBACK_PATH, self.download_callback_res)
         api.add_route(METADATA_PARSER_CALLBACK_PATH, self.metadata_callback_res)
         api.add_route(UPLOADER_REQUEST_PATH, self.uploader_res)
@@ -61,10 +104,36 @@ def get_app():
                                password=config.redis_password, db=0)
     assert redis_client.ping()
 
-    requests_store = AcquisitionRequestStore(redis_client)
-    executor = ThreadPoolExecutor(4)
-
-    auth_middleware = JwtMiddleware()
-    auth_middleware.initialize(config.verification_key_url)
-
-    return DasApi(requests_store, executor, config, auth_middleware).api
+    stats_sources = {}
+    if config.requests_cache_size:
+        requests_store = CachedAcquisitionRequestStore(
+            redis_client, config.requests_cache_size, config.requests_cache_ttl)
+        requests_store.start_invalidation_listener()
+        stats_sources['requests_cache'] = requests_store
+    else:
+        requests_store = AcquisitionRequestStore(redis_client)
+    requests_store.build_index()
+    job_queue = RedisJobQueue(redis_client, config.job_queue_size)
+    stats_sources['job_queue'] = job_queue
+    download_coalescer = None
+    if config.download_coalescing_ttl:
+        download_coalescer = DownloadCoalescer(redis_client, config.download_coalescing_ttl)
+        stats_sources['download_coalescer'] = download_coalescer
+    source_cache = None
+    if config.acquired_sources_cache_size:
+        source_cache = AcquiredSourceCache(redis_client, config.acquired_sources_cache_size,
+                                           config.acquired_sources_cache_ttl)
+        stats_sources['acquired_sources_cache'] = source_cache
+    http_client = HttpClient(config.http_pool_size,
+                             connect_timeout=config.http_connect_timeout,
+                             read_timeout=config.http_read_timeout)
+    stats_sources['http_client'] = http_client
+
+    auth_middleware = JwtMiddleware(config.token_cache_size, http_client)
+    auth_middleware.initialize(config.verification_key_url,
+                               config.verification_key_refresh_interval)
+    if config.token_cache_size:
+        stats_sources['token_cache'] = auth_middleware
+
+    return DasApi(requests_store, job_queue, config, auth_middleware, stats_sources,
+                  redis_client, http_client, download_coalescer, source_cache).api
@@ -2,4 +2,10 @@
 This will be an independent library with stuff useful for other Cloud Foundry microservices.
 """
 
+from .cache import LruCache
+from .circuit_breaker import CircuitBreaker
+from .concurrency import AdaptiveConcurrencyLimiter
+from .http_client import HttpClient
 from .logs import configure_logging
+from .retry import RetryPolicy
+from .single_flight import SingleFlight
@@ -4,4 +4,4 @@ Authorization utilities for microservices using JWT tokens.
 
 from .org_check import (UserOrgAccessChecker, NoOrgAccessError, PermissionServiceError,
                         USER_MANAGEMENT_PATH)
-from .utils import get_uaa_key, UaaError
+from .utils import get_uaa_key, get_uaa_key_info, UaaError
@@ -2,35 +2,82 @@
 Authorization/authentication components for Falcon apps.
 """
 
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
 import logging
+import threading
+import time
 
 import jwt
 import falcon
 
-from . import get_uaa_key, UserOrgAccessChecker, NoOrgAccessError, PermissionServiceError
+from . import get_uaa_key_info, UserOrgAccessChecker, NoOrgAccessError, PermissionServiceError
+from ..cache import LruCache
+
+TOKEN_CLAIMS_CONTEXT_KEY = 'token_claims'
+
+
+def get_token_claims(req):
+    """
+    :param `falcon.Request` req:
+    :return: Claims of the request's token verified by `JwtMiddleware` (None if it wasn't).
+    :rtype: dict
+    """
+    return req.context.get(TOKEN_CLAIMS_CONTEXT_KEY)
 
 
 class JwtMiddleware:
 
     """
     JWT middleware for Falcon.
+    Puts the claims of a verified token in the request's context
+    (see `get_token_claims`), so that they don't need to be decoded again.
+    Can cache the claims of verified tokens until the tokens expire, so that requests
+    repeating a token don't need its signature verified again. Tokens without an expiration
+    ("exp" claim) aren't cached, as nothing would ever make their entries invalid.
+    The cached claims are shared by the requests, so they mustn't be modified.
+
+    UAA's keys can be refreshed in the background. The current and the previous key are kept,
+    and a token is verified with the one matching its "kid" header. A token with an unknown "kid"
+    makes the refresh happen sooner, but requests never wait for it.
     """
 
     # TODO should be more complex, see https://tools.ietf.org/html/rfc6750#section-3
     AUTH_CHALLENGE = 'Bearer'
+    KEPT_KEYS_COUNT = 2
+    MIN_KEY_REFRESH_INTERVAL = 10.0
 
-    def __init__(self):
-        self._verification_key = None
+    def __init__(self, cache_size=0, http_client=None):
+        """
+        :param int cache_size: Maximum number of verified tokens to cache. 0 disables the cache.
+        :param `cf_app_utils.HttpClient` http_client: Client used to call UAA.
+            If not given, a new connection is made without a timeout.
+        """
+        self._http_client = http_client
+        # key ID (None if UAA doesn't give it) -> key, oldest first;
+        # replaced as a whole on change, so that it can be read without locking
+        self._verification_keys = OrderedDict()
+        self._key_refresh_requested = threading.Event()
+        self._verified_tokens_cache = LruCache(cache_size) if cache_size else None
         self._log = logging.getLogger(type(self).__name__)
 
-    def initialize(self, uaa_key_url):
+    def initialize(self, uaa_key_url, key_refresh_interval=None):
         """
         Prepares the middleware object for work. Needs to be called before any requests to the app.
         Actually downloads the public key that will be used to verify JWT signature.
         :param str uaa_key_url: URL under which the public key to verify a token can be found.
+        :param float key_refresh_interval: Number of seconds between refreshes of the key done
+            by a background thread. None disables the refreshing.
         :raises `UaaError`: when getting the key fails
         """
-        self._verification_key = get_uaa_key(uaa_key_url)
+        self._add_verification_key(get_uaa_key_info(uaa_key_url, self._http_client))
+        if key_refresh_interval:
+            refresher = threading.Thread(target=self._refresh_keys,
+                                         args=(uaa_key_url, key_refresh_interval),
+                                         name='uaa-key-refresh',
+                                         daemon=True)
+            refresher.start()
 
     def process_request(self, req, resp):
         """
@@ -50,18 +97,91 @@ class JwtMiddleware:
             raise falcon.HTTPUnauthorized('Bad Authorization header', err_msg, self.AUTH_CHALLENGE)
 
         token = req.auth.split()[1] # skip 'bearer'
+        if self._verified_tokens_cache is None:
+            req.context[TOKEN_CLAIMS_CONTEXT_KEY] = self._verify_token(token)
+            return
+
+        token_digest = hashlib.sha256(token.encode()).digest()
+        token_claims = self._verified_tokens_cache.get(token_digest)
+        if token_claims is None:
+            token_claims = self._verify_token(token)
+            if 'exp' in token_claims:
+                self._verified_tokens_cache.put(token_digest, token_claims, token_claims['exp'])
+        req.context[TOKEN_CLAIMS_CONTEXT_KEY] = token_claims
+
+    def process_response(self, req, resp, resource):
+        """
+        Doesn't do anything. Part of Falcon middleware interface.
+        """
+        pass
+
+    def stats(self):
+        """
+        :return: Statistics of the cache of verified tokens (empty if it's disabled).
+        :rtype: dict
+        """
+        return self._verified_tokens_cache.stats() if self._verified_tokens_cache else {}
+
+    def _verify_token(self, token):
+        """
+        :param str token: JWT token (without "bearer" prefix).
+        :return: Claims of the token.
+        :rtype: dict
+        :raises `falcon.HTTPUnauthorized`: When the token is invalid.
+        """
         try:
-            jwt.decode(token, key=self._verification_key, options={'verify_aud': False})
+            key_id = jwt.get_unverified_header(token).get('kid')
+            verification_keys = self._verification_keys
+            if key_id in verification_keys:
+                candidate_keys = [verification_keys[key_id]]
+            else:
+                if key_id is not None:
+                    self._key_refresh_requested.set()
+                candidate_keys = list(reversed(verification_keys.values()))
+
+            for key in candidate_keys[:-1]:
+                try:
+                    return jwt.decode(token, key=key, options={'verify_aud': False})
+                except jwt.exceptions.DecodeError:
+                    continue
+            return jwt.decode(token, key=candidate_keys[-1], options={'verify_aud': False})
         except Exception as ex:
             err_msg = 'Verification of the JWT token has failed.'
             self._log.exception(err_msg)
             raise falcon.HTTPUnauthorized('Invalid token', err_msg, self.AUTH_CHALLENGE) from ex
 
-    def process_response(self, req, resp, resource):
+    def _add_verification_key(self, key_info):
         """
-        Doesn't do anything. Part of Falcon middleware interface.
+        Makes the key the current one. Only the previous key is kept besides it.
+        :param dict key_info: UAA's key with its ID, see `get_uaa_key_info`.
         """
-        pass
+        key_id = key_info.get('kid')
+        verification_keys = OrderedDict(self._verification_keys)
+        if verification_keys.get(key_id) == key_info['value']:
+            return
+        verification_keys.pop(key_id, None)
+        verification_keys[key_id] = key_info['value']
+        while len(verification_keys) > self.KEPT_KEYS_COUNT:
+            verification_keys.popitem(last=False)
+        self._verification_keys = verification_keys
+        self._log.info('Using a new UAA key, ID: %s', key_id)
+
+    def _refresh_keys(self, uaa_key_url, key_refresh_interval):
+        """
+        Periodically gets the current key from UAA. Runs in a separate thread.
+        Refreshes sooner when requested (by a token with an unknown key ID), but not more often
+        than every `MIN_KEY_REFRESH_INTERVAL` seconds.
+        :param str uaa_key_url: URL under which the public key to verify a token can be found.
+        :param float key_refresh_interval: Number of seconds between refreshes.
+        """
+        while True:
+            self._key_refresh_requested.wait(key_refresh_interval)
+            self._key_refresh_requested.clear()
+            try:
+                self._add_verification_key(get_uaa_key_info(uaa_key_url, self._http_client))
+            except Exception: #pylint: disable=broad-except
+                self._log.exception('Refreshing the UAA key has failed.')
+            time.sleep(self.MIN_KEY_REFRESH_INTERVAL)
 
 
 class FalconUserOrgAccessChecker(UserOrgAccessChecker):
@@ -71,9 +191,22 @@ class FalconUserOrgAccessChecker(UserOrgAccessChecker):
     Should be used from within Falcon resources.
     """
 
-    def validate_access(self, user_token, org_ids):
+    def validate_access(self, user_token, org_ids, token_claims=None):
+        with self._falcon_errors():
+            super().validate_access(user_token, org_ids, token_claims)
+
+    def validate_admin_access(self, user_token, token_claims=None):
+        with self._falcon_errors():
+            super().validate_admin_access(user_token, token_claims)
+
+    @staticmethod
+    @contextmanager
+    def _falcon_errors():
+        """
+        Translates the errors of access validation to Falcon errors.
+        """
         try:
-            super().validate_access(user_token, org_ids)
+            yield
         except NoOrgAccessError as ex:
             raise falcon.HTTPForbidden(
                 "User doesn't have access to resource.",
@@ -3,13 +3,21 @@ Functions dedicated to making sure that a user has access
 to the organisation's resources he/she requests.
 """
 
+import binascii
+import hashlib
 import json
 import logging
+import threading
+import time
 from urllib.parse import urljoin
 
 from jwt.utils import base64url_decode
+import redis
 import requests
 
+from ..cache import LruCache
+from ..single_flight import SingleFlight
+
 USER_MANAGEMENT_PATH = '/rest/orgs/permissions'
 
 
@@ -17,16 +25,55 @@ class UserOrgAccessChecker:
 
     """
     Checks if a user has access to organization's data.
+    Can cache the organizations of users, so that the service checking the permissions doesn't
+    need to be called on every check. A cached entry never outlives the token it was got with.
+    Concurrent lookups of organizations for the same token share a single call to the service.
+
+    Under the in-process cache there can be a cache in Redis, shared by all processes
+    (and instances) of the application. Its errors only cause the service to be called.
+
+    Calls to the service can go through a circuit breaker, so that they fail fast
+    while the service is down.
     """
 
-    def __init__(self, checker_url):
+    SHARED_CACHE_KEY_PREFIX = 'user_orgs:'
+
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            checker_url,
+            cache_size=0,
+            cache_ttl=None,
+            shared_cache_redis=None,
+            shared_cache_ttl=30,
+            http_client=None,
+            circuit_breaker=None):
         """
         :param checker_url: URL of the service that can check user's permissions.
+        :param int cache_size: Maximum number of tokens for which user's organizations are cached.
+            0 disables the cache.
+        :param float cache_ttl: Number of seconds after which a cached entry expires
+            (if the token doesn't expire sooner). None means only the token's expiration counts.
+        :param `redis.Redis` shared_cache_redis: Client of the Redis holding the shared cache.
+            None disables the shared cache.
+        :param int shared_cache_ttl: Number of seconds after which an entry in the shared cache
+            expires (if the token doesn't expire sooner).
+        :param `cf_app_utils.HttpClient` http_client: Client used to call the service.
+            If not given, a new connection is made for each call, without a timeout.
+        :param `cf_app_utils.CircuitBreaker` circuit_breaker: Circuit breaker for the calls
+            to the service. None disables it.
         """
         self._log = logging.getLogger(type(self).__name__)
         self._checker_url = checker_url
+        self._http_client = http_client or requests
+        self._user_orgs_cache = LruCache(cache_size, cache_ttl) if cache_size else None
+        self._user_orgs_lookups = SingleFlight()
+        self._shared_cache_redis = shared_cache_redis
+        self._shared_cache_ttl = shared_cache_ttl
+        self._shared_cache_stats = {'hits': 0, 'misses': 0, 'errors': 0}
+        self._shared_cache_stats_lock = threading.Lock()
+        self._circuit_breaker = circuit_breaker
 
-    def validate_access(self, user_token, org_ids):
+    def validate_access(self, user_token, org_ids, token_claims=None):
         """
         Validates that the user actually has access to the given organizations.
         If the user doesn't have access an error is raised.
@@ -36,41 +83,212 @@ class UserOrgAccessChecker:
 
         :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
         :param list[str] org_ids: IDs of organizations that the user needs to have access to
+        :param dict token_claims: Claims of the token, decoded during its verification.
+            If not given, they're parsed from the token.
         :rtype: None
         :raises `PermissionServiceError`: When getting user's org permissions fails.
         :raises `NoOrgAccessError`: When user doesn't have access to all of the specified orgs.
         """
-        if self._user_is_admin(user_token):
+        if token_claims is None:
+            token_claims = self._get_token_payload(user_token)
+        if self._user_is_admin(token_claims):
             return
-        self._check_user_org_access(user_token, org_ids)
+        self._check_user_org_access(user_token, org_ids, token_claims.get('exp'))
+
+    def validate_admin_access(self, user_token, token_claims=None):
+        """
+        Validates that the user has the role of console.admin.
+        If the user isn't an admin an error is raised.
+
+        WARNING: This method can only be used AFTER the token was verified.
+
+        :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
+        :param dict token_claims: Claims of the token, decoded during its verification.
+            If not given, they're parsed from the token.
+        :rtype: None
+        :raises `NoOrgAccessError`: When user isn't an admin.
+        """
+        if token_claims is None:
+            token_claims = self._get_token_payload(user_token)
+        if not self._user_is_admin(token_claims):
+            msg = "User isn't an admin."
+            self._log.error(msg)
+            raise NoOrgAccessError(msg)
+
+    def stats(self):
+        """
+        :return: Statistics of the lookups of users' organizations, of their caches
+            and of the circuit breaker (if they're enabled).
+        :rtype: dict
+        """
+        stats = {'lookups': self._user_orgs_lookups.stats()}
+        if self._user_orgs_cache:
+            stats['cache'] = self._user_orgs_cache.stats()
+        if self._shared_cache_redis:
+            with self._shared_cache_stats_lock:
+                stats['shared_cache'] = dict(self._shared_cache_stats)
+        if self._circuit_breaker:
+            stats['circuit_breaker'] = self._circuit_breaker.stats()
+        return stats
 
     @staticmethod
-    def _user_is_admin(user_token):
+    def _get_token_payload(user_token):
         """
         :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
-        :return: True if the user is an admin.
-        :rtype: bool
+        :return: Claims from the token's payload.
+        :rtype: dict
         """
         # get token without "bearer"
         token = user_token.split()[1]
         # take the middle part with payload
         token_payload_based = token.split('.')[1]
         token_payload_str = base64url_decode(token_payload_based.encode()).decode()
-        token_payload = json.loads(token_payload_str)
-        return 'console.admin' in token_payload['scope']
+        return json.loads(token_payload_str)
 
-    def _check_user_org_access(self, user_token, org_ids):
+    @staticmethod
+    def _user_is_admin(token_claims):
+        """
+        :param dict token_claims: Claims from the user's token.
+        :return: True if the user is an admin.
+        :rtype: bool
         """
-        Calls the user management service to see if the user has access to the given organizations.
+        return 'console.admin' in token_claims['scope']
+
+    def _check_user_org_access(self, user_token, org_ids, token_expiration):
+        """
+        Sees if the user has access to the given organizations.
         :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
         :param list[str] org_ids: IDs of organizations that the user needs to have access to
+        :param int token_expiration: UNIX time of the token's expiration or None.
         :rtype: None
         :raises `PermissionServiceError`: When getting user's org permissions fails.
         :raises `NoOrgAccessError`: When user doesn't have access to all of the specified orgs.
         """
-        resp = requests.get(
-            urljoin(self._checker_url, USER_MANAGEMENT_PATH),
-            headers={'Authorization': user_token})
+        user_orgs = self._get_user_orgs(user_token, token_expiration)
+        requested_orgs = set(org_ids)
+
+        if not user_orgs.issuperset(requested_orgs):
+            msg = "User doesn't have access to the given organizations: {}".format(
+                requested_orgs - user_orgs)
+            self._log.error(msg)
+            raise NoOrgAccessError(msg)
+
+    def _get_user_orgs(self, user_token, token_expiration):
+        """
+        Gets the user's organizations from the caches or from the user management service.
+        Concurrent calls for the same token that miss the in-process cache share a single lookup.
+        :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
+        :param int token_expiration: UNIX time of the token's expiration or None.
+        :return: IDs of the user's organizations.
+        :rtype: frozenset[str]
+        :raises `PermissionServiceError`: When getting user's org permissions fails.
+        """
+        token_digest = hashlib.sha256(user_token.encode()).digest()
+        if self._user_orgs_cache is not None:
+            user_orgs = self._user_orgs_cache.get(token_digest)
+            if user_orgs is not None:
+                return user_orgs
+        return self._user_orgs_lookups.do(token_digest, self._look_up_user_orgs,
+                                          user_token, token_digest, token_expiration)
+
+    def _look_up_user_orgs(self, user_token, token_digest, token_expiration):
+        """
+        Gets the user's organizations from the shared cache or from the user management service
+        and puts them in the caches.
+        :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
+        :param bytes token_digest: SHA-256 digest of the token, used as the cache key.
+        :param int token_expiration: UNIX time of the token's expiration or None.
+        :return: IDs of the user's organizations.
+        :rtype: frozenset[str]
+        :raises `PermissionServiceError`: When getting user's org permissions fails.
+        """
+        user_orgs = self._get_shared_cache_entry(token_digest)
+        if user_orgs is None:
+            user_orgs = self._fetch_user_orgs(user_token)
+            self._put_shared_cache_entry(token_digest, user_orgs, token_expiration)
+        if self._user_orgs_cache is not None:
+            self._user_orgs_cache.put(token_digest, user_orgs, token_expiration)
+        return user_orgs
+
+    def _get_shared_cache_entry(self, token_digest):
+        """
+        :param bytes token_digest: SHA-256 digest of the token.
+        :return: IDs of the user's organizations or None, if they aren't in the shared cache
+            or it can't be read.
+        :rtype: frozenset[str]
+        """
+        if self._shared_cache_redis is None:
+            return None
+        try:
+            entry = self._shared_cache_redis.get(self._get_shared_cache_key(token_digest))
+        except redis.exceptions.RedisError:
+            self._log.exception("Couldn't read the shared cache of users' organizations.")
+            self._count_shared_cache_event('errors')
+            return None
+        if entry is None:
+            self._count_shared_cache_event('misses')
+            return None
+        self._count_shared_cache_event('hits')
+        return frozenset(json.loads(entry.decode()))
+
+    def _put_shared_cache_entry(self, token_digest, user_orgs, token_expiration):
+        """
+        :param bytes token_digest: SHA-256 digest of the token.
+        :param frozenset[str] user_orgs: IDs of the user's organizations.
+        :param int token_expiration: UNIX time of the token's expiration or None.
+        """
+        if self._shared_cache_redis is None:
+            return
+        ttl = self._shared_cache_ttl
+        if token_expiration is not None:
+            ttl = min(ttl, int(token_expiration - time.time()))
+        if ttl < 1:
+            return
+        try:
+            self._shared_cache_redis.set(self._get_shared_cache_key(token_digest),
+                                         json.dumps(sorted(user_orgs)),
+                                         ex=ttl)
+        except redis.exceptions.RedisError:
+            self._log.exception("Couldn't write to the shared cache of users' organizations.")
+            self._count_shared_cache_event('errors')
+
+    @classmethod
+    def _get_shared_cache_key(cls, token_digest):
+        """
+        :param bytes token_digest: SHA-256 digest of the token.
+        :return: Key of the token's entry in the shared cache.
+        :rtype: str
+        """
+        return cls.SHARED_CACHE_KEY_PREFIX + binascii.hexlify(token_digest).decode()
+
+    def _count_shared_cache_event(self, event):
+        """
+        :param str event: Name of the shared cache's counter to increment.
+        """
+        with self._shared_cache_stats_lock:
+            self._shared_cache_stats[event] += 1
+
+    def _fetch_user_orgs(self, user_token):
+        """
+        Calls the user management service to get the user's organizations.
+        :param str user_token: User's OAuth 2 token payload (containing "bearer" prefix).
+        :return: IDs of the user's organizations.
+        :rtype: frozenset[str]
+        :raises `PermissionServiceError`: When getting user's org permissions fails
+            or the circuit breaker doesn't allow calling the service.
+        """
+        if self._circuit_breaker and not self._circuit_breaker.allow_request():
+            self._log.error("Circuit breaker for the service at %s is open.", self._checker_url)
+            raise PermissionServiceError()
+        try:
+            resp = self._http_client.get(
+                urljoin(self._checker_url, USER_MANAGEMENT_PATH),
+                headers={'Authorization': user_token})
+        except requests.exceptions.RequestException as ex:
+            self._log.exception("Failed to call the service at %s", self._checker_url)
+            self._record_call_outcome(failed=True)
+            raise PermissionServiceError() from ex
+        self._record_call_outcome(failed=resp.status_code >= 500)
         if resp.status_code != 200:
             self._log.error(
                 "Failed to get user's organizations from service "
@@ -80,14 +298,20 @@ class UserOrgAccessChecker:
                 resp.text)
             raise PermissionServiceError()
 
-        user_orgs = set([entry['organization']['metadata']['guid'] for entry in resp.json()])
-        requested_orgs = set(org_ids)
+        return frozenset(entry['organization']['metadata']['guid'] for entry in resp.json())
 
-        if not user_orgs.issuperset(requested_orgs):
-            msg = "User doesn't have access to the given organizations: {}".format(
-                requested_orgs - user_orgs)
-            self._log.error(msg)
-            raise NoOrgAccessError(msg)
+    def _record_call_outcome(self, failed):
+        """
+        Tells the circuit breaker (if there is one) about the outcome of a call to the service.
+        :param bool failed: True if the call failed because of a connection problem,
+            another error of the request or a server error.
+        """
+        if self._circuit_breaker is None:
+            return
+        if failed:
+            self._circuit_breaker.record_failure()
+        else:
+            self._circuit_breaker.record_success()
 
 
 class NoOrgAccessError(Exception):
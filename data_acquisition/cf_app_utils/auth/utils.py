@@ -8,16 +8,33 @@ import requests
 _log = logging.getLogger(__name__) #pylint: disable=invalid-name
 
 
-def get_uaa_key(uaa_key_url):
+def get_uaa_key(uaa_key_url, http_client=None):
     """
     Gets a key for verifying OAuth JWT tokens from CloudFoundry's UAA.
+    :param str uaa_key_url: URL under which the public key can be found.
+    :param `cf_app_utils.HttpClient` http_client: Client used to call UAA.
+        If not given, a new connection is made without a timeout.
     :returns: UAA's public key.
     :raises `UaaError`: Getting the key from UAA failed.
     :rtype: str
     """
+    return get_uaa_key_info(uaa_key_url, http_client)['value']
+
+
+def get_uaa_key_info(uaa_key_url, http_client=None):
+    """
+    Gets the current key for verifying OAuth JWT tokens from CloudFoundry's UAA, with its metadata.
+    :param str uaa_key_url: URL under which the public key can be found.
+    :param `cf_app_utils.HttpClient` http_client: Client used to call UAA.
+        If not given, a new connection is made without a timeout.
+    :returns: UAA's response, containing the public key ("value")
+        and its ID ("kid", if UAA supports rotating keys).
+    :raises `UaaError`: Getting the key from UAA failed.
+    :rtype: dict
+    """
     try:
-        response = requests.get(uaa_key_url)
-    except requests.exceptions.ConnectionError as ex:
+        response = (http_client or requests).get(uaa_key_url)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
         msg = 'Failed to connect to UAA at {}'.format(uaa_key_url)
         _log.exception(msg)
         raise UaaError(msg) from ex
@@ -29,7 +46,7 @@ def get_uaa_key(uaa_key_url):
         )
         _log.error(msg)
         raise UaaError(msg)
-    return response.json()['value']
+    return response.json()
 
 
 class UaaError(Exception):
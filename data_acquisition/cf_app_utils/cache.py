@@ -0,0 +1,110 @@
+"""
+In-process caching utilities.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LruCache:
+
+    """
+    Thread-safe, size bounded cache that evicts the least recently used entries.
+    Entries can also expire after a time. Counts hits and misses.
+    By default each entry has the size of 1, so the cache's size is the number of its entries.
+    Entries holding collections can be given bigger sizes.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        """
+        :param int max_size: Maximum total size of the entries in the cache.
+        :param float ttl: Number of seconds after which an entry expires. None means never.
+        """
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict() # key -> (value, expiration time or None, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        :param key: Key of the entry.
+        :param default: Value returned when there's no (unexpired) entry for the key.
+        :return: The cached value or the default.
+        """
+        with self._lock:
+            try:
+                value, expires_at, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, expires_at=None, size=1):
+        """
+        :param key: Key of the entry.
+        :param value: Value of the entry.
+        :param float expires_at: UNIX time after which the entry expires. If the cache has a TTL,
+            the entry will expire at whichever comes first.
+        :param int size: Size of the entry. An entry bigger than the cache isn't cached
+            (and the key's previous entry is removed).
+        """
+        if self._ttl is not None:
+            ttl_expiration = time.time() + self._ttl
+            expires_at = ttl_expiration if expires_at is None else min(expires_at, ttl_expiration)
+        with self._lock:
+            self._remove(key)
+            if size > self._max_size:
+                return
+            self._entries[key] = (value, expires_at, size)
+            self._size += size
+            while self._size > self._max_size:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def pop(self, key):
+        """
+        Removes the entry, if it's in the cache.
+        :param key: Key of the entry.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """
+        Removes all entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        :return: Size, capacity, hit and miss counts of the cache.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'size': self._size,
+                'max_size': self._max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _remove(self, key):
+        """
+        Removes the entry, if it's in the cache. Must be called with the lock held.
+        :param key: Key of the entry.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
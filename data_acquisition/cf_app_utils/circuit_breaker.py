@@ -0,0 +1,116 @@
+"""
+Circuit breaker stopping calls to a service that keeps failing.
+"""
+
+import threading
+import time
+
+
+class CircuitBreaker:
+
+    """
+    Tracks the failures of calls to a service. After a number of consecutive failures the circuit
+    opens and calls aren't allowed, so that they fail fast instead of waiting for a broken service
+    and adding to its load. After a timeout a single trial call is allowed (the circuit is half
+    open). Its success closes the circuit, its failure opens it again. If the trial call's outcome
+    isn't recorded within the timeout, another trial call is allowed.
+
+    The caller asks for permission with `allow_request` and reports the call's outcome
+    with `record_success` or `record_failure`.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param int failure_threshold: Number of consecutive failures that opens the circuit.
+        :param float reset_timeout: Seconds after which an open circuit allows a trial call
+            and after which a trial call without a recorded outcome is given up on.
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+        self._times_opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self):
+        """
+        :return: One of `CLOSED`, `OPEN` and `HALF_OPEN`.
+        :rtype: str
+        """
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """
+        :return: True if a call can be made now. When the circuit is half open, only one trial
+            call is allowed until its outcome is recorded or the reset timeout passes.
+        :rtype: bool
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if state == self.HALF_OPEN and (
+                    self._trial_started_at is None
+                    or now - self._trial_started_at >= self._reset_timeout):
+                self._trial_started_at = now
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        """Closes the circuit and resets the count of failures."""
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_started_at = None
+
+    def record_failure(self):
+        """Counts the failure, opening the circuit if the threshold is reached
+        or if the failed call was the trial one.
+        """
+        with self._lock:
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (
+                    state == self.CLOSED
+                    and self._consecutive_failures >= self._failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+            self._trial_started_at = None
+
+    def stats(self):
+        """
+        :return: State of the circuit, count of consecutive failures, number of times the circuit
+            opened and the count of calls it didn't allow.
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'consecutive_failures': self._consecutive_failures,
+                'times_opened': self._times_opened,
+                'rejected': self._rejected,
+            }
+
+    def _current_state(self):
+        """
+        Must be called with the lock held.
+        :return: The state, taking into account that an open circuit becomes half open
+            after the reset timeout.
+        :rtype: str
+        """
+        if (self._state == self.OPEN
+                and time.monotonic() - self._opened_at >= self._reset_timeout):
+            self._state = self.HALF_OPEN
+        return self._state
@@ -0,0 +1,124 @@
+"""
+Adaptive limiting of the number of concurrent calls to a service.
+"""
+
+import threading
+import time
+
+
+class AdaptiveConcurrencyLimiter:
+
+    """
+    Limits the number of calls in flight, adapting the limit to how the called service copes
+    (AIMD - additive increase, multiplicative decrease):
+    * When calls are waiting for a free slot and a call completes with a latency close
+      to the lowest observed one, the limit grows by one per "limit" completions.
+    * When a call fails or its latency exceeds the lowest one by the tolerated ratio
+      (the service is queueing the calls), the limit is cut by the backoff ratio.
+      It's cut at most once per the latency of the call, so that the effect of a cut
+      can be seen before the next one.
+    The lowest observed latency slowly drifts up, so that it follows lasting changes
+    of the service's speed.
+
+    A slot is taken with `acquire` and given back with `release`, which reports the call's outcome.
+    Separate limiters for separate services work as bulkheads: a slow service only uses up
+    its own slots.
+    """
+
+    MIN_LATENCY_DRIFT = 1.001
+
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            min_limit,
+            max_limit,
+            initial_limit=None,
+            latency_tolerance=2.0,
+            backoff_ratio=0.75):
+        """
+        :param int min_limit: The lowest the limit can go.
+        :param int max_limit: The highest the limit can go.
+        :param int initial_limit: The starting limit. `min_limit` if not given.
+        :param float latency_tolerance: Ratio of a call's latency to the lowest observed one
+            above which the limit is cut.
+        :param float backoff_ratio: Ratio by which the limit is multiplied when it's cut.
+        """
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._limit = float(initial_limit or min_limit)
+        self._latency_tolerance = latency_tolerance
+        self._backoff_ratio = backoff_ratio
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._min_latency = None
+        self._last_decrease_time = float('-inf')
+        self._increases = 0
+        self._decreases = 0
+
+    def acquire(self, timeout=None):
+        """Waits until the number of calls in flight is below the limit and takes a slot.
+
+        :param float timeout: Seconds to wait for a slot. Waits for as long as needed if None.
+        :return: True if the slot was taken, False if the timeout passed first.
+        :rtype: bool
+        """
+        with self._condition:
+            self._waiting += 1
+            try:
+                if not self._condition.wait_for(
+                        lambda: self._in_flight < int(self._limit), timeout):
+                    return False
+            finally:
+                self._waiting -= 1
+            self._in_flight += 1
+            return True
+
+    def release(self, latency=None, failed=False):
+        """Gives back a slot and adjusts the limit according to the call's outcome.
+
+        :param float latency: Duration of the call in seconds. None if the call wasn't made,
+            then the limit isn't adjusted.
+        :param bool failed: True if the call failed in a way showing that the service is
+            overloaded or broken (e.g. a timeout or a server error).
+        """
+        with self._condition:
+            saturated = self._waiting > 0
+            self._in_flight -= 1
+            if latency is None:
+                self._condition.notify_all()
+                return
+            if not failed:
+                if self._min_latency is None:
+                    self._min_latency = latency
+                else:
+                    self._min_latency = min(latency, self._min_latency * self.MIN_LATENCY_DRIFT)
+
+            if failed or latency > self._min_latency * self._latency_tolerance:
+                now = time.monotonic()
+                if now - self._last_decrease_time >= latency:
+                    self._last_decrease_time = now
+                    self._set_limit(self._limit * self._backoff_ratio)
+                    self._decreases += 1
+            elif saturated and self._limit < self._max_limit:
+                self._set_limit(self._limit + 1 / self._limit)
+                self._increases += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """
+        :return: The current limit, counts of calls in flight and waiting, the lowest observed
+            latency (in seconds) and the counts of the limit's increases and decreases.
+        :rtype: dict
+        """
+        with self._condition:
+            return {
+                'limit': int(self._limit),
+                'in_flight': self._in_flight,
+                'waiting': self._waiting,
+                'min_latency': self._min_latency,
+                'increases': self._increases,
+                'decreases': self._decreases,
+            }
+
+    def _set_limit(self, limit):
+        self._limit = min(self._max_limit, max(self._min_limit, limit))
@@ -0,0 +1,75 @@
+"""
+HTTP client for calls to other services.
+"""
+
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpClient:
+
+    """
+    Thread-safe HTTP client keeping a pool of keep-alive connections for each host.
+    Every call has a timeout, unless a different one is passed explicitly.
+    Has the same `get` and `post` methods as the `requests` module.
+
+    Cookies aren't kept between calls, because the calls are made on behalf of different users.
+    """
+
+    def __init__(self, pool_size=10, max_hosts=10, connect_timeout=3.05, read_timeout=30.0):
+        """
+        :param int pool_size: Maximum number of idle connections kept for a host.
+        :param int max_hosts: Maximum number of hosts for which connection pools are kept.
+        :param float connect_timeout: Seconds to wait for a connection to be established.
+        :param float read_timeout: Seconds to wait for the server between sent/received bytes.
+        """
+        self._timeout = (connect_timeout, read_timeout)
+        self._adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+
+    def request(self, method, url, **kwargs):
+        """
+        :param str method: HTTP method.
+        :param str url: URL for the call.
+        :param kwargs: Arguments accepted by `requests.request`.
+        :rtype: `requests.Response`
+        """
+        kwargs.setdefault('timeout', self._timeout)
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """
+        Sends a GET request. See `request`.
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        Sends a POST request. See `request`.
+        """
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        :return: Counts of the requests and of the connections opened for them,
+            for each host that has a pool.
+        :rtype: dict
+        """
+        pools = self._adapter.poolmanager.pools
+        host_stats = {}
+        for pool_key in pools.keys():
+            try:
+                pool = pools[pool_key]
+            except KeyError: # the pool got evicted in the meantime
+                continue
+            host_stats['{}://{}:{}'.format(pool.scheme, pool.host, pool.port)] = {
+                'requests': pool.num_requests,
+                'new_connections': pool.num_connections,
+                'reused_connections': max(pool.num_requests - pool.num_connections, 0),
+            }
+        return host_stats
@@ -0,0 +1,33 @@
+"""
+Policy of retrying failed calls.
+"""
+
+import random
+
+
+class RetryPolicy:
+
+    """
+    Retrying with exponential backoff and full jitter: the delay before a retry is random, between
+    zero and the base delay doubled with each attempt (up to a maximum). The randomness spreads
+    the retries of many clients, so a recovering service doesn't get them all at once.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=10.0):
+        """
+        :param int max_attempts: Maximum number of attempts of a call, including the first one.
+        :param float base_delay: Upper bound (in seconds) of the delay before the first retry.
+        :param float max_delay: Upper bound (in seconds) of the delay before any retry.
+        """
+        self.max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    def get_delay(self, retry_number):
+        """
+        :param int retry_number: Number of the retry, starting from 1.
+        :return: Seconds to wait before the retry.
+        :rtype: float
+        """
+        return random.uniform(0, min(self._max_delay,
+                                     self._base_delay * 2 ** (retry_number - 1)))
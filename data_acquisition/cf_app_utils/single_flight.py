@@ -0,0 +1,63 @@
+"""
+Coalescing of concurrent, identical calls.
+"""
+
+from concurrent.futures import Future
+import threading
+
+
+class SingleFlight:
+
+    """
+    Makes concurrent calls with the same key share a single execution of the called function.
+    Threads calling while the function is already executing for the key wait for it
+    and get its result or error. Counts the executions and the calls that got a shared result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {} # key -> Future of the executing call
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Calls the function, unless a call with the same key is already executing.
+        :param key: Identifies calls that can share a result.
+        :param function: The function to call.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+        :return: The function's result.
+        :raises Exception: Whatever the function raises.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = Future()
+                self._in_flight[key] = future
+                self.executions += 1
+                is_executing = True
+            else:
+                self.shared += 1
+                is_executing = False
+        if not is_executing:
+            return future.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except Exception as ex:
+            future.set_exception(ex)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        """
+        :return: Execution count and the count of calls that shared another call's execution.
+        :rtype: dict
+        """
+        return {'executions': self.executions, 'shared': self.shared}
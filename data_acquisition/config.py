@@ -30,10 +30,53 @@ class DasConfig: #pylint: disable=too-many-instance-attributes
             downloader_url=None,
             metadata_parser_url=None,
             user_management_url=None,
-            verification_key_url=None):
+            verification_key_url=None,
+            requests_cache_size=0,
+            requests_cache_ttl=None,
+            permissions_cache_size=0,
+            permissions_cache_ttl=None,
+            permissions_shared_cache_ttl=0,
+            token_cache_size=0,
+            verification_key_refresh_interval=None,
+            http_pool_size=10,
+            http_connect_timeout=3.05,
+            http_read_timeout=30.0,
+            job_queue_size=1000,
+            download_coalescing_ttl=0,
+            acquired_sources_cache_size=0,
+            acquired_sources_cache_ttl=21600,
+            idempotency_key_ttl=0,
+            worker_min_concurrency=2,
+            worker_max_concurrency=32,
+            worker_latency_tolerance=2.0,
+            downloader_max_concurrency=16,
+            metadata_parser_max_concurrency=16,
+            worker_name='worker-0',
+            retry_max_attempts=3,
+            retry_base_delay=0.5,
+            retry_max_delay=10.0,
+            circuit_breaker_failure_threshold=5,
+            circuit_breaker_reset_timeout=30.0):
         """
         Should not be used (instantiated) directly outside of tests.
         Use `get_config`.
+        Size of 0 disables the in-process cache of acquisition requests
+        or of users' permissions or of verified tokens. TTL of 0 disables the cache of users'
+        permissions shared through Redis.
+        Refresh interval of None disables refreshing of the key verifying tokens.
+        HTTP settings are for calls to other services (timeouts are in seconds).
+        Job queue and worker settings are for the jobs sending requests to other services.
+        Download coalescing TTL is the longest time (in seconds) acquisitions of a source can
+        wait for a download started by another acquisition. 0 disables the coalescing.
+        Size of 0 disables the cache of recently acquired sources, which lets acquisitions
+        of a source downloaded in the last TTL seconds skip the download.
+        Idempotency key TTL is the number of seconds for which a resubmitted acquisition request
+        with the same key returns the original request. 0 disables idempotency keys.
+        Worker's maximum concurrency is the number of its threads. The number of calls
+        in flight to each of Downloader and Metadata Parser adapts to their latency
+        between the worker's minimum concurrency and the service's own maximum.
+        Retry and circuit breaker settings are for all calls to other services
+        (delays and timeouts are in seconds).
         """
         self.self_url = self_url
         self.port = port
@@ -44,6 +87,32 @@ class DasConfig: #pylint: disable=too-many-instance-attributes
         self.metadata_parser_url = metadata_parser_url
         self.user_management_url = user_management_url
         self.verification_key_url = verification_key_url
+        self.requests_cache_size = requests_cache_size
+        self.requests_cache_ttl = requests_cache_ttl
+        self.permissions_cache_size = permissions_cache_size
+        self.permissions_cache_ttl = permissions_cache_ttl
+        self.permissions_shared_cache_ttl = permissions_shared_cache_ttl
+        self.token_cache_size = token_cache_size
+        self.verification_key_refresh_interval = verification_key_refresh_interval
+        self.http_pool_size = http_pool_size
+        self.http_connect_timeout = http_connect_timeout
+        self.http_read_timeout = http_read_timeout
+        self.job_queue_size = job_queue_size
+        self.download_coalescing_ttl = download_coalescing_ttl
+        self.acquired_sources_cache_size = acquired_sources_cache_size
+        self.acquired_sources_cache_ttl = acquired_sources_cache_ttl
+        self.idempotency_key_ttl = idempotency_key_ttl
+        self.worker_min_concurrency = worker_min_concurrency
+        self.worker_max_concurrency = worker_max_concurrency
+        self.worker_latency_tolerance = worker_latency_tolerance
+        self.downloader_max_concurrency = downloader_max_concurrency
+        self.metadata_parser_max_concurrency = metadata_parser_max_concurrency
+        self.worker_name = worker_name
+        self.retry_max_attempts = retry_max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.circuit_breaker_failure_threshold = circuit_breaker_failure_threshold
+        self.circuit_breaker_reset_timeout = circuit_breaker_reset_timeout
 
     @classmethod
     def get_config(cls):
@@ -79,8 +148,10 @@ class DasConfig: #pylint: disable=too-many-instance-attributes
             get_serv_value('user-management/credentials/host'),
             USER_MANAGEMENT_PATH
         )
+        # the worker is deployed without a route
+        app_uris = vcap_application['uris']
         return DasConfig(
-            self_url='https://' + vcap_application['uris'][0],
+            self_url='https://' + app_uris[0] if app_uris else None,
             port=int(os.environ['VCAP_APP_PORT']),
             redis_host=get_serv_value('requests-store/credentials/hostname'),
             redis_port=int(get_serv_value('requests-store/credentials/port')),
@@ -88,7 +159,39 @@ class DasConfig: #pylint: disable=too-many-instance-attributes
             downloader_url=downloader_url,
             metadata_parser_url=metadata_parser_url,
             user_management_url=user_management_url,
-            verification_key_url=get_serv_value('sso/credentials/tokenKey')
+            verification_key_url=get_serv_value('sso/credentials/tokenKey'),
+            requests_cache_size=int(os.environ.get('REQUESTS_CACHE_SIZE', 10000)),
+            requests_cache_ttl=float(os.environ.get('REQUESTS_CACHE_TTL', 300)),
+            permissions_cache_size=int(os.environ.get('PERMISSIONS_CACHE_SIZE', 10000)),
+            permissions_cache_ttl=float(os.environ.get('PERMISSIONS_CACHE_TTL', 60)),
+            permissions_shared_cache_ttl=int(os.environ.get('PERMISSIONS_SHARED_CACHE_TTL', 30)),
+            token_cache_size=int(os.environ.get('TOKEN_CACHE_SIZE', 10000)),
+            verification_key_refresh_interval=float(
+                os.environ.get('VERIFICATION_KEY_REFRESH_INTERVAL', 300)),
+            http_pool_size=int(os.environ.get('HTTP_POOL_SIZE', 10)),
+            http_connect_timeout=float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+            http_read_timeout=float(os.environ.get('HTTP_READ_TIMEOUT', 30)),
+            job_queue_size=int(os.environ.get('JOB_QUEUE_SIZE', 1000)),
+            download_coalescing_ttl=int(os.environ.get('DOWNLOAD_COALESCING_TTL', 3600)),
+            acquired_sources_cache_size=int(os.environ.get('ACQUIRED_SOURCES_CACHE_SIZE', 0)),
+            acquired_sources_cache_ttl=int(
+                os.environ.get('ACQUIRED_SOURCES_CACHE_TTL', 21600)),
+            idempotency_key_ttl=int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400)),
+            worker_min_concurrency=int(os.environ.get('WORKER_MIN_CONCURRENCY', 2)),
+            worker_max_concurrency=int(os.environ.get('WORKER_MAX_CONCURRENCY', 32)),
+            worker_latency_tolerance=float(os.environ.get('WORKER_LATENCY_TOLERANCE', 2)),
+            downloader_max_concurrency=int(os.environ.get('DOWNLOADER_MAX_CONCURRENCY', 16)),
+            metadata_parser_max_concurrency=int(
+                os.environ.get('METADATA_PARSER_MAX_CONCURRENCY', 16)),
+            worker_name=os.environ.get(
+                'WORKER_NAME', 'worker-' + os.environ.get('CF_INSTANCE_INDEX', '0')),
+            retry_max_attempts=int(os.environ.get('RETRY_MAX_ATTEMPTS', 3)),
+            retry_base_delay=float(os.environ.get('RETRY_BASE_DELAY', 0.5)),
+            retry_max_delay=float(os.environ.get('RETRY_MAX_DELAY', 10)),
+            circuit_breaker_failure_threshold=int(
+                os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)),
+            circuit_breaker_reset_timeout=float(
+                os.environ.get('CIRCUIT_BREAKER_RESET_TIMEOUT', 30))
         )
 
     @staticmethod
@@ -0,0 +1,176 @@
+"""
+Deduplication of concurrent downloads of the same source, kept in Redis.
+"""
+
+from collections import namedtuple
+import hashlib
+import json
+import threading
+from urllib.parse import urlsplit, urlunsplit
+
+
+# An acquisition request waiting for a download started for another request: the request's ID
+# and its user's token (for the request's own call to Metadata Parser).
+WaitingRequest = namedtuple('WaitingRequest', ['request_id', 'token'])
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443, 'ftp': 21}
+
+
+def normalize_source(source):
+    """Brings the equivalent spellings of a source URL to one form: the scheme and the host are
+    lowercased, the default port, the fragment and the surrounding whitespace are removed
+    and an empty path becomes "/".
+
+    Args:
+        source (str): URL of a data set.
+
+    Returns:
+        str: The normalized URL. Sources that can't be parsed are only stripped of whitespace.
+    """
+    source = source.strip()
+    try:
+        parts = urlsplit(source)
+        port = parts.port
+    except ValueError:
+        return source
+    if not parts.hostname:
+        return source
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if ':' in host:
+        host = '[{}]'.format(host)
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        host = '{}:{}'.format(host, port)
+    user_info, _, _ = parts.netloc.rpartition('@')
+    if user_info:
+        host = '{}@{}'.format(user_info, host)
+    return urlunsplit((scheme, host, parts.path or '/', parts.query, ''))
+
+
+class DownloadCoalescer:
+    """Makes acquisition requests of the same source, made while the source is being downloaded,
+    share the download, so that Downloader gets a single job per source.
+
+    The first request of a source starts a download (see `join`). Requests of the source made
+    before the download's callback wait for it. The callback gets the waiting requests
+    (see `complete`), so the downloaded file can be used for all of them.
+    Sources are compared after `normalize_source`.
+
+    A download is forgotten after the TTL, in case its callback never comes. Requests of
+    the source start a new download then. The requests that waited for the forgotten download
+    keep waiting for its callback, as the request that started it does, so the list of waiting
+    requests doesn't expire. It's removed by `complete`.
+
+    The scripts compute the names of the keys, so they won't work with Redis Cluster.
+
+    Args:
+        redis_client (`redis.Redis`): Redis client.
+        ttl (int): Seconds after which a download is forgotten.
+    """
+
+    REDIS_SOURCE_PREFIX = 'downloads:source:'
+    REDIS_DOWNLOAD_SOURCE_PREFIX = 'downloads:download_source:'
+    REDIS_WAITING_PREFIX = 'downloads:waiting:'
+
+    # Adds the request to the requests waiting for the source's download, if there is one,
+    # and returns the ID of the request that started it. Otherwise, makes the request
+    # the one starting the download and returns nothing.
+    _JOIN_SCRIPT = """
+        local download_id = redis.call('GET', KEYS[1])
+        if download_id then
+            redis.call('RPUSH', ARGV[4] .. download_id, ARGV[2])
+            return download_id
+        end
+        redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+        redis.call('SET', ARGV[5] .. ARGV[1], KEYS[1], 'EX', ARGV[3])
+        return false
+    """
+    # Forgets the download, so that new requests of the source start a new one, and returns
+    # the requests that waited for it.
+    _COMPLETE_SCRIPT = """
+        local source_key = redis.call('GET', KEYS[1])
+        if source_key and redis.call('GET', source_key) == ARGV[1] then
+            redis.call('DEL', source_key)
+        end
+        local waiting = redis.call('LRANGE', KEYS[2], 0, -1)
+        redis.call('DEL', KEYS[1], KEYS[2])
+        return waiting
+    """
+
+    def __init__(self, redis_client, ttl):
+        self._redis = redis_client
+        self._ttl = ttl
+        self._join_script = self._redis.register_script(self._JOIN_SCRIPT)
+        self._complete_script = self._redis.register_script(self._COMPLETE_SCRIPT)
+        self._stats_lock = threading.Lock()
+        self._started = 0
+        self._joined = 0
+
+    @classmethod
+    def get_source_key(cls, source):
+        """
+        Args:
+            source (str): URL of a data set.
+
+        Returns:
+            str: Key holding the ID of the request that started the source's download.
+        """
+        source_hash = hashlib.sha256(normalize_source(source).encode()).hexdigest()
+        return cls.REDIS_SOURCE_PREFIX + source_hash
+
+    def join(self, source, request_id, token):
+        """Makes the request wait for the source's download, if one is in progress.
+        Takes a single round trip to Redis.
+
+        Args:
+            source (str): URL of the data set to download.
+            request_id (str): ID of the acquisition request.
+            token (str): User's token, for the request's call to Metadata Parser.
+
+        Returns:
+            str: ID of the request that started the download the request waits for. None if
+                there was no download of the source, then the request needs to start it
+                and call `complete` when it's done.
+        """
+        waiting_request = json.dumps(WaitingRequest(request_id, token)._asdict())
+        download_id = self._join_script(
+            keys=[self.get_source_key(source)],
+            args=[request_id, waiting_request, self._ttl,
+                  self.REDIS_WAITING_PREFIX, self.REDIS_DOWNLOAD_SOURCE_PREFIX])
+        with self._stats_lock:
+            if download_id is None:
+                self._started += 1
+                return None
+            self._joined += 1
+            return download_id.decode()
+
+    def complete(self, request_id):
+        """Ends the download started by the request (successfully or not).
+
+        Args:
+            request_id (str): ID of the request that started the download. Requests that didn't
+                start one can be given as well.
+
+        Returns:
+            list[WaitingRequest]: Requests that waited for the download, in the order in which
+                they were made. Empty if no request waited or the request didn't start
+                a download.
+        """
+        waiting_requests = self._complete_script(
+            keys=[self.REDIS_DOWNLOAD_SOURCE_PREFIX + request_id,
+                  self.REDIS_WAITING_PREFIX + request_id],
+            args=[request_id])
+        return [WaitingRequest(**json.loads(waiting_request.decode()))
+                for waiting_request in waiting_requests]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counts of the downloads started and of the requests that joined a download
+                in progress in this process.
+        """
+        with self._stats_lock:
+            return {
+                'started': self._started,
+                'joined': self._joined,
+            }
@@ -0,0 +1,351 @@
+"""
+Durable queue of calls to other services, kept in Redis.
+"""
+
+from collections import namedtuple
+import json
+import threading
+import time
+
+
+class QueueFullError(Exception):
+    """
+    A job couldn't be enqueued, because the queue is full.
+    """
+    pass
+
+
+# A call to another service (Downloader or Metadata Parser) waiting to be made: the URL, the data
+# to be sent, the user's token, the ID of an `AcquisitionRequest` that will be marked as failed
+# if the call fails, the ID of the request's organization and the UNIX time of enqueuing.
+ServiceCall = namedtuple('ServiceCall',
+                         ['url', 'data', 'token', 'request_id', 'org_id', 'enqueued_at'])
+
+
+class RedisJobQueue:
+    """Queue of `ServiceCall` jobs in Redis, shared by the app's instances that enqueue
+    the jobs and the workers (see `data_acquisition.worker`) that make the calls.
+
+    Each organization has its own list of jobs and the organizations having jobs take turns
+    (round-robin), so an organization submitting lots of requests doesn't hold up the others.
+    A list of tokens, one per waiting job, lets the consumers block until there's a job.
+
+    A consumer taking a job atomically moves a token to its own processing list and then replaces
+    it with a job. The job is only removed from there after it's finished. Each worker process
+    holds a lease (a key with a TTL), which it keeps renewing while it runs. Jobs (and tokens)
+    left in the processing lists of a worker whose lease expired (e.g. because it crashed)
+    are put back in the queue by the other workers (see `requeue_abandoned`), so each job
+    is done at least once. The consumers and the workers reporting statistics are kept in sets,
+    so that finding their lists and keys doesn't need a scan of the whole keyspace.
+
+    The scripts compute the names of the organizations' lists, so they won't work
+    with Redis Cluster.
+
+    Args:
+        redis_client (`redis.Redis`): Redis client.
+        max_size (int): Maximum number of jobs waiting in the queue.
+    """
+
+    REDIS_TOKENS_NAME = 'jobs:tokens'
+    REDIS_ACTIVE_ORGS_NAME = 'jobs:active_orgs'
+    REDIS_ORG_QUEUE_PREFIX = 'jobs:org_queue:'
+    REDIS_PROCESSING_PREFIX = 'jobs:processing:'
+    REDIS_CONSUMERS_NAME = 'jobs:consumers'
+    REDIS_WORKER_STATS_PREFIX = 'jobs:worker_stats:'
+    REDIS_WORKERS_NAME = 'jobs:workers'
+    REDIS_WORKER_LEASE_PREFIX = 'jobs:worker_lease:'
+    TOKEN = 'job'
+
+    # Pushes the job to its organization's list only if the queue isn't full, adds a token and
+    # puts the organization in the round-robin list if it had no jobs. Returns 1 when the job
+    # was pushed.
+    _ENQUEUE_SCRIPT = """
+        if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+            return 0
+        end
+        if redis.call('LPUSH', KEYS[3], ARGV[1]) == 1 then
+            redis.call('RPUSH', KEYS[2], ARGV[3])
+        end
+        redis.call('LPUSH', KEYS[1], ARGV[4])
+        return 1
+    """
+    # Replaces the token in the consumer's processing list with the oldest job of the organization
+    # whose turn it is. The organization goes to the end of the round-robin list if it still
+    # has jobs. Returns the job.
+    # Jobs (and tokens) left in the list, because the consumer couldn't finish or postpone them
+    # (e.g. after a Redis error), are put back in the queue first, at the front of their
+    # organizations' lists. Only the token just taken stays.
+    _TAKE_SCRIPT = """
+        redis.call('SADD', KEYS[4], ARGV[3])
+        local token_taken = false
+        local item = redis.call('RPOP', KEYS[1])
+        while item do
+            if item == ARGV[2] and not token_taken then
+                token_taken = true
+            else
+                if item ~= ARGV[2] then
+                    local left_org_id = cjson.decode(item)['org_id']
+                    if redis.call('RPUSH', ARGV[1] .. left_org_id, item) == 1 then
+                        redis.call('RPUSH', KEYS[2], left_org_id)
+                    end
+                end
+                redis.call('LPUSH', KEYS[3], ARGV[2])
+            end
+            item = redis.call('RPOP', KEYS[1])
+        end
+        local org_id = redis.call('LPOP', KEYS[2])
+        if not org_id then
+            return false
+        end
+        local org_queue = ARGV[1] .. org_id
+        local job = redis.call('RPOP', org_queue)
+        if redis.call('LLEN', org_queue) > 0 then
+            redis.call('RPUSH', KEYS[2], org_id)
+        end
+        redis.call('RPUSH', KEYS[1], job)
+        return job
+    """
+    # Empties a consumer's processing list, putting the jobs back in their organizations' lists
+    # (at the front with RPUSH or at the back with LPUSH as the push command) and restoring
+    # the tokens. If the lease of the consumer's worker is given (as the fourth key), the list
+    # is only emptied when the lease doesn't exist and the consumer (the fourth argument)
+    # is removed from the set of consumers (the fifth key). Returns the number of jobs put back.
+    _REQUEUE_SCRIPT = """
+        if KEYS[4] then
+            if redis.call('EXISTS', KEYS[4]) == 1 then
+                return 0
+            end
+            redis.call('SREM', KEYS[5], ARGV[4])
+        end
+        local requeued = 0
+        local item = redis.call('RPOP', KEYS[1])
+        while item do
+            if item ~= ARGV[2] then
+                local org_id = cjson.decode(item)['org_id']
+                if redis.call(ARGV[3], ARGV[1] .. org_id, item) == 1 then
+                    redis.call('RPUSH', KEYS[3], org_id)
+                end
+                requeued = requeued + 1
+            end
+            redis.call('LPUSH', KEYS[2], ARGV[2])
+            item = redis.call('RPOP', KEYS[1])
+        end
+        return requeued
+    """
+
+    def __init__(self, redis_client, max_size):
+        self._redis = redis_client
+        self._max_size = max_size
+        self._enqueue_script = self._redis.register_script(self._ENQUEUE_SCRIPT)
+        self._take_script = self._redis.register_script(self._TAKE_SCRIPT)
+        self._requeue_script = self._redis.register_script(self._REQUEUE_SCRIPT)
+        self._stats_lock = threading.Lock()
+        self._enqueued = 0
+        self._rejected = 0
+
+    @classmethod
+    def get_processing_list_name(cls, consumer_name):
+        """
+        Returns:
+            str: Name of the list holding the job that the consumer is processing.
+        """
+        return cls.REDIS_PROCESSING_PREFIX + consumer_name
+
+    @classmethod
+    def get_worker_lease_name(cls, worker_id):
+        """
+        Returns:
+            str: Name of the key that exists while the worker holds its lease.
+        """
+        return cls.REDIS_WORKER_LEASE_PREFIX + worker_id
+
+    @classmethod
+    def get_org_queue_name(cls, org_id):
+        """
+        Returns:
+            str: Name of the list holding the organization's jobs.
+        """
+        return cls.REDIS_ORG_QUEUE_PREFIX + org_id
+
+    def enqueue(self, url, data, token, request_id, org_id): #pylint: disable=too-many-arguments
+        """Puts a call to another service in the queue. The arguments are the fields
+        of `ServiceCall`.
+
+        Raises:
+            `QueueFullError`: When the queue is full.
+        """
+        job = json.dumps(ServiceCall(url, data, token, request_id, org_id, time.time())._asdict())
+        pushed = self._enqueue_script(
+            keys=[self.REDIS_TOKENS_NAME, self.REDIS_ACTIVE_ORGS_NAME,
+                  self.get_org_queue_name(org_id)],
+            args=[job, self._max_size, org_id, self.TOKEN])
+        with self._stats_lock:
+            if not pushed:
+                self._rejected += 1
+                raise QueueFullError('Queue of calls to other services is full.')
+            self._enqueued += 1
+
+    def take(self, consumer_name, timeout):
+        """Takes the oldest job of the organization whose turn it is, waiting for one
+        if the queue is empty. The job stays in the consumer's processing list until `finish`
+        (or `postpone`) is called. A job still there when the consumer takes the next one
+        is put back in the queue.
+
+        Args:
+            consumer_name (str): Unique name of the consumer: "<worker ID>:<consumer number>".
+                The consumer's worker needs to hold a lease (see `renew_lease`),
+                otherwise its jobs can be taken away by `requeue_abandoned`.
+            timeout (int): Seconds to wait for a job.
+
+        Returns:
+            ServiceCall: The job or None, if there was none until the timeout.
+        """
+        processing_list = self.get_processing_list_name(consumer_name)
+        # The consumer is registered before it gets a token, so that a token left in its list
+        # can always be found by `requeue_abandoned`.
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.sadd(self.REDIS_CONSUMERS_NAME, consumer_name)
+        pipe.brpoplpush(self.REDIS_TOKENS_NAME, processing_list, timeout)
+        if pipe.execute()[1] is None:
+            return None
+        job = self._take_script(
+            keys=[processing_list, self.REDIS_ACTIVE_ORGS_NAME, self.REDIS_TOKENS_NAME,
+                  self.REDIS_CONSUMERS_NAME],
+            args=[self.REDIS_ORG_QUEUE_PREFIX, self.TOKEN, consumer_name])
+        if job is None:
+            return None
+        return ServiceCall(**json.loads(job.decode()))
+
+    def finish(self, consumer_name):
+        """Removes the job the consumer was processing.
+
+        Args:
+            consumer_name (str): Name of the consumer that took the job.
+        """
+        self._redis.delete(self.get_processing_list_name(consumer_name))
+
+    def renew_lease(self, worker_id, ttl):
+        """Takes or extends the worker's lease, which protects the jobs taken by its consumers
+        from being put back in the queue.
+
+        Args:
+            worker_id (str): ID of the worker, unique to its process.
+            ttl (int): Seconds after which the lease expires, unless it's renewed.
+        """
+        self._redis.set(self.get_worker_lease_name(worker_id), 1, ex=ttl)
+
+    def release_lease(self, worker_id):
+        """Gives up the worker's lease, so that jobs left by its consumers can be put back
+        in the queue at once.
+
+        Args:
+            worker_id (str): ID of the worker.
+        """
+        self._redis.delete(self.get_worker_lease_name(worker_id))
+
+    def requeue_abandoned(self):
+        """Puts the jobs left in the processing lists of the consumers of workers without
+        a lease back in the queue, at the front of their organizations' lists.
+
+        Returns:
+            int: Number of jobs put back.
+        """
+        requeued = 0
+        for consumer_name in self._redis.smembers(self.REDIS_CONSUMERS_NAME):
+            consumer_name = consumer_name.decode()
+            worker_id, _, _ = consumer_name.rpartition(':')
+            requeued += self._requeue_script(
+                keys=[self.get_processing_list_name(consumer_name),
+                      self.REDIS_TOKENS_NAME, self.REDIS_ACTIVE_ORGS_NAME,
+                      self.get_worker_lease_name(worker_id), self.REDIS_CONSUMERS_NAME],
+                args=[self.REDIS_ORG_QUEUE_PREFIX, self.TOKEN, 'RPUSH', consumer_name])
+        return requeued
+
+    def postpone(self, consumer_name):
+        """Puts the job the consumer took back in the queue, behind the other jobs
+        of its organization. It's for jobs that can't be done now (e.g. because the called
+        service is busy), so that they don't hold up the jobs behind them.
+
+        Args:
+            consumer_name (str): Name of the consumer that took the job.
+        """
+        self._requeue_script(
+            keys=[self.get_processing_list_name(consumer_name),
+                  self.REDIS_TOKENS_NAME, self.REDIS_ACTIVE_ORGS_NAME],
+            args=[self.REDIS_ORG_QUEUE_PREFIX, self.TOKEN, 'LPUSH'])
+
+    def report_worker_stats(self, worker_id, worker_stats, ttl):
+        """Saves the statistics of a worker, so that they can be read by other processes.
+
+        Args:
+            worker_id (str): ID of the worker.
+            worker_stats (dict): JSON-serializable statistics.
+            ttl (int): Seconds after which the statistics expire, unless they're reported again.
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.sadd(self.REDIS_WORKERS_NAME, worker_id)
+        pipe.set(self.REDIS_WORKER_STATS_PREFIX + worker_id, json.dumps(worker_stats), ex=ttl)
+        pipe.execute()
+
+    def get_worker_stats(self):
+        """
+        Returns:
+            dict: IDs of the workers mapped to their last reported statistics.
+                Workers whose statistics expired are removed from the set of workers.
+        """
+        worker_ids = [worker_id.decode()
+                      for worker_id in self._redis.smembers(self.REDIS_WORKERS_NAME)]
+        if not worker_ids:
+            return {}
+        values = self._redis.mget([self.REDIS_WORKER_STATS_PREFIX + worker_id
+                                   for worker_id in worker_ids])
+        expired = [worker_id for worker_id, value in zip(worker_ids, values) if value is None]
+        if expired:
+            self._redis.srem(self.REDIS_WORKERS_NAME, *expired)
+        return {worker_id: json.loads(value.decode())
+                for worker_id, value in zip(worker_ids, values)
+                if value is not None}
+
+    def get_org_stats(self):
+        """
+        Returns:
+            dict: IDs of the organizations having jobs in the queue mapped to the numbers
+                of their jobs and to how long (in seconds) their oldest jobs have been waiting.
+        """
+        org_ids = [org_id.decode()
+                   for org_id in self._redis.lrange(self.REDIS_ACTIVE_ORGS_NAME, 0, -1)]
+        pipe = self._redis.pipeline(transaction=False)
+        for org_id in org_ids:
+            pipe.llen(self.get_org_queue_name(org_id))
+            pipe.lindex(self.get_org_queue_name(org_id), -1)
+        results = pipe.execute()
+        now = time.time()
+        org_stats = {}
+        for org_id, queue_depth, oldest_job in zip(org_ids, results[::2], results[1::2]):
+            if not queue_depth:
+                continue
+            enqueued_at = json.loads(oldest_job.decode())['enqueued_at']
+            org_stats[org_id] = {
+                'queue_depth': queue_depth,
+                'oldest_job_wait_time': max(0.0, now - enqueued_at),
+            }
+        return org_stats
+
+    def stats(self):
+        """
+        Returns:
+            dict: Depth of the queue (overall and per organization), the counts of jobs enqueued
+                and rejected by this process and the statistics reported by the workers.
+        """
+        queue_depth = self._redis.llen(self.REDIS_TOKENS_NAME)
+        org_stats = self.get_org_stats()
+        worker_stats = self.get_worker_stats()
+        with self._stats_lock:
+            return {
+                'queue_depth': queue_depth,
+                'max_queue_size': self._max_size,
+                'enqueued': self._enqueued,
+                'rejected': self._rejected,
+                'orgs': org_stats,
+                'workers': worker_stats,
+            }
@@ -0,0 +1,163 @@
+"""
+In-process caching of acquisition requests.
+"""
+
+import logging
+import threading
+import time
+
+import redis
+
+from .acquisition_request import AcquisitionRequestStore
+from .cf_app_utils import LruCache
+
+
+class CachedAcquisitionRequestStore(AcquisitionRequestStore):
+    """`AcquisitionRequestStore` with a read-through cache of single requests and of the request lists
+    of organizations in front of `get` and `get_for_orgs`.
+
+    Cache entries are invalidated when a request changes, whether it's changed by this store
+    or by one in another process. The latter is learned from the store's pub/sub channel,
+    which is listened to after calling `start_invalidation_listener`.
+    Until the listener subscribes, and whenever it stops listening (because of a lost connection
+    or any other error), the whole cache is dropped, because some invalidations could have been
+    missed. If the listener's thread ends, nothing is cached anymore.
+
+    Returned requests are shared with the cache, so they mustn't be modified.
+
+    Args:
+        redis_client (`redis.Redis`): Redis client.
+        max_size (int): Maximum number of cached requests. An organization's list counts
+            as many requests as it holds (and at least one). Longer lists aren't cached.
+        ttl (float): Seconds after which a cache entry expires, no matter if it was invalidated.
+    """
+
+    RECONNECT_DELAY = 1.0
+
+    def __init__(self, redis_client, max_size, ttl=None):
+        super().__init__(redis_client)
+        self._cache = LruCache(max_size, ttl)
+        # Incremented on every invalidation. Results of reads that overlapped with one aren't cached,
+        # because they could be stale already.
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+        self._listener_stopped = False
+        self._invalidations = 0
+        self._log = logging.getLogger(type(self).__name__)
+
+    def start_invalidation_listener(self):
+        """Starts a daemon thread that listens for changes of the requests made in other processes.
+        """
+        listener = threading.Thread(target=self._listen_for_invalidations,
+                                    name='requests-cache-invalidation',
+                                    daemon=True)
+        listener.start()
+
+    def get(self, req_id):
+        acquisition_req = self._cache.get(('request', req_id))
+        if acquisition_req is None:
+            generation = self._generation
+            acquisition_req = super().get(req_id)
+            self._cache_put(('request', req_id), acquisition_req, generation)
+        return acquisition_req
+
+    def get_for_orgs(self, org_ids):
+        requests_by_org = {}
+        missing_orgs = []
+        for org_id in org_ids:
+            if org_id in requests_by_org or org_id in missing_orgs:
+                continue
+            org_requests = self._cache.get(('org', org_id))
+            if org_requests is None:
+                missing_orgs.append(org_id)
+            else:
+                requests_by_org[org_id] = org_requests
+
+        if missing_orgs:
+            generation = self._generation
+            fetched_by_org = {org_id: [] for org_id in missing_orgs}
+            for acquisition_req in super().get_for_orgs(missing_orgs):
+                fetched_by_org[acquisition_req.orgUUID].append(acquisition_req)
+            for org_id, org_requests in fetched_by_org.items():
+                self._cache_put(('org', org_id), org_requests, generation,
+                                size=max(1, len(org_requests)))
+            requests_by_org.update(fetched_by_org)
+
+        return [acquisition_req for org_id in org_ids for acquisition_req in requests_by_org[org_id]]
+
+    def put(self, acquisition_req):
+        super().put(acquisition_req)
+        self._invalidate(self.get_request_redis_id(acquisition_req))
+
+    def transition(self, req_id, new_state):
+        acquisition_req = super().transition(req_id, new_state)
+        self._invalidate(self.get_request_redis_id(acquisition_req))
+        return acquisition_req
+
+    def delete(self, acquisition_req):
+        super().delete(acquisition_req)
+        self._invalidate(self.get_request_redis_id(acquisition_req))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Statistics of the cache, including the hit and miss counts.
+        """
+        cache_stats = self._cache.stats()
+        cache_stats['invalidations'] = self._invalidations
+        return cache_stats
+
+    def _cache_put(self, key, value, generation, size=1):
+        """Caches a value read from Redis if no invalidation happened since the read started.
+
+        Args:
+            key (tuple): Cache key.
+            value: The value read.
+            generation (int): Value of the generation counter from before the read.
+            size (int): Number of requests in the value.
+        """
+        with self._generation_lock:
+            if generation == self._generation and not self._listener_stopped:
+                self._cache.put(key, value, size=size)
+
+    def _invalidate(self, request_redis_id):
+        """Removes the cached request and the cached list of its organization.
+
+        Args:
+            request_redis_id (str): The "<org UUID>:<request ID>" field of the request.
+        """
+        org_id, req_id = request_redis_id.split(':', 1)
+        with self._generation_lock:
+            self._generation += 1
+            self._invalidations += 1
+            self._cache.pop(('request', req_id))
+            self._cache.pop(('org', org_id))
+
+    def _invalidate_all(self):
+        with self._generation_lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _listen_for_invalidations(self):
+        try:
+            while True:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                try:
+                    pubsub.subscribe(self.REDIS_INVALIDATION_CHANNEL)
+                    self._invalidate_all()
+                    for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            self._invalidate(message['data'].decode())
+                except redis.exceptions.RedisError:
+                    self._log.exception('Lost connection to the requests invalidation channel.')
+                except Exception: #pylint: disable=broad-except
+                    self._log.exception('Unexpected error when listening for invalidations.')
+                finally:
+                    self._invalidate_all()
+                    pubsub.reset()
+                time.sleep(self.RECONNECT_DELAY)
+        finally:
+            self._log.error('Stopped listening for invalidations, requests are no longer cached.')
+            with self._generation_lock:
+                self._listener_stopped = True
+            self._invalidate_all()
@@ -2,20 +2,19 @@
 REST resources of the app.
 """
 
-import itertools
 import json
 import logging
 from urllib.parse import urljoin
 
 from cerberus import Validator
 import falcon
-import requests
 
-from .acquisition_request import AcquisitionRequest, RequestNotFoundError
-from .consts import DOWNLOAD_CALLBACK_PATH, METADATA_PARSER_CALLBACK_PATH
-from .cf_app_utils.auth.falcon import FalconUserOrgAccessChecker
-
-LOG = logging.getLogger(__name__)
+from .acquisition_request import (AcquisitionRequest, RequestNotFoundError, InvalidCursorError,
+                                  RequestIdTakenError, RequestState)
+from .consts import (DOWNLOAD_CALLBACK_PATH, METADATA_PARSER_CALLBACK_PATH, NEXT_CURSOR_HEADER,
+                     IDEMPOTENCY_KEY_HEADER, IDEMPOTENT_REPLAYED_HEADER)
+from .cf_app_utils.auth.falcon import FalconUserOrgAccessChecker, get_token_claims
+from .job_queue import QueueFullError
 
 
 def get_download_callback_url(das_url, req_id):
@@ -36,22 +35,47 @@ def get_metadata_callback_url(das_url, req_id):
     return urljoin(das_url, METADATA_PARSER_CALLBACK_PATH.format(req_id=req_id))
 
 
+def _to_json_array(acquisition_requests):
+    """
+    :param Iterable[AcquisitionRequest] acquisition_requests:
+    :return: JSON array with the serialized requests.
+    :rtype: str
+    """
+    return '[' + ','.join(acq_req.to_json() for acq_req in acquisition_requests) + ']'
+
+
 class DasResource:
 
     """
     Base class for other of the app's resources.
     """
 
-    def __init__(self, req_store, executor, config):
+    QUEUE_FULL_RETRY_AFTER = 10
+
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            req_store,
+            job_queue,
+            config,
+            download_coalescer=None,
+            source_cache=None):
         """
         :param `data_acquisition.acquisition_request.AcquisitionRequestStore` req_store:
-        :param `concurrent.futures.ThreadPoolExecutor` executor: Responsible for asynchronous
-            sending of messages to other services.
+        :param `data_acquisition.job_queue.RedisJobQueue` job_queue: Queue of messages
+            to other services, which are sent by the workers.
         :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `data_acquisition.download_coalescer.DownloadCoalescer` download_coalescer:
+            Makes concurrent acquisitions of the same source share a download.
+            Each acquisition gets its own download if not given.
+        :param `data_acquisition.source_cache.AcquiredSourceCache` source_cache: Cache of
+            recently downloaded sources, which aren't downloaded again. Every source is
+            downloaded if not given.
         """
         self._req_store = req_store
-        self._executor = executor
+        self._job_queue = job_queue
         self._config = config
+        self._download_coalescer = download_coalescer
+        self._source_cache = source_cache
         self._log = logging.getLogger(type(self).__name__)
 
     def _get_download_callback_url(self, req_id):
@@ -87,6 +111,18 @@ class DasResource:
             raise falcon.HTTPBadRequest('Invalid parameters', err_msg)
         return req_json
 
+    def _put_new_request(self, acquisition_req):
+        """
+        Saves a new acquisition request.
+        :param AcquisitionRequest acquisition_req:
+        :raises `falcon.HTTPConflict`: When a request of another organization has the same ID.
+        """
+        try:
+            self._req_store.put(acquisition_req)
+        except RequestIdTakenError as ex:
+            self._log.error(str(ex))
+            raise falcon.HTTPConflict('Request ID taken.', str(ex))
+
     def _enqueue_metadata_request(self, acquisition_req, id_in_object_store, req_auth):
         """
         Queues sending a request to Metadata Parser.
@@ -98,6 +134,7 @@ class DasResource:
         This must only occur when "source" is an HDFS URI.
         Metadata Parser will extract the value by itself from URI.
         :param str req_auth: Value of Authorization header, the token.
+        :raises `falcon.HTTPServiceUnavailable`: When the job queue is full.
         """
         metadata_parse_req = {
             'orgUUID': acquisition_req.orgUUID,
@@ -110,41 +147,57 @@ class DasResource:
         }
         if id_in_object_store:
             metadata_parse_req['idInObjectStore'] = id_in_object_store
-        self._executor.submit(
-            self._external_service_call,
+        self._enqueue_service_call(
             url=self._config.metadata_parser_url,
             data=metadata_parse_req,
             token=req_auth,
-            request_id=acquisition_req.id)
+            request_id=acquisition_req.id,
+            org_id=acquisition_req.orgUUID)
+
+    def _complete_download(self, req_id):
+        """
+        Ends the download started by the request.
+        :param str req_id: ID of the acquisition request that started the download.
+        :return: Requests that waited for the download.
+        :rtype: list[`data_acquisition.download_coalescer.WaitingRequest`]
+        """
+        if not self._download_coalescer:
+            return []
+        return self._download_coalescer.complete(req_id)
+
+    def _fail_waiting_requests(self, waiting_requests):
+        """
+        Marks the requests that waited for a failed download as failed.
+        :param list[`data_acquisition.download_coalescer.WaitingRequest`] waiting_requests:
+        """
+        for waiting_request in waiting_requests:
+            try:
+                self._req_store.transition(waiting_request.request_id, RequestState.ERROR)
+            except RequestNotFoundError:
+                self._log.warning('Request %s deleted while waiting for a download.',
+                                  waiting_request.request_id)
 
-    def _external_service_call(self, url, data, token, request_id):
+    def _enqueue_service_call(self, url, data, token, request_id, org_id):
         """
-        Sends a request to an external service.
+        Queues a request to an external service, it will be sent by a worker.
         :param str url: URL for the call.
         :param dict data: The data to be sent.
         :param str token: User's OAuth token.
         :param str request_id: ID of an `AcquisitionRequest` that will be marked as failed if
             the call to the external service fails.
-        :returns: True when request succeeds, false otherwise.
-        :rtype: bool
+        :param str org_id: ID of the request's organization. Organizations' calls
+            take turns in the queue.
+        :raises `falcon.HTTPServiceUnavailable`: When the job queue is full.
         """
         try:
-            resp = requests.post(url, json=data, headers={'Authorization': token})
-            if resp.ok:
-                LOG.info('Successful request to %s with data %s', url, data)
-                return True
-            else:
-                LOG.error(
-                    'Request failed:\nURL: %s\ndata: %s\nrequest ID: %s\nservice response:%s',
-                    url, data, request_id, resp.text)
-        except requests.exceptions.ConnectionError:
-            LOG.exception('Error when sending a request:\nURL: %s\ndata: %s\nrequest ID: %s',
-                          url, data, request_id)
-
-        acquisition_req = self._req_store.get(request_id)
-        acquisition_req.set_error()
-        self._req_store.put(acquisition_req)
-        return False
+            self._job_queue.enqueue(url, data, token, request_id, org_id)
+        except QueueFullError as ex:
+            self._log.error('Call to %s rejected: %s', url, ex)
+            raise falcon.HTTPServiceUnavailable(
+                'Service overloaded.',
+                'Too many requests are waiting to be sent to other services.',
+                self.QUEUE_FULL_RETRY_AFTER
+            ) from ex
 
 
 class AcquisitionResource(DasResource):
@@ -153,74 +206,250 @@ class AcquisitionResource(DasResource):
     Resource governing data acquisition (download) requests.
     """
 
-    def __init__(self, req_store, executor, config):
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    STREAM_BATCH_SIZE = 500
+    MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            req_store,
+            job_queue,
+            config,
+            org_checker=None,
+            download_coalescer=None,
+            source_cache=None):
         """
         :param `.acquisition_request.AcquisitionRequestStore` req_store:
-        :param `rq.Queue` executor:
+        :param `.job_queue.RedisJobQueue` job_queue:
         :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `FalconUserOrgAccessChecker` org_checker: Checker of users' access to
+            organizations, possibly shared with other resources. A new one is created if not given.
+        :param `.download_coalescer.DownloadCoalescer` download_coalescer:
+        :param `.source_cache.AcquiredSourceCache` source_cache:
         """
-        super().__init__(req_store, executor, config)
+        super().__init__(req_store, job_queue, config, download_coalescer, source_cache)
         self._download_req_validator = Validator(schema={
             'category': {'type': 'string', 'required': True},
             'orgUUID': {'type': 'string', 'required': True},
             'publicRequest': {'type': 'boolean', 'required': True},
             'source': {'type': 'string', 'required': True},
             'title': {'type': 'string', 'required': True},
+            'state': {'type': 'string', 'allowed': [state.value for state in RequestState]},
+            'timestamps': {
+                'type': 'dict',
+                'keyschema': {'type': 'string',
+                              'allowed': [state.value for state in RequestState]},
+                'valueschema': {'type': 'integer'},
+            },
         })
         self._download_req_validator.allow_unknown = True
-        self._org_checker = FalconUserOrgAccessChecker(config.user_management_url)
+        self._org_checker = org_checker or FalconUserOrgAccessChecker(config.user_management_url)
 
     def on_post(self, req, resp):
         """
         Request acquisition (download) of a data set into the platform.
         Acquisition is an asynchronous operation.
+        A request submitted again with the same idempotency key (in a header) isn't processed
+        again, the originally submitted request is returned.
         :param `falcon.Request` req:
         :param `falcon.Response` resp:
         """
         acquisition_req = self._get_acquisition_req(req)
-        self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID])
-
-        self._process_acquisition_request(acquisition_req, req.auth)
+        self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID],
+                                          get_token_claims(req))
+
+        idempotency_key = self._get_idempotency_key(req)
+        if idempotency_key:
+            original_req = self._claim_idempotency_key(acquisition_req, idempotency_key)
+            if original_req:
+                resp.body = original_req.to_json()
+                resp.status = falcon.HTTP_ACCEPTED
+                resp.set_header(IDEMPOTENT_REPLAYED_HEADER, 'true')
+                return
 
-        resp.body = str(acquisition_req)
+        try:
+            self._process_acquisition_request(acquisition_req, req.auth)
+        except Exception:
+            if idempotency_key:
+                self._req_store.release_idempotency_key(acquisition_req.orgUUID, idempotency_key,
+                                                        acquisition_req.id)
+            raise
+
+        resp.body = acquisition_req.to_json()
         resp.status = falcon.HTTP_ACCEPTED
 
+    def _get_idempotency_key(self, req):
+        """
+        :param `falcon.Request` req:
+        :return: The idempotency key sent with the request or None, if there's none
+            or idempotency keys are disabled.
+        :rtype: str
+        :raises `falcon.HTTPBadRequest`: When the key is too long.
+        """
+        if not self._config.idempotency_key_ttl:
+            return None
+        idempotency_key = req.get_header(IDEMPOTENCY_KEY_HEADER)
+        if idempotency_key and len(idempotency_key) > self.MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise falcon.HTTPInvalidHeader(
+                'Longer than {} characters.'.format(self.MAX_IDEMPOTENCY_KEY_LENGTH),
+                IDEMPOTENCY_KEY_HEADER)
+        return idempotency_key
+
+    def _claim_idempotency_key(self, acquisition_req, idempotency_key):
+        """
+        :param AcquisitionRequest acquisition_req: The new request.
+        :param str idempotency_key: Key sent with the request.
+        :return: The request originally submitted with the key or None, if the key is new.
+        :rtype: AcquisitionRequest
+        :raises `falcon.HTTPConflict`: When the original request isn't stored, because
+            it's still being submitted or it was deleted.
+        """
+        claim_result = self._req_store.claim_idempotency_key(
+            acquisition_req.orgUUID, idempotency_key, acquisition_req.id,
+            self._config.idempotency_key_ttl)
+        if claim_result is None:
+            return None
+        original_req_id, original_req = claim_result
+        if original_req is None:
+            raise falcon.HTTPConflict(
+                'Idempotency key already used.',
+                'Request {} submitted with the key is being processed or was deleted.'.format(
+                    original_req_id))
+        self._log.info('Request %s submitted again with idempotency key %s.',
+                       original_req_id, idempotency_key)
+        return original_req
+
     def on_get(self, req, resp):
         """
         Get acquisitions requests belonging to specific organizations,
         specified by a query parameter.
+        The requests can be paged through with "limit" and "cursor" query parameters,
+        the cursor for the next page is returned in a header.
+        With "stream" query parameter set to true, all requests are streamed in a JSON array
+        that is built while they're being read from the store.
         :param `falcon.Request` req:
         :param `falcon.Response` resp:
         """
         requested_orgs = req.params['orgs']
         if isinstance(requested_orgs, str): # only one org submitted
             requested_orgs = [requested_orgs]
-        self._org_checker.validate_access(req.auth, requested_orgs)
+        self._org_checker.validate_access(req.auth, requested_orgs, get_token_claims(req))
+
+        if req.get_param_as_bool('stream'):
+            resp.stream = self._stream_requests(requested_orgs)
+        elif 'limit' in req.params or 'cursor' in req.params:
+            self._get_requests_page(req, resp, requested_orgs)
+        else:
+            acquisition_requests = self._req_store.get_for_orgs(requested_orgs)
+            resp.body = _to_json_array(acquisition_requests)
 
-        acquisition_request_lists = [self._req_store.get_for_org(org) for org in requested_orgs]
-        acquisition_requests = itertools.chain(*acquisition_request_lists)
-        resp.body = json.dumps([acq_req.__dict__ for acq_req in acquisition_requests])
+    def _get_requests_page(self, req, resp, org_ids):
+        """
+        Puts a page of the organizations' requests in the response.
+        :param `falcon.Request` req:
+        :param `falcon.Response` resp:
+        :param list[str] org_ids: Organizations whose requests are being paged through.
+        :raises `falcon.HTTPBadRequest`: When the pagination parameters are invalid.
+        """
+        limit = req.get_param_as_int('limit', min=1, max=self.MAX_PAGE_SIZE)
+        try:
+            acquisition_requests, next_cursor = self._req_store.get_page_for_orgs(
+                org_ids,
+                cursor=req.get_param('cursor'),
+                limit=limit or self.DEFAULT_PAGE_SIZE)
+        except InvalidCursorError as ex:
+            raise falcon.HTTPInvalidParam(str(ex), 'cursor') from ex
+
+        if next_cursor:
+            resp.set_header(NEXT_CURSOR_HEADER, next_cursor)
+        resp.body = _to_json_array(acquisition_requests)
+
+    def _stream_requests(self, org_ids):
+        """
+        Generates a JSON array with the organizations' requests in chunks,
+        one for each batch read from the store.
+        :param list[str] org_ids: Organizations whose requests will be streamed.
+        :rtype: Iterator[bytes]
+        """
+        yield b'['
+        separator = b''
+        cursor = None
+        while True:
+            acquisition_requests, cursor = self._req_store.get_page_for_orgs(
+                org_ids, cursor=cursor, limit=self.STREAM_BATCH_SIZE)
+            if acquisition_requests:
+                yield separator + _to_json_array(acquisition_requests)[1:-1].encode()
+                separator = b','
+            if cursor is None:
+                break
+        yield b']'
 
     def _get_acquisition_req(self, req):
         """
         :param `falcon.Request` req:
-        :returns: A parsed acquisition request sent to the service.
+        :returns: A parsed acquisition request sent to the service. It gets a new ID,
+            the one sent by the client (if any) is ignored.
         :rtype: `.acquisition_request.AcquisitionRequestStore`
         :raises `falcon.HTTPBadRequest`: When the request is invalid.
         """
         req_json = self._parse_request(req, self._download_req_validator, 'download')
+        req_json.pop('id', None)
         acquisition_req = AcquisitionRequest(**req_json)
         acquisition_req.set_validated()
         return acquisition_req
 
     def _process_acquisition_request(self, acquisition_req, request_auth_header):
-        if acquisition_req.source.startswith('hdfs://'):
+        """
+        Saves the request and queues sending it to the right service.
+        Sources in HDFS and sources downloaded recently go straight to Metadata Parser.
+        If the source is already being downloaded for another request, the request waits
+        for that download instead.
+        :param AcquisitionRequest acquisition_req:
+        :param str request_auth_header: Value of Authorization header, the token.
+        :raises `falcon.HTTPServiceUnavailable`: When the job queue is full.
+            The request isn't saved then.
+        """
+        is_in_hdfs = acquisition_req.source.startswith('hdfs://')
+        acquired_source = None
+        if not is_in_hdfs and self._source_cache:
+            acquired_source = self._source_cache.get(acquisition_req.source)
+        is_downloaded = is_in_hdfs or acquired_source is not None
+        if is_downloaded:
             acquisition_req.set_downloaded()
-            self._req_store.put(acquisition_req)
-            self._enqueue_metadata_request(acquisition_req, None, request_auth_header)
-        else:
-            self._req_store.put(acquisition_req)
-            self._enqueue_downloader_request(acquisition_req, request_auth_header)
+        self._put_new_request(acquisition_req)
+        try:
+            if is_downloaded:
+                self._enqueue_metadata_request(
+                    acquisition_req,
+                    acquired_source.saved_object_id if acquired_source else None,
+                    request_auth_header)
+            elif not self._join_download(acquisition_req, request_auth_header):
+                self._enqueue_downloader_request(acquisition_req, request_auth_header)
+        except falcon.HTTPServiceUnavailable:
+            self._req_store.delete(acquisition_req)
+            if not is_downloaded:
+                self._fail_waiting_requests(self._complete_download(acquisition_req.id))
+            raise
+
+    def _join_download(self, acquisition_req, req_auth):
+        """
+        Makes the request wait for the download of its source, if one is in progress.
+        :param AcquisitionRequest acquisition_req:
+        :param str req_auth: Value of Authorization header, the token.
+        :return: True if the request waits for a download started for another request,
+            False if the request needs to start the download.
+        :rtype: bool
+        """
+        if not self._download_coalescer:
+            return False
+        download_id = self._download_coalescer.join(acquisition_req.source, acquisition_req.id,
+                                                    req_auth)
+        if download_id is None:
+            return False
+        self._log.info('Request %s waits for the download of %s started for request %s.',
+                       acquisition_req.id, acquisition_req.source, download_id)
+        return True
 
     def _enqueue_downloader_request(self, acquisition_req, req_auth):
         """
@@ -229,16 +458,17 @@ class AcquisitionResource(DasResource):
         and call a callback on this app.
         :param AcquisitionRequest acquisition_req:
         :param str req_auth: Value of Authorization header, the token.
+        :raises `falcon.HTTPServiceUnavailable`: When the job queue is full.
         """
-        self._executor.submit(
-            self._external_service_call,
+        self._enqueue_service_call(
             url=self._config.downloader_url,
             data={
                 'source': acquisition_req.source,
                 'callback': self._get_download_callback_url(acquisition_req.id)
             },
             token=req_auth,
-            request_id=acquisition_req.id)
+            request_id=acquisition_req.id,
+            org_id=acquisition_req.orgUUID)
 
 
 class RequestManagementResource():
@@ -247,13 +477,15 @@ class RequestManagementResource():
     Resource for getting and deleting a single acquisition request.
     """
 
-    def __init__(self, req_store, config):
+    def __init__(self, req_store, config, org_checker=None):
         """
         :param `.acquisition_request.AcquisitionRequestStore` req_store:
         :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `FalconUserOrgAccessChecker` org_checker: Checker of users' access to
+            organizations, possibly shared with other resources. A new one is created if not given.
         """
         self._req_store = req_store
-        self._org_checker = FalconUserOrgAccessChecker(config.user_management_url)
+        self._org_checker = org_checker or FalconUserOrgAccessChecker(config.user_management_url)
 
     def on_get(self, req, resp, req_id):
         """
@@ -264,8 +496,9 @@ class RequestManagementResource():
         """
         try:
             acquisition_req = self._req_store.get(req_id)
-            self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID])
-            resp.body = str(acquisition_req)
+            self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID],
+                                              get_token_claims(req))
+            resp.body = acquisition_req.to_json()
         except RequestNotFoundError:
             resp.status = falcon.HTTP_NOT_FOUND
 
@@ -278,25 +511,93 @@ class RequestManagementResource():
         """
         try:
             acquisition_req = self._req_store.get(req_id)
-            self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID])
+            self._org_checker.validate_access(req.auth, [acquisition_req.orgUUID],
+                                              get_token_claims(req))
             self._req_store.delete(acquisition_req)
         except RequestNotFoundError:
             resp.status = falcon.HTTP_NOT_FOUND
 
 
+class AdminRequestsResource():
+
+    """
+    Resource for exporting all acquisition requests. Only available to admins.
+    """
+
+    def __init__(self, req_store, config, org_checker=None):
+        """
+        :param `.acquisition_request.AcquisitionRequestStore` req_store:
+        :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `FalconUserOrgAccessChecker` org_checker: Checker of users' access to
+            organizations, possibly shared with other resources. A new one is created if not given.
+        """
+        self._req_store = req_store
+        self._org_checker = org_checker or FalconUserOrgAccessChecker(config.user_management_url)
+
+    def on_get(self, req, resp):
+        """
+        Streams all acquisition requests as newline delimited JSON,
+        while they're being read from the store.
+        :param `falcon.Request` req:
+        :param `falcon.Response` resp:
+        """
+        self._org_checker.validate_admin_access(req.auth, get_token_claims(req))
+        resp.content_type = 'application/x-ndjson'
+        resp.stream = (acquisition_req.to_json().encode() + b'\n'
+                       for acquisition_req in self._req_store.iter_all())
+
+
+class StatsResource():
+
+    """
+    Resource exposing runtime statistics (e.g. cache hit counts) of the app's components.
+    Only available to admins.
+    """
+
+    def __init__(self, stats_sources, config, org_checker=None):
+        """
+        :param dict stats_sources: Components' names mapped to objects having
+            a `stats` method, which returns a JSON-serializable dictionary.
+        :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `FalconUserOrgAccessChecker` org_checker: Checker of users' access to
+            organizations, possibly shared with other resources. A new one is created if not given.
+        """
+        self._stats_sources = stats_sources
+        self._org_checker = org_checker or FalconUserOrgAccessChecker(config.user_management_url)
+
+    def on_get(self, req, resp):
+        """
+        Gets the statistics of all components.
+        :param `falcon.Request` req:
+        :param `falcon.Response` resp:
+        """
+        self._org_checker.validate_admin_access(req.auth, get_token_claims(req))
+        resp.body = json.dumps({name: source.stats()
+                                for name, source in self._stats_sources.items()})
+
+
 class DownloadCallbackResource(DasResource):
 
     """
     Resource accepting callbacks from the Downloader.
     """
 
-    def __init__(self, req_store, executor, config):
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            req_store,
+            job_queue,
+            config,
+            download_coalescer=None,
+            source_cache=None):
         """
         :param `.acquisition_request.AcquisitionRequestStore` req_store:
-        :param `rq.Queue` executor:
+        :param `.job_queue.RedisJobQueue` job_queue:
         :param `data_acquisition.DasConfig` config: Configuration object for the application.
+        :param `.download_coalescer.DownloadCoalescer` download_coalescer:
+        :param `.source_cache.AcquiredSourceCache` source_cache: Filled with the downloaded
+            sources.
         """
-        super().__init__(req_store, executor, config)
+        super().__init__(req_store, job_queue, config, download_coalescer, source_cache)
         self._callback_validator = Validator(schema={
             'id': {'type': 'string', 'required': True},
             'state': {'type': 'string', 'required': True},
@@ -308,25 +609,59 @@ class DownloadCallbackResource(DasResource):
     def on_post(self, req, _, req_id):
         """
         Callback after download of the data set.
-        This will trigger a request to Metadata Parser.
+        This will trigger a request to Metadata Parser for the original acquisition request
+        and for each request that waited for the download.
+        Only a failure to queue the original request's call fails the callback, so that
+        Downloader's retry of the callback doesn't start parsing for the waiting requests again
+        (those that couldn't be queued are marked as failed).
         :param `falcon.Request` req:
         :param `falcon.Response` _:
         :param str req_id: ID given to the original acquisition request
         """
         req_json = self._parse_request(req, self._callback_validator, 'download callback')
+        waiting_requests = self._complete_download(req_id)
 
-        acquisition_req = self._req_store.get(req_id)
         if req_json['state'] == 'DONE':
-            self._log.info('Acquisition request downloaded. Title: %s. ID: %s',
-                           acquisition_req.title, acquisition_req.id)
-            acquisition_req.set_downloaded()
-            self._req_store.put(acquisition_req)
-            self._enqueue_metadata_request(acquisition_req, req_json['savedObjectId'], req.auth)
+            for waiting_request in waiting_requests:
+                try:
+                    waiting_acquisition_req = self._req_store.transition(
+                        waiting_request.request_id, RequestState.DOWNLOADED)
+                    self._start_metadata_parsing(waiting_acquisition_req,
+                                                 req_json['savedObjectId'],
+                                                 waiting_request.token)
+                except RequestNotFoundError:
+                    self._log.warning('Request %s deleted while waiting for a download.',
+                                      waiting_request.request_id)
+                except falcon.HTTPServiceUnavailable:
+                    self._log.error('Job queue full, request %s waiting for a download failed.',
+                                    waiting_request.request_id)
+            acquisition_req = self._req_store.transition(req_id, RequestState.DOWNLOADED)
+            if self._source_cache:
+                self._source_cache.put(acquisition_req.source, req_json['savedObjectId'],
+                                       req_json['objectStoreId'])
+            self._start_metadata_parsing(acquisition_req, req_json['savedObjectId'], req.auth)
         else:
+            self._fail_waiting_requests(waiting_requests)
+            acquisition_req = self._req_store.transition(req_id, RequestState.ERROR)
             self._log.error('Acquisition request failed in Downloader. Title: %s. ID: %s',
                             acquisition_req.title, acquisition_req.id)
-            acquisition_req.set_error()
-            self._req_store.put(acquisition_req)
+
+    def _start_metadata_parsing(self, acquisition_req, saved_object_id, req_auth):
+        """
+        Queues the request to Metadata Parser for a downloaded acquisition request.
+        :param AcquisitionRequest acquisition_req: The request, already marked as downloaded.
+        :param str saved_object_id: ID of the downloaded file in the object store.
+        :param str req_auth: Value of Authorization header, the token.
+        :raises `falcon.HTTPServiceUnavailable`: When the job queue is full.
+            The request is marked as failed then.
+        """
+        self._log.info('Acquisition request downloaded. Title: %s. ID: %s',
+                       acquisition_req.title, acquisition_req.id)
+        try:
+            self._enqueue_metadata_request(acquisition_req, saved_object_id, req_auth)
+        except falcon.HTTPServiceUnavailable:
+            self._req_store.transition(acquisition_req.id, RequestState.ERROR)
+            raise
 
 
 class UploaderResource(DasResource):
@@ -335,13 +670,13 @@ class UploaderResource(DasResource):
     Resource accepting requests from Uploader.
     """
 
-    def __init__(self, req_store, executor, config):
+    def __init__(self, req_store, job_queue, config):
         """
         :param `.acquisition_request.AcquisitionRequestStore` req_store:
-        :param `rq.Queue` executor:
+        :param `.job_queue.RedisJobQueue` job_queue:
         :param `data_acquisition.DasConfig` config: Configuration object for the application.
         """
-        super().__init__(req_store, executor, config)
+        super().__init__(req_store, job_queue, config)
         self._uploader_req_validator = Validator(schema={
             'category': {'type': 'string', 'required': True},
             'orgUUID': {'type': 'string', 'required': True},
@@ -349,7 +684,8 @@ class UploaderResource(DasResource):
             'source': {'type': 'string', 'required': True},
             'title': {'type': 'string', 'required': True},
             'idInObjectStore': {'type': 'string', 'required': True},
-            'objectStoreId': {'type': 'string', 'required': False}
+            'objectStoreId': {'type': 'string', 'required': False},
+            'state': {'type': 'string', 'allowed': [state.value for state in RequestState]},
         })
         self._uploader_req_validator.allow_unknown = True
 
@@ -365,8 +701,12 @@ class UploaderResource(DasResource):
         acquisition_req = AcquisitionRequest(**req_json)
         acquisition_req.set_downloaded()
 
-        self._req_store.put(acquisition_req)
-        self._enqueue_metadata_request(acquisition_req, req_json['idInObjectStore'], req.auth)
+        self._put_new_request(acquisition_req)
+        try:
+            self._enqueue_metadata_request(acquisition_req, req_json['idInObjectStore'], req.auth)
+        except falcon.HTTPServiceUnavailable:
+            self._req_store.delete(acquisition_req)
+            raise
 
 
 class MetadataCallbackResource(DasResource):
@@ -397,14 +737,11 @@ class MetadataCallbackResource(DasResource):
         """
         req_json = self._parse_request(req, self._callback_validator, 'metadata callback')
 
-        acquisition_req = self._req_store.get(req_id)
         if req_json['state'] == 'DONE':
+            acquisition_req = self._req_store.transition(req_id, RequestState.FINISHED)
             self._log.info('Acquisition request successful. Title: %s. ID: %s',
                            acquisition_req.title, acquisition_req.id)
-            acquisition_req.set_finished()
-            self._req_store.put(acquisition_req)
         else:
+            acquisition_req = self._req_store.transition(req_id, RequestState.ERROR)
             self._log.error('Acquisition request failed in Metadata Parser. Title: %s. ID: %s',
                             acquisition_req.title, acquisition_req.id)
-            acquisition_req.set_error()
-            self._req_store.put(acquisition_req)
@@ -0,0 +1,119 @@
+"""
+Cache of recently acquired sources, kept in Redis.
+"""
+
+from collections import namedtuple
+import hashlib
+import json
+import threading
+import time
+
+from .download_coalescer import normalize_source
+
+
+# A source downloaded into the platform: ID of the downloaded file in the object store,
+# ID of the object store and the UNIX time of the download.
+AcquiredSource = namedtuple('AcquiredSource',
+                            ['saved_object_id', 'object_store_id', 'acquired_at'])
+
+
+class AcquiredSourceCache:
+    """Remembers where recently downloaded sources were saved, so that they don't need
+    to be downloaded again. Shared by the app's instances, so a download's callback
+    handled by any of them fills it.
+
+    Sources are compared after `download_coalescer.normalize_source`. An entry expires after
+    the TTL. When there are more entries than the maximum size, the oldest ones are removed.
+
+    Args:
+        redis_client (`redis.Redis`): Redis client.
+        max_size (int): Maximum number of sources in the cache.
+        ttl (int): Seconds after which a source is downloaded again.
+    """
+
+    REDIS_HASH_NAME = 'acquired_sources'
+    REDIS_TIMES_NAME = 'acquired_sources_by_time'
+
+    # Saves the entry and removes the expired and the oldest entries above the size limit.
+    _PUT_SCRIPT = """
+        local acquired_at, ttl, max_size = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+        redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+        redis.call('ZADD', KEYS[2], acquired_at, ARGV[1])
+        local removed = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', acquired_at - ttl)
+        local excess = redis.call('ZCARD', KEYS[2]) - #removed - max_size
+        if excess > 0 then
+            local oldest = redis.call('ZRANGE', KEYS[2], #removed, #removed + excess - 1)
+            for _, field in ipairs(oldest) do
+                table.insert(removed, field)
+            end
+        end
+        for _, field in ipairs(removed) do
+            redis.call('HDEL', KEYS[1], field)
+            redis.call('ZREM', KEYS[2], field)
+        end
+        redis.call('EXPIRE', KEYS[1], ttl)
+        redis.call('EXPIRE', KEYS[2], ttl)
+    """
+
+    def __init__(self, redis_client, max_size, ttl):
+        self._redis = redis_client
+        self._max_size = max_size
+        self._ttl = ttl
+        self._put_script = self._redis.register_script(self._PUT_SCRIPT)
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _get_field(source):
+        return hashlib.sha256(normalize_source(source).encode()).hexdigest()
+
+    def get(self, source):
+        """Takes a single round trip to Redis.
+
+        Args:
+            source (str): URL of a data set.
+
+        Returns:
+            AcquiredSource: Where the source was saved or None, if it wasn't downloaded recently.
+        """
+        entry = self._redis.hget(self.REDIS_HASH_NAME, self._get_field(source))
+        acquired_source = None
+        if entry is not None:
+            acquired_source = AcquiredSource(**json.loads(entry.decode()))
+            if acquired_source.acquired_at + self._ttl <= time.time():
+                acquired_source = None
+        with self._stats_lock:
+            if acquired_source is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return acquired_source
+
+    def put(self, source, saved_object_id, object_store_id):
+        """Remembers that the source was downloaded now.
+
+        Args:
+            source (str): URL of the data set.
+            saved_object_id (str): ID of the downloaded file in the object store.
+            object_store_id (str): ID of the object store.
+        """
+        acquired_source = AcquiredSource(saved_object_id, object_store_id, time.time())
+        self._put_script(
+            keys=[self.REDIS_HASH_NAME, self.REDIS_TIMES_NAME],
+            args=[self._get_field(source), json.dumps(acquired_source._asdict()),
+                  acquired_source.acquired_at, self._ttl, self._max_size])
+
+    def stats(self):
+        """
+        Returns:
+            dict: Number of cached sources and the counts of hits and misses in this process.
+        """
+        size = self._redis.zcard(self.REDIS_TIMES_NAME)
+        with self._stats_lock:
+            return {
+                'size': size,
+                'max_size': self._max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
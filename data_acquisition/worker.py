@@ -0,0 +1,365 @@
+"""
+Worker making the calls to other services (Downloader and Metadata Parser) queued by the app.
+It's run as a separate process, so it can be scaled independently of the web app:
+`python -m data_acquisition.worker`
+"""
+
+import logging
+import signal
+import threading
+import time
+import uuid
+
+import redis
+import requests
+
+from .acquisition_request import AcquisitionRequestStore, RequestNotFoundError, RequestState
+from .cf_app_utils import (configure_logging, AdaptiveConcurrencyLimiter, CircuitBreaker,
+                           HttpClient, RetryPolicy)
+from .config import DasConfig
+from .download_coalescer import DownloadCoalescer
+from .job_queue import RedisJobQueue
+
+
+class ServiceBusyError(Exception):
+    """
+    The called service has as many calls in flight as its concurrency limiter allows.
+    """
+    pass
+
+
+class WorkerStoppedError(Exception):
+    """
+    The worker was stopped while a job was waiting to retry its call.
+    """
+    pass
+
+
+class JobWorker:
+    """Takes calls to other services from the job queue and makes them in a number of threads.
+    Calls failing because of connection errors, timeouts or server errors are retried.
+    If a call fails for good (or its job fails unexpectedly), its acquisition request is marked
+    as failed, along with the requests that waited for the download the call was starting.
+
+    Each service can have a circuit breaker. While it's open, calls to the service fail at once,
+    without waiting for the service or retrying.
+
+    Each service can have a limiter of the calls in flight to it, which can adapt the limit
+    to the latency of the calls. The limiters are bulkheads: when a service is slow, the calls
+    to it use up only its slots, not all the threads. A job whose service doesn't give a slot
+    within `SERVICE_SLOT_TIMEOUT` (or `RETRY_SLOT_TIMEOUT` for a retry) is postponed, so
+    the thread can take a job for another service. A job waiting to retry its call when
+    the worker is stopped is postponed as well.
+
+    Args:
+        job_queue (`data_acquisition.job_queue.RedisJobQueue`): Queue with the calls.
+        req_store (`data_acquisition.acquisition_request.AcquisitionRequestStore`):
+        http_client (`data_acquisition.cf_app_utils.HttpClient`): Client for the calls.
+        concurrency (int): Number of threads taking jobs, the maximum number of calls made
+            at the same time.
+        name (str): Name of the worker. It's the prefix of the worker's ID, which is made
+            unique to the process, so workers sharing a name don't take each other's jobs.
+        retry_policy (`data_acquisition.cf_app_utils.RetryPolicy`): Retrying of failed calls.
+            If not given, calls aren't retried.
+        circuit_breakers (dict): Services' URLs mapped to their
+            `data_acquisition.cf_app_utils.CircuitBreaker` objects.
+        concurrency_limiters (dict): Services' URLs mapped to the
+            `data_acquisition.cf_app_utils.AdaptiveConcurrencyLimiter` objects limiting
+            the calls to them. Calls to a service without a limiter are only limited
+            by the number of threads.
+        download_coalescer (`data_acquisition.download_coalescer.DownloadCoalescer`): Makes
+            concurrent acquisitions of the same source share a download.
+    """
+
+    TAKE_TIMEOUT = 1
+    RECONNECT_DELAY = 1.0
+    STATS_REPORT_INTERVAL = 10.0
+    LEASE_TTL = 30
+    SERVICE_SLOT_TIMEOUT = 0.5
+    RETRY_SLOT_TIMEOUT = 10.0
+
+    def __init__( #pylint: disable=too-many-arguments
+            self,
+            job_queue,
+            req_store,
+            http_client,
+            concurrency,
+            name,
+            retry_policy=None,
+            circuit_breakers=None,
+            concurrency_limiters=None,
+            download_coalescer=None):
+        self._job_queue = job_queue
+        self._req_store = req_store
+        self._http_client = http_client
+        self._concurrency = concurrency
+        self._name = name
+        self._id = '{}.{}'.format(name, uuid.uuid4().hex)
+        self._retry_policy = retry_policy or RetryPolicy(max_attempts=1)
+        self._circuit_breakers = circuit_breakers or {}
+        self._concurrency_limiters = concurrency_limiters or {}
+        self._download_coalescer = download_coalescer
+        self._stats_lock = threading.Lock()
+        self._retries = 0
+        self._postponed = 0
+        self._org_wait_times = {}
+        self._stopped = threading.Event()
+        self._log = logging.getLogger(type(self).__name__)
+
+    def run(self):
+        """Takes the worker's lease, requeues the jobs abandoned by workers that stopped
+        without finishing them and processes the jobs until `stop` is called.
+        While running, the worker renews its lease and keeps requeuing abandoned jobs.
+        """
+        self._job_queue.renew_lease(self._id, self.LEASE_TTL)
+        self._requeue_abandoned()
+        threads = [threading.Thread(target=self._consume,
+                                    args=('{}:{}'.format(self._id, index),),
+                                    name='job-consumer-{}'.format(index))
+                   for index in range(self._concurrency)]
+        threads.append(threading.Thread(target=self._maintain, name='worker-maintenance'))
+        for thread in threads:
+            thread.start()
+        self._log.info('Worker %s started with %s consumer threads.',
+                       self._id, self._concurrency)
+        for thread in threads:
+            thread.join()
+        self._job_queue.release_lease(self._id)
+        self._log.info('Worker %s stopped.', self._id)
+
+    def stop(self):
+        """Makes the consumer threads stop after finishing their current jobs."""
+        self._stopped.set()
+
+    def _consume(self, consumer_name):
+        while not self._stopped.is_set():
+            try:
+                job = self._job_queue.take(consumer_name, self.TAKE_TIMEOUT)
+                if job is None:
+                    continue
+                taken_at = time.time()
+                try:
+                    self._call_service(job)
+                except ServiceBusyError:
+                    self._job_queue.postpone(consumer_name)
+                    with self._stats_lock:
+                        self._postponed += 1
+                    continue
+                except WorkerStoppedError:
+                    self._job_queue.postpone(consumer_name)
+                    continue
+                except Exception: #pylint: disable=broad-except
+                    self._log.exception('Unexpected error in job %s', job)
+                    try:
+                        self._fail_request(job.request_id)
+                    except RequestNotFoundError:
+                        self._log.warning('Request %s deleted before its job failed.',
+                                          job.request_id)
+                self._record_wait_time(job, taken_at)
+                self._job_queue.finish(consumer_name)
+            except redis.exceptions.RedisError:
+                self._log.exception('Error when using the job queue.')
+                self._stopped.wait(self.RECONNECT_DELAY)
+
+    def _record_wait_time(self, job, taken_at):
+        """Adds the time the job waited in the queue (until it was taken for the last time)
+        to the statistics of its organization.
+        """
+        wait_time = max(0.0, taken_at - job.enqueued_at)
+        with self._stats_lock:
+            org_wait_times = self._org_wait_times.setdefault(
+                job.org_id, {'jobs': 0, 'total_wait_time': 0.0, 'max_wait_time': 0.0})
+            org_wait_times['jobs'] += 1
+            org_wait_times['total_wait_time'] += wait_time
+            org_wait_times['max_wait_time'] = max(org_wait_times['max_wait_time'], wait_time)
+
+    def _maintain(self):
+        """Periodically renews the worker's lease, requeues the jobs abandoned by other workers
+        and puts the worker's statistics in Redis, so that the app can expose them.
+        """
+        while not self._stopped.wait(self.STATS_REPORT_INTERVAL):
+            try:
+                self._job_queue.renew_lease(self._id, self.LEASE_TTL)
+                self._requeue_abandoned()
+                self._job_queue.report_worker_stats(self._id, self.stats(),
+                                                    ttl=int(3 * self.STATS_REPORT_INTERVAL))
+            except redis.exceptions.RedisError:
+                self._log.exception("Couldn't maintain the worker's lease and statistics.")
+
+    def _requeue_abandoned(self):
+        requeued = self._job_queue.requeue_abandoned()
+        if requeued:
+            self._log.warning('Requeued %s jobs abandoned by stopped workers.', requeued)
+
+    def _call_service(self, job):
+        """Sends a request to an external service, retrying it if it fails in a way that
+        might be temporary.
+
+        Args:
+            job (`data_acquisition.job_queue.ServiceCall`): The call to make.
+
+        Returns:
+            bool: True when the request succeeds, False otherwise.
+
+        Raises:
+            ServiceBusyError: When the service's limiter doesn't give a slot in time.
+            WorkerStoppedError: When the worker is stopped before a retry.
+        """
+        circuit_breaker = self._circuit_breakers.get(job.url)
+        concurrency_limiter = self._concurrency_limiters.get(job.url)
+        for attempt in range(1, self._retry_policy.max_attempts + 1):
+            if attempt > 1:
+                if self._stopped.wait(self._retry_policy.get_delay(attempt - 1)):
+                    raise WorkerStoppedError('Worker stopped before retrying the call.')
+                with self._stats_lock:
+                    self._retries += 1
+            if concurrency_limiter and not concurrency_limiter.acquire(
+                    self.SERVICE_SLOT_TIMEOUT if attempt == 1 else self.RETRY_SLOT_TIMEOUT):
+                raise ServiceBusyError('No free slot for a call to {}'.format(job.url))
+            if circuit_breaker and not circuit_breaker.allow_request():
+                if concurrency_limiter:
+                    concurrency_limiter.release()
+                self._log.error('Circuit breaker for %s is open, request %s failed.',
+                                job.url, job.request_id)
+                break
+            try:
+                resp = self._post(job, attempt, concurrency_limiter)
+            except Exception:
+                if circuit_breaker:
+                    circuit_breaker.record_failure()
+                raise
+            server_error = resp is None or resp.status_code >= 500
+            if circuit_breaker:
+                if server_error:
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()
+            if resp is not None and resp.ok:
+                self._log.info('Successful request to %s with data %s', job.url, job.data)
+                return True
+            if resp is not None:
+                self._log.error(
+                    'Request failed (attempt %s):\nURL: %s\ndata: %s\nrequest ID: %s\n'
+                    'service response:%s', attempt, job.url, job.data, job.request_id, resp.text)
+            if not server_error:
+                break
+
+        self._fail_request(job.request_id)
+        return False
+
+    def _fail_request(self, request_id):
+        """Marks the request as failed, along with the requests that waited for the download
+        started by it.
+
+        Args:
+            request_id (str): ID of the acquisition request.
+        """
+        if self._download_coalescer:
+            for waiting_request in self._download_coalescer.complete(request_id):
+                try:
+                    self._req_store.transition(waiting_request.request_id, RequestState.ERROR)
+                except RequestNotFoundError:
+                    self._log.warning('Request %s deleted while waiting for a download.',
+                                      waiting_request.request_id)
+        self._req_store.transition(request_id, RequestState.ERROR)
+
+    def _post(self, job, attempt, concurrency_limiter):
+        """Sends the job's request.
+
+        Args:
+            job (`data_acquisition.job_queue.ServiceCall`): The call to make.
+            attempt (int): Number of the attempt, for logging.
+            concurrency_limiter (`data_acquisition.cf_app_utils.AdaptiveConcurrencyLimiter`):
+                Limiter of the service, whose slot was taken for the call. It's given
+                back with the call's outcome. Can be None.
+
+        Returns:
+            `requests.Response`: The service's response or None, if it couldn't be connected,
+                didn't respond in time or the request failed in another way.
+        """
+        start_time = time.perf_counter()
+        resp = None
+        try:
+            resp = self._http_client.post(job.url, json=job.data,
+                                          headers={'Authorization': job.token})
+        except requests.exceptions.RequestException:
+            self._log.exception(
+                'Error when sending a request (attempt %s):\nURL: %s\ndata: %s\n'
+                'request ID: %s', attempt, job.url, job.data, job.request_id)
+        finally:
+            if concurrency_limiter:
+                concurrency_limiter.release(time.perf_counter() - start_time,
+                                            failed=resp is None or resp.status_code >= 500)
+        return resp
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counts of retried calls and of jobs postponed because their services were
+                busy, the states of the circuit breakers and of the services' concurrency
+                limiters and the times jobs of each organization waited in the queue.
+        """
+        with self._stats_lock:
+            retries = self._retries
+            postponed = self._postponed
+            org_wait_times = {
+                org_id: {
+                    'jobs': org_stats['jobs'],
+                    'average_wait_time': org_stats['total_wait_time'] / org_stats['jobs'],
+                    'max_wait_time': org_stats['max_wait_time'],
+                }
+                for org_id, org_stats in self._org_wait_times.items()}
+        return {
+            'retries': retries,
+            'postponed': postponed,
+            'org_wait_times': org_wait_times,
+            'circuit_breakers': {url: circuit_breaker.stats()
+                                 for url, circuit_breaker in self._circuit_breakers.items()},
+            'concurrency': {url: concurrency_limiter.stats()
+                            for url, concurrency_limiter in self._concurrency_limiters.items()},
+        }
+
+
+def main():
+    """Runs the worker until it gets SIGTERM or SIGINT."""
+    configure_logging(logging.INFO)
+    config = DasConfig.get_config()
+
+    redis_client = redis.Redis(host=config.redis_host, port=config.redis_port,
+                               password=config.redis_password, db=0)
+    http_client = HttpClient(max(config.http_pool_size, config.worker_max_concurrency),
+                             connect_timeout=config.http_connect_timeout,
+                             read_timeout=config.http_read_timeout)
+    retry_policy = RetryPolicy(config.retry_max_attempts,
+                               config.retry_base_delay,
+                               config.retry_max_delay)
+    concurrency_limiters = {
+        url: AdaptiveConcurrencyLimiter(config.worker_min_concurrency,
+                                        max_concurrency,
+                                        latency_tolerance=config.worker_latency_tolerance)
+        for url, max_concurrency in ((config.downloader_url, config.downloader_max_concurrency),
+                                     (config.metadata_parser_url,
+                                      config.metadata_parser_max_concurrency))}
+    circuit_breakers = {url: CircuitBreaker(config.circuit_breaker_failure_threshold,
+                                            config.circuit_breaker_reset_timeout)
+                        for url in (config.downloader_url, config.metadata_parser_url)}
+    download_coalescer = None
+    if config.download_coalescing_ttl:
+        download_coalescer = DownloadCoalescer(redis_client, config.download_coalescing_ttl)
+    worker = JobWorker(RedisJobQueue(redis_client, config.job_queue_size),
+                       AcquisitionRequestStore(redis_client),
+                       http_client,
+                       config.worker_max_concurrency,
+                       config.worker_name,
+                       retry_policy,
+                       circuit_breakers,
+                       concurrency_limiters,
+                       download_coalescer)
+
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -48,8 +48,13 @@ docker start $CONTAINER
 # TODO wait for the docker to fully start
 sleep 1
 
+python -m data_acquisition.worker &
+WORKER_PID=$!
+
 # Parallelized option
 # gunicorn 'data_acquisition.app:get_app()' --bind :$VCAP_APP_PORT --enable-stdio-inheritance --workers `nproc`
 gunicorn 'data_acquisition.app:get_app()' --bind :$VCAP_APP_PORT --enable-stdio-inheritance
 
+kill $WORKER_PID
+wait $WORKER_PID
 docker rm -f $CONTAINER
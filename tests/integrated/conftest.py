@@ -1,5 +1,6 @@
 import json
 import os
+import subprocess
 import sys
 import time
 import yaml
@@ -211,8 +212,27 @@ def das_session(vcap_services, uaa_imposter):
     das_service.stop()
 
 
+@pytest.yield_fixture(scope='session')
+def das_worker(vcap_services):
+    """
+    Process of the worker making the calls to Downloader and Metadata Parser queued by DAS.
+    """
+    project_root_path = os.path.dirname(tests.__path__[0])
+    worker_process = subprocess.Popen(
+        [sys.executable, '-m', 'data_acquisition.worker'],
+        env=dict(os.environ,
+                 VCAP_APPLICATION=json.dumps({'uris': []}),
+                 VCAP_SERVICES=vcap_services,
+                 VCAP_APP_PORT='0',
+                 PYTHONPATH=project_root_path))
+    yield worker_process
+    worker_process.terminate()
+    worker_process.wait()
+
+
 @pytest.fixture(scope='function')
 def das(das_session,
+        das_worker,
         downloader_imposter,
         metadata_parser_imposter,
         user_management_imposter):
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from data_acquisition.download_coalescer import DownloadCoalescer, WaitingRequest
+
+SOURCE = 'http://some-source/data.csv'
+
+
+@pytest.fixture
+def download_coalescer(redis_client):
+    return DownloadCoalescer(redis_client, ttl=60)
+
+
+def test_first_request_starts_download(download_coalescer):
+    assert download_coalescer.join(SOURCE, 'id-1', 'bearer token-1') is None
+
+    assert download_coalescer.complete('id-1') == []
+
+
+def test_requests_wait_for_download(download_coalescer):
+    download_coalescer.join(SOURCE, 'id-1', 'bearer token-1')
+
+    assert download_coalescer.join('HTTP://Some-Source:80/data.csv', 'id-2',
+                                   'bearer token-2') == 'id-1'
+    assert download_coalescer.join(SOURCE, 'id-3', 'bearer token-3') == 'id-1'
+    assert download_coalescer.join('http://other-source/', 'id-4', 'bearer token-4') is None
+
+    assert download_coalescer.complete('id-1') == [
+        WaitingRequest('id-2', 'bearer token-2'),
+        WaitingRequest('id-3', 'bearer token-3'),
+    ]
+    assert download_coalescer.stats() == {'started': 2, 'joined': 2}
+
+
+def test_completed_download_forgotten(download_coalescer, redis_client):
+    download_coalescer.join(SOURCE, 'id-1', 'bearer token-1')
+    download_coalescer.join(SOURCE, 'id-2', 'bearer token-2')
+    download_coalescer.complete('id-1')
+
+    assert not redis_client.keys('downloads:*')
+    assert download_coalescer.join(SOURCE, 'id-3', 'bearer token-3') is None
+    assert download_coalescer.complete('id-1') == []
+
+
+def test_download_expires(download_coalescer, redis_client):
+    download_coalescer.join(SOURCE, 'id-1', 'bearer token-1')
+    download_coalescer.join(SOURCE, 'id-2', 'bearer token-2')
+
+    for key in [DownloadCoalescer.get_source_key(SOURCE),
+                DownloadCoalescer.REDIS_DOWNLOAD_SOURCE_PREFIX + 'id-1']:
+        assert 0 < redis_client.ttl(key) <= 60
+    waiting_key = DownloadCoalescer.REDIS_WAITING_PREFIX + 'id-1'
+    assert redis_client.exists(waiting_key)
+    assert redis_client.ttl(waiting_key) is None
+
+
+def test_download_completed_after_ttl(redis_client):
+    download_coalescer = DownloadCoalescer(redis_client, ttl=1)
+    download_coalescer.join(SOURCE, 'id-1', 'bearer token-1')
+    download_coalescer.join(SOURCE, 'id-2', 'bearer token-2')
+
+    time.sleep(1.1)
+
+    assert download_coalescer.join(SOURCE, 'id-3', 'bearer token-3') is None
+    assert download_coalescer.complete('id-1') == [WaitingRequest('id-2', 'bearer token-2')]
+    assert download_coalescer.join(SOURCE, 'id-4', 'bearer token-4') == 'id-3'
+
+
+def test_new_download_not_forgotten_by_expired_one(download_coalescer, redis_client):
+    download_coalescer.join(SOURCE, 'id-1', 'bearer token-1')
+    redis_client.delete(DownloadCoalescer.get_source_key(SOURCE))
+    download_coalescer.join(SOURCE, 'id-2', 'bearer token-2')
+
+    download_coalescer.complete('id-1')
+
+    assert download_coalescer.join(SOURCE, 'id-3', 'bearer token-3') == 'id-2'
@@ -0,0 +1,188 @@
+import time
+
+import pytest
+
+from data_acquisition.job_queue import QueueFullError, RedisJobQueue
+
+DOWNLOADER_URL = 'http://fake-downloader/rest/downloader/requests'
+
+
+def _enqueue(job_queue, request_id, org_id='org-a'):
+    job_queue.enqueue(DOWNLOADER_URL, {'source': 'http://some-source/' + request_id},
+                      'bearer fake-token', request_id, org_id)
+
+
+def _take_request_id(job_queue, consumer_name='worker-0:0'):
+    """Takes a job and finishes it."""
+    job = job_queue.take(consumer_name, timeout=1)
+    if job is None:
+        return None
+    job_queue.finish(consumer_name)
+    return job.request_id
+
+
+@pytest.fixture
+def job_queue(redis_client):
+    return RedisJobQueue(redis_client, max_size=4)
+
+
+def test_job_taken(job_queue):
+    before_enqueue = time.time()
+    _enqueue(job_queue, 'fake-id')
+
+    job = job_queue.take('worker-0:0', timeout=1)
+
+    assert job.url == DOWNLOADER_URL
+    assert job.data == {'source': 'http://some-source/fake-id'}
+    assert job.token == 'bearer fake-token'
+    assert job.request_id == 'fake-id'
+    assert job.org_id == 'org-a'
+    assert before_enqueue <= job.enqueued_at <= time.time()
+
+
+def test_jobs_of_org_taken_in_order(job_queue):
+    for request_id in ['id-1', 'id-2']:
+        _enqueue(job_queue, request_id)
+
+    assert _take_request_id(job_queue) == 'id-1'
+    assert _take_request_id(job_queue) == 'id-2'
+    assert _take_request_id(job_queue) is None
+
+
+def test_orgs_take_turns(job_queue):
+    for request_id in ['a-1', 'a-2', 'a-3']:
+        _enqueue(job_queue, request_id, 'org-a')
+    _enqueue(job_queue, 'b-1', 'org-b')
+
+    assert [_take_request_id(job_queue) for _ in range(4)] == ['a-1', 'b-1', 'a-2', 'a-3']
+
+
+def test_queue_full(job_queue):
+    for index in range(4):
+        _enqueue(job_queue, 'id-{}'.format(index), 'org-{}'.format(index % 2))
+
+    with pytest.raises(QueueFullError):
+        _enqueue(job_queue, 'id-4')
+    queue_stats = job_queue.stats()
+    assert queue_stats['queue_depth'] == 4
+    assert queue_stats['max_queue_size'] == 4
+    assert queue_stats['enqueued'] == 4
+    assert queue_stats['rejected'] == 1
+    assert queue_stats['workers'] == {}
+
+
+def test_org_stats(job_queue):
+    for request_id in ['a-1', 'a-2']:
+        _enqueue(job_queue, request_id, 'org-a')
+    _enqueue(job_queue, 'b-1', 'org-b')
+    _take_request_id(job_queue)
+
+    org_stats = job_queue.stats()['orgs']
+
+    assert set(org_stats) == {'org-a', 'org-b'}
+    assert org_stats['org-a']['queue_depth'] == 1
+    assert org_stats['org-b']['queue_depth'] == 1
+    assert 0 <= org_stats['org-a']['oldest_job_wait_time'] < 5
+
+
+def test_finished_job_removed(job_queue, redis_client):
+    _enqueue(job_queue, 'fake-id')
+    job_queue.take('worker-0:0', timeout=1)
+    assert redis_client.llen(RedisJobQueue.get_processing_list_name('worker-0:0')) == 1
+
+    job_queue.finish('worker-0:0')
+
+    assert not redis_client.exists(RedisJobQueue.get_processing_list_name('worker-0:0'))
+    assert job_queue.requeue_abandoned() == 0
+    assert job_queue.stats()['queue_depth'] == 0
+
+
+def test_unfinished_job_requeued_on_next_take(job_queue, redis_client):
+    _enqueue(job_queue, 'a-1', 'org-a')
+    _enqueue(job_queue, 'b-1', 'org-b')
+    _enqueue(job_queue, 'a-2', 'org-a')
+    # the job is neither finished nor postponed, e.g. because of a Redis error
+    assert job_queue.take('worker-0:0', timeout=1).request_id == 'a-1'
+
+    assert _take_request_id(job_queue) == 'b-1'
+
+    assert not redis_client.exists(RedisJobQueue.get_processing_list_name('worker-0:0'))
+    assert job_queue.stats()['queue_depth'] == 2
+    assert _take_request_id(job_queue, 'worker-1:0') == 'a-1'
+    assert _take_request_id(job_queue, 'worker-1:1') == 'a-2'
+
+
+def test_abandoned_jobs_requeued(job_queue, redis_client):
+    _enqueue(job_queue, 'a-1', 'org-a')
+    _enqueue(job_queue, 'b-1', 'org-b')
+    _enqueue(job_queue, 'c-1', 'org-c')
+    job_queue.renew_lease('worker-1', ttl=30)
+    job_queue.renew_lease('worker-2', ttl=30)
+    job_queue.take('worker-1:0', timeout=1)
+    job_queue.take('worker-2:0', timeout=1)
+    job_queue.take('worker-2:1', timeout=1)
+
+    job_queue.release_lease('worker-2')
+    assert job_queue.requeue_abandoned() == 2
+    assert redis_client.smembers(RedisJobQueue.REDIS_CONSUMERS_NAME) == {b'worker-1:0'}
+
+    assert sorted([_take_request_id(job_queue), _take_request_id(job_queue)]) == ['b-1', 'c-1']
+    assert _take_request_id(job_queue) is None
+
+
+def test_jobs_of_worker_with_expired_lease_requeued(job_queue):
+    _enqueue(job_queue, 'a-1')
+    job_queue.renew_lease('worker-0', ttl=1)
+    job_queue.take('worker-0:0', timeout=1)
+    assert job_queue.requeue_abandoned() == 0
+
+    time.sleep(1.1)
+
+    assert job_queue.requeue_abandoned() == 1
+    assert _take_request_id(job_queue) == 'a-1'
+
+
+def test_postponed_job_behind_others_of_org(job_queue, redis_client):
+    for request_id in ['a-1', 'a-2']:
+        _enqueue(job_queue, request_id, 'org-a')
+    job_queue.take('worker-0:0', timeout=1)
+
+    job_queue.postpone('worker-0:0')
+
+    assert not redis_client.exists(RedisJobQueue.get_processing_list_name('worker-0:0'))
+    assert job_queue.stats()['queue_depth'] == 2
+    assert _take_request_id(job_queue) == 'a-2'
+    assert _take_request_id(job_queue) == 'a-1'
+
+
+def test_token_of_crashed_consumer_requeued(job_queue, redis_client):
+    _enqueue(job_queue, 'a-1')
+    # the consumer registered and took the token, but didn't get to taking the job
+    redis_client.sadd(RedisJobQueue.REDIS_CONSUMERS_NAME, 'worker-0:0')
+    redis_client.rpoplpush(RedisJobQueue.REDIS_TOKENS_NAME,
+                           RedisJobQueue.get_processing_list_name('worker-0:0'))
+
+    assert job_queue.requeue_abandoned() == 0
+
+    assert _take_request_id(job_queue) == 'a-1'
+
+
+def test_worker_stats(job_queue, redis_client):
+    job_queue.report_worker_stats('worker-0', {'retries': 1}, ttl=30)
+    job_queue.report_worker_stats('worker-1', {'retries': 2}, ttl=30)
+
+    assert job_queue.stats()['workers'] == {
+        'worker-0': {'retries': 1},
+        'worker-1': {'retries': 2},
+    }
+    assert 0 < redis_client.ttl(RedisJobQueue.REDIS_WORKER_STATS_PREFIX + 'worker-0') <= 30
+
+
+def test_expired_worker_stats_removed(job_queue, redis_client):
+    job_queue.report_worker_stats('worker-0', {'retries': 1}, ttl=1)
+    job_queue.report_worker_stats('worker-1', {'retries': 2}, ttl=30)
+
+    time.sleep(1.1)
+
+    assert job_queue.stats()['workers'] == {'worker-1': {'retries': 2}}
+    assert redis_client.smembers(RedisJobQueue.REDIS_WORKERS_NAME) == {b'worker-1'}
@@ -1,12 +1,25 @@
+import copy
+import time
+
 import pytest
 
 from data_acquisition.acquisition_request import (AcquisitionRequest, AcquisitionRequestStore,
-                                                  RequestNotFoundError)
+                                                  RequestNotFoundError, RequestIdTakenError)
+from data_acquisition.request_cache import CachedAcquisitionRequestStore
 from tests.consts import TEST_ACQUISITION_REQ, TEST_ACQUISITION_REQ_JSON
 
 
 @pytest.fixture
-def stored_request_real(redis_client):
+def stored_request_real(req_store_real):
+    new_req = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+    new_req.timestamps['VALIDATED'] = 1449523225
+    req_store_real.put(new_req)
+    return new_req
+
+
+@pytest.fixture
+def legacy_stored_request_real(redis_client):
+    """Request saved like it was before the store had an ID index."""
     new_req = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
     new_req.timestamps['VALIDATED'] = 1449523225
     redis_client.hset(
@@ -21,6 +34,44 @@ def test_get(req_store_real, stored_request_real):
     assert acquisition_req == stored_request_real
 
 
+def test_put_id_of_other_org(req_store_real, stored_request_real):
+    other_org_req = AcquisitionRequest(**dict(TEST_ACQUISITION_REQ_JSON, orgUUID='other-org'))
+
+    with pytest.raises(RequestIdTakenError):
+        req_store_real.put(other_org_req)
+
+    assert req_store_real.get(TEST_ACQUISITION_REQ.id) == stored_request_real
+    assert req_store_real.get_for_orgs(['other-org']) == []
+
+
+def test_get_legacy_after_index_build(req_store_real, legacy_stored_request_real):
+    req_store_real.build_index()
+    acquisition_req = req_store_real.get(TEST_ACQUISITION_REQ.id)
+    assert acquisition_req == legacy_stored_request_real
+
+
+def test_get_unindexed(req_store_real, legacy_stored_request_real, redis_client):
+    """A request stored without the index, e.g. by an old instance during a rolling deploy."""
+    # a request whose ID only ends with the same text
+    redis_client.hset(AcquisitionRequestStore.REDIS_HASH_NAME,
+                      'other-org:other:' + TEST_ACQUISITION_REQ.id, str(legacy_stored_request_real))
+
+    acquisition_req = req_store_real.get(TEST_ACQUISITION_REQ.id)
+
+    assert acquisition_req == legacy_stored_request_real
+    request_redis_id = AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ)
+    assert redis_client.hget(AcquisitionRequestStore.REDIS_ID_INDEX_NAME,
+                             TEST_ACQUISITION_REQ.id) == request_redis_id.encode()
+    assert req_store_real.get_for_org(TEST_ACQUISITION_REQ.orgUUID) == [acquisition_req]
+
+
+def test_transition_unindexed(req_store_real, legacy_stored_request_real):
+    acquisition_req = req_store_real.transition(TEST_ACQUISITION_REQ.id, 'DOWNLOADED')
+
+    assert acquisition_req.state == 'DOWNLOADED'
+    assert req_store_real.get(TEST_ACQUISITION_REQ.id) == acquisition_req
+
+
 def test_get_not_found(req_store_real):
     with pytest.raises(RequestNotFoundError):
         req_store_real.get('fake-id')
@@ -31,3 +82,165 @@ def test_delete(req_store_real, redis_client, stored_request_real):
     assert not redis_client.hexists(
         AcquisitionRequestStore.REDIS_HASH_NAME,
         AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ))
+    with pytest.raises(RequestNotFoundError):
+        req_store_real.get(TEST_ACQUISITION_REQ.id)
+
+
+def test_get_for_org(req_store_real):
+    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(3)]
+    test_requests[1].id = 'other-fake-id'
+    test_requests[2].id, test_requests[2].orgUUID = 'another-fake-id', 'other-org-uuid'
+    for test_request in test_requests:
+        req_store_real.put(test_request)
+
+    acquisition_requests = req_store_real.get_for_org(TEST_ACQUISITION_REQ.orgUUID)
+
+    assert set(acquisition_requests) == set(test_requests[:2])
+
+
+def test_get_for_orgs(req_store_real):
+    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(3)]
+    test_requests[1].id, test_requests[1].orgUUID = 'other-fake-id', 'other-org-uuid'
+    test_requests[2].id, test_requests[2].orgUUID = 'another-fake-id', 'not-requested-org-uuid'
+    for test_request in test_requests:
+        req_store_real.put(test_request)
+
+    acquisition_requests = req_store_real.get_for_orgs(
+        [TEST_ACQUISITION_REQ.orgUUID, 'other-org-uuid'])
+
+    assert acquisition_requests == test_requests[:2]
+
+
+def test_get_for_org_after_delete(req_store_real, stored_request_real):
+    req_store_real.delete(stored_request_real)
+    assert req_store_real.get_for_org(TEST_ACQUISITION_REQ.orgUUID) == []
+
+
+def test_get_for_org_legacy_after_index_build(req_store_real, legacy_stored_request_real):
+    req_store_real.build_index()
+    assert req_store_real.get_for_org(TEST_ACQUISITION_REQ.orgUUID) == [legacy_stored_request_real]
+
+
+def test_transition(req_store_real, stored_request_real):
+    acquisition_req = req_store_real.transition(TEST_ACQUISITION_REQ.id, 'DOWNLOADED')
+
+    assert acquisition_req.state == 'DOWNLOADED'
+    assert acquisition_req.timestamps['VALIDATED'] == 1449523225
+    assert isinstance(acquisition_req.timestamps['DOWNLOADED'], int)
+    assert req_store_real.get(TEST_ACQUISITION_REQ.id) == acquisition_req
+
+
+def test_transition_legacy(req_store_real, legacy_stored_request_real, redis_client):
+    req_store_real.build_index()
+
+    acquisition_req = req_store_real.transition(TEST_ACQUISITION_REQ.id, 'DOWNLOADED')
+
+    assert acquisition_req.state == 'DOWNLOADED'
+    assert acquisition_req.timestamps['VALIDATED'] == 1449523225
+    assert req_store_real.get(TEST_ACQUISITION_REQ.id) == acquisition_req
+    stored_entry = redis_client.hget(
+        AcquisitionRequestStore.REDIS_HASH_NAME,
+        AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ))
+    assert stored_entry.startswith(b'{')
+
+
+def test_transition_repeated_state(req_store_real, stored_request_real):
+    req_store_real.transition(TEST_ACQUISITION_REQ.id, 'ERROR')
+    req_store_real.transition(TEST_ACQUISITION_REQ.id, 'VALIDATED')
+    acquisition_req = req_store_real.transition(TEST_ACQUISITION_REQ.id, 'ERROR')
+
+    assert acquisition_req.state == 'ERROR'
+    assert set(acquisition_req.timestamps) == {'VALIDATED', 'ERROR'}
+    assert req_store_real.get(TEST_ACQUISITION_REQ.id) == acquisition_req
+
+
+def test_transition_not_found(req_store_real):
+    with pytest.raises(RequestNotFoundError):
+        req_store_real.transition('fake-id', 'DOWNLOADED')
+
+
+def test_idempotency_key_claimed(req_store_real, redis_client):
+    org_id = TEST_ACQUISITION_REQ.orgUUID
+
+    assert req_store_real.claim_idempotency_key(org_id, 'some-key', 'fake-id', 60) is None
+
+    key_name = AcquisitionRequestStore.get_idempotency_key_name(org_id, 'some-key')
+    assert 0 < redis_client.ttl(key_name) <= 60
+    assert req_store_real.claim_idempotency_key('other-org', 'some-key', 'other-id', 60) is None
+
+
+def test_idempotency_key_used(req_store_real, stored_request_real):
+    org_id = stored_request_real.orgUUID
+    req_store_real.claim_idempotency_key(org_id, 'some-key', stored_request_real.id, 60)
+
+    assert req_store_real.claim_idempotency_key(org_id, 'some-key', 'other-id', 60) == (
+        stored_request_real.id, stored_request_real)
+
+
+def test_idempotency_key_used_by_unstored_request(req_store_real):
+    req_store_real.claim_idempotency_key('some-org', 'some-key', 'fake-id', 60)
+
+    assert req_store_real.claim_idempotency_key('some-org', 'some-key', 'other-id', 60) == (
+        'fake-id', None)
+
+
+def test_idempotency_key_released(req_store_real):
+    req_store_real.claim_idempotency_key('some-org', 'some-key', 'fake-id', 60)
+
+    req_store_real.release_idempotency_key('some-org', 'some-key', 'other-id')
+    assert req_store_real.claim_idempotency_key('some-org', 'some-key', 'other-id', 60)
+
+    req_store_real.release_idempotency_key('some-org', 'some-key', 'fake-id')
+    assert req_store_real.claim_idempotency_key('some-org', 'some-key', 'other-id', 60) is None
+
+
+def test_get_page_for_orgs(req_store_real):
+    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(300)]
+    for request_number, test_request in enumerate(test_requests):
+        test_request.id = 'fake-id-{}'.format(request_number)
+        test_request.orgUUID = 'fake-org-{}'.format(request_number % 3)
+        req_store_real.put(test_request)
+
+    acquisition_requests = []
+    cursor = None
+    while True:
+        page, cursor = req_store_real.get_page_for_orgs(
+            ['fake-org-0', 'fake-org-2'], cursor=cursor, limit=20)
+        acquisition_requests.extend(page)
+        if cursor is None:
+            break
+
+    assert set(acquisition_requests) == {req for req in test_requests
+                                         if req.orgUUID in ('fake-org-0', 'fake-org-2')}
+
+
+def test_iter_all(req_store_real):
+    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(50)]
+    for request_number, test_request in enumerate(test_requests):
+        test_request.id = 'fake-id-{}'.format(request_number)
+        test_request.orgUUID = 'fake-org-{}'.format(request_number % 3)
+        req_store_real.put(test_request)
+
+    assert set(req_store_real.iter_all(batch_size=10)) == set(test_requests)
+
+
+def test_cache_invalidated_by_other_store(req_store_real, redis_client, stored_request_real):
+    cached_store = CachedAcquisitionRequestStore(redis_client, max_size=100)
+    cached_store.start_invalidation_listener()
+    # waiting for the listener to subscribe
+    for _ in range(100):
+        if redis_client.execute_command('PUBSUB', 'NUMSUB',
+                                        AcquisitionRequestStore.REDIS_INVALIDATION_CHANNEL)[1]:
+            break
+        time.sleep(0.01)
+
+    assert cached_store.get(TEST_ACQUISITION_REQ.id).state == 'VALIDATED'
+    assert cached_store.get_for_org(TEST_ACQUISITION_REQ.orgUUID)[0].state == 'VALIDATED'
+    req_store_real.transition(TEST_ACQUISITION_REQ.id, 'DOWNLOADED')
+
+    for _ in range(100):
+        if cached_store.stats()['invalidations']:
+            break
+        time.sleep(0.01)
+    assert cached_store.get(TEST_ACQUISITION_REQ.id).state == 'DOWNLOADED'
+    assert cached_store.get_for_org(TEST_ACQUISITION_REQ.orgUUID)[0].state == 'DOWNLOADED'
@@ -0,0 +1,53 @@
+import pytest
+
+from data_acquisition.source_cache import AcquiredSourceCache
+import data_acquisition.source_cache
+
+SOURCE = 'http://some-source/data.csv'
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    current_time = [1000.0]
+    monkeypatch.setattr(data_acquisition.source_cache.time, 'time', lambda: current_time[0])
+    return current_time
+
+
+@pytest.fixture
+def source_cache(redis_client):
+    return AcquiredSourceCache(redis_client, max_size=2, ttl=60)
+
+
+def test_source_cached(source_cache, fake_time):
+    assert source_cache.get(SOURCE) is None
+
+    source_cache.put(SOURCE, 'fake-guid/000000_1', 'hdfs://some-fake-hdfs-path')
+
+    acquired_source = source_cache.get('HTTP://Some-Source/data.csv#part')
+    assert acquired_source.saved_object_id == 'fake-guid/000000_1'
+    assert acquired_source.object_store_id == 'hdfs://some-fake-hdfs-path'
+    assert acquired_source.acquired_at == 1000.0
+    assert source_cache.stats() == {'size': 1, 'max_size': 2, 'hits': 1, 'misses': 1}
+
+
+def test_source_expires(source_cache, fake_time, redis_client):
+    source_cache.put(SOURCE, 'fake-guid/000000_1', 'hdfs://some-fake-hdfs-path')
+    fake_time[0] += 60
+
+    assert source_cache.get(SOURCE) is None
+    assert 0 < redis_client.ttl(AcquiredSourceCache.REDIS_HASH_NAME) <= 60
+
+    source_cache.put('http://other-source/', 'fake-guid/000000_2', 'hdfs://some-fake-hdfs-path')
+    assert source_cache.stats()['size'] == 1
+
+
+def test_oldest_sources_removed(source_cache, fake_time):
+    for index in range(3):
+        source_cache.put('http://some-source/{}'.format(index),
+                         'fake-guid/00000{}'.format(index), 'hdfs://some-fake-hdfs-path')
+        fake_time[0] += 1
+
+    assert source_cache.get('http://some-source/0') is None
+    assert source_cache.get('http://some-source/1').saved_object_id == 'fake-guid/000001'
+    assert source_cache.get('http://some-source/2').saved_object_id == 'fake-guid/000002'
+    assert source_cache.stats()['size'] == 2
@@ -25,7 +25,7 @@ def das_config():
 
 
 @pytest.fixture
-def mock_executor():
+def mock_job_queue():
     return MagicMock()
 
 
@@ -35,8 +35,8 @@ def mock_req_store():
 
 
 @pytest.fixture
-def das_api(mock_req_store, mock_executor, das_config):
-    return data_acquisition.app.DasApi(mock_req_store, mock_executor, das_config)
+def das_api(mock_req_store, mock_job_queue, das_config):
+    return data_acquisition.app.DasApi(mock_req_store, mock_job_queue, das_config)
 
 
 @pytest.fixture(scope='function')
@@ -1,20 +1,28 @@
+import hashlib
 import json
 import logging
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import MagicMock, patch
 
 import falcon
 from falcon import Request
 from falcon import Response
 from falcon.testing.helpers import create_environ
+import jwt
 import pytest
+import redis
 import requests.exceptions
 import responses
 
-from tests.consts import (RSA_2048_PUB_KEY, TEST_AUTH_HEADER, TEST_ADMIN_AUTH_HEADER, TEST_ORG_UUID,
-                          FAKE_PERMISSION_SERVICE_URL, FAKE_PERMISSION_URL)
-from data_acquisition.cf_app_utils.auth.falcon import JwtMiddleware, FalconUserOrgAccessChecker
+from tests.consts import (RSA_2048_PRIV_KEY, RSA_2048_PUB_KEY, TEST_AUTH_HEADER,
+                          TEST_ADMIN_AUTH_HEADER, TEST_ORG_UUID, FAKE_PERMISSION_SERVICE_URL,
+                          FAKE_PERMISSION_URL)
+from data_acquisition.cf_app_utils.auth.falcon import (JwtMiddleware, FalconUserOrgAccessChecker,
+                                                      get_token_claims)
 from data_acquisition.cf_app_utils.auth import (UaaError, UserOrgAccessChecker, NoOrgAccessError,
                                                 PermissionServiceError)
+from data_acquisition.cf_app_utils import CircuitBreaker
 import data_acquisition.cf_app_utils.logs
 
 
@@ -30,7 +38,7 @@ def test_oauth_middleware_init_ok():
     auth_middleware = JwtMiddleware()
     auth_middleware.initialize(fake_key_url)
 
-    assert auth_middleware._verification_key == RSA_2048_PUB_KEY
+    assert auth_middleware._verification_keys == {None: RSA_2048_PUB_KEY}
 
 
 @patch('data_acquisition.cf_app_utils.auth.utils.requests.get')
@@ -54,7 +62,7 @@ def test_oauth_middleware_init_bad_response():
 
 def test_oauth_middleware_request_auth_valid():
     auth_middleware = JwtMiddleware()
-    auth_middleware._verification_key = RSA_2048_PUB_KEY
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
     test_req = Request(create_environ(headers={'Authorization': TEST_AUTH_HEADER}))
     test_resp = Response()
 
@@ -62,6 +70,8 @@ def test_oauth_middleware_request_auth_valid():
     auth_middleware.process_request(test_req, test_resp)
     auth_middleware.process_response(test_req, test_resp, None)
 
+    assert get_token_claims(test_req) == {'a': 'b', 'scope': ['nothing'], 'aud': ['something']}
+
 
 @pytest.mark.parametrize('headers', [
     {},
@@ -70,13 +80,136 @@ def test_oauth_middleware_request_auth_valid():
 ])
 def test_oauth_middleware_request_auth_invalid(headers):
     auth_middleware = JwtMiddleware()
-    auth_middleware._verification_key = RSA_2048_PUB_KEY
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
 
     with pytest.raises(falcon.HTTPUnauthorized):
         auth_middleware.process_resource(Request(create_environ(headers=headers)),
                                          None, None, None)
 
 
+def test_oauth_middleware_verified_tokens_cached():
+    auth_middleware = JwtMiddleware(cache_size=10)
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
+    token_expiration = int(time.time()) + 60
+    auth_header = _get_auth_header(a='b', exp=token_expiration)
+
+    with patch('data_acquisition.cf_app_utils.auth.falcon.jwt.decode',
+               side_effect=jwt.decode) as decode_mock:
+        for _ in range(3):
+            test_req = Request(create_environ(headers={'Authorization': auth_header}))
+            auth_middleware.process_resource(test_req, None, None, None)
+            assert get_token_claims(test_req) == {
+                'a': 'b', 'scope': ['nothing'], 'exp': token_expiration}
+
+    assert decode_mock.call_count == 1
+    assert auth_middleware.stats() == {'size': 1, 'max_size': 10, 'hits': 2, 'misses': 1}
+
+
+def test_oauth_middleware_verified_token_cache_expires(monkeypatch):
+    auth_middleware = JwtMiddleware(cache_size=10)
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
+    token_expiration = int(time.time()) + 10
+    auth_header = _get_auth_header(exp=token_expiration)
+
+    with patch('data_acquisition.cf_app_utils.auth.falcon.jwt.decode',
+               side_effect=jwt.decode) as decode_mock:
+        auth_middleware.process_resource(
+            Request(create_environ(headers={'Authorization': auth_header})), None, None, None)
+        monkeypatch.setattr('time.time', lambda: token_expiration)
+        auth_middleware.process_resource(
+            Request(create_environ(headers={'Authorization': auth_header})), None, None, None)
+
+    assert decode_mock.call_count == 2
+
+
+def test_oauth_middleware_token_without_expiration_not_cached():
+    auth_middleware = JwtMiddleware(cache_size=10)
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
+
+    with patch('data_acquisition.cf_app_utils.auth.falcon.jwt.decode',
+               side_effect=jwt.decode) as decode_mock:
+        for _ in range(2):
+            auth_middleware.process_resource(
+                Request(create_environ(headers={'Authorization': TEST_AUTH_HEADER})),
+                None, None, None)
+
+    assert decode_mock.call_count == 2
+    assert auth_middleware.stats()['size'] == 0
+
+
+def test_oauth_middleware_invalid_token_not_cached():
+    auth_middleware = JwtMiddleware(cache_size=10)
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
+    invalid_auth_header = '{}Z{}'.format(TEST_AUTH_HEADER[:-2], TEST_AUTH_HEADER[-1])
+
+    for _ in range(2):
+        with pytest.raises(falcon.HTTPUnauthorized):
+            auth_middleware.process_resource(
+                Request(create_environ(headers={'Authorization': invalid_auth_header})),
+                None, None, None)
+    assert auth_middleware.stats()['size'] == 0
+
+
+def _get_auth_header_with_key_id(key_id, key):
+    token = jwt.encode(payload={'scope': ['nothing']}, key=key, algorithm='HS256',
+                       headers={'kid': key_id} if key_id else None).decode()
+    return 'bearer ' + token
+
+
+def _verify(auth_middleware, auth_header):
+    test_req = Request(create_environ(headers={'Authorization': auth_header}))
+    auth_middleware.process_resource(test_req, None, None, None)
+    return get_token_claims(test_req)
+
+
+@pytest.fixture(scope='function')
+def rotated_keys_middleware():
+    auth_middleware = JwtMiddleware()
+    auth_middleware._add_verification_key({'kid': 'key-1', 'value': 'secret-1'})
+    auth_middleware._add_verification_key({'kid': 'key-2', 'value': 'secret-2'})
+    return auth_middleware
+
+
+def test_oauth_middleware_key_chosen_by_id(rotated_keys_middleware):
+    assert _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-1', 'secret-1'))
+    assert _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-2', 'secret-2'))
+    assert _verify(rotated_keys_middleware, _get_auth_header_with_key_id(None, 'secret-1'))
+    with pytest.raises(falcon.HTTPUnauthorized):
+        _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-2', 'secret-1'))
+    assert not rotated_keys_middleware._key_refresh_requested.is_set()
+
+
+def test_oauth_middleware_previous_key_kept(rotated_keys_middleware):
+    rotated_keys_middleware._add_verification_key({'kid': 'key-3', 'value': 'secret-3'})
+
+    assert _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-2', 'secret-2'))
+    assert _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-3', 'secret-3'))
+    with pytest.raises(falcon.HTTPUnauthorized):
+        _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-1', 'secret-1'))
+
+
+def test_oauth_middleware_unknown_key_id_requests_refresh(rotated_keys_middleware):
+    with pytest.raises(falcon.HTTPUnauthorized):
+        _verify(rotated_keys_middleware, _get_auth_header_with_key_id('key-3', 'secret-3'))
+    assert rotated_keys_middleware._key_refresh_requested.is_set()
+
+
+def test_oauth_middleware_keys_refreshed(rotated_keys_middleware, monkeypatch):
+    class StopRefreshing(Exception):
+        pass
+    get_key_mock = MagicMock(side_effect=[{'kid': 'key-3', 'value': 'secret-3'},
+                                          UaaError()])
+    monkeypatch.setattr('data_acquisition.cf_app_utils.auth.falcon.get_uaa_key_info',
+                        get_key_mock)
+    monkeypatch.setattr('time.sleep', MagicMock(side_effect=[None, StopRefreshing()]))
+
+    with pytest.raises(StopRefreshing):
+        rotated_keys_middleware._refresh_keys('http://fake-url', 0)
+
+    get_key_mock.assert_called_with('http://fake-url', None)
+    assert list(rotated_keys_middleware._verification_keys) == ['key-2', 'key-3']
+
+
 @pytest.fixture(scope='function')
 def user_org_access_checker():
     return UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL)
@@ -107,6 +240,24 @@ def test_admin_user_in_org(user_org_access_checker):
         [TEST_ORG_UUID, 'some-other-org'])
 
 
+def test_admin_access(user_org_access_checker):
+    user_org_access_checker.validate_admin_access(TEST_ADMIN_AUTH_HEADER)
+
+
+def test_admin_access_not_admin(user_org_access_checker):
+    with pytest.raises(NoOrgAccessError):
+        user_org_access_checker.validate_admin_access(TEST_AUTH_HEADER)
+
+
+def test_access_with_given_claims(user_org_access_checker):
+    admin_claims = {'scope': ['console.admin']}
+    user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID], admin_claims)
+    user_org_access_checker.validate_admin_access(TEST_AUTH_HEADER, admin_claims)
+
+    with pytest.raises(NoOrgAccessError):
+        user_org_access_checker.validate_admin_access(TEST_ADMIN_AUTH_HEADER, {'scope': []})
+
+
 @responses.activate
 def test_user_in_org_no_service(user_org_access_checker):
     responses.add(responses.GET, FAKE_PERMISSION_URL, status=404)
@@ -114,6 +265,249 @@ def test_user_in_org_no_service(user_org_access_checker):
         user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
 
 
+@pytest.fixture(scope='function')
+def cached_user_org_access_checker():
+    return UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL, cache_size=10, cache_ttl=60)
+
+
+def _get_auth_header(**claims):
+    claims.setdefault('scope', ['nothing'])
+    token = jwt.encode(payload=claims, key=RSA_2048_PRIV_KEY, algorithm='RS256').decode()
+    return 'bearer ' + token
+
+
+@responses.activate
+def test_user_orgs_cached(cached_user_org_access_checker):
+    _set_positive_permission_service_mock()
+
+    cached_user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+    with pytest.raises(NoOrgAccessError):
+        cached_user_org_access_checker.validate_access(TEST_AUTH_HEADER, ['not-the-users-org'])
+
+    assert len(responses.calls) == 1
+    assert cached_user_org_access_checker.stats()['cache'] == {
+        'size': 1, 'max_size': 10, 'hits': 1, 'misses': 1}
+
+
+@responses.activate
+def test_user_orgs_cached_per_token(cached_user_org_access_checker):
+    _set_positive_permission_service_mock()
+
+    cached_user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+    cached_user_org_access_checker.validate_access(_get_auth_header(a='c'), [TEST_ORG_UUID])
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_user_orgs_cache_expires_with_token(cached_user_org_access_checker, monkeypatch):
+    _set_positive_permission_service_mock()
+    auth_header = _get_auth_header(exp=1010)
+
+    monkeypatch.setattr('time.time', lambda: 1000.0)
+    cached_user_org_access_checker.validate_access(auth_header, [TEST_ORG_UUID])
+    cached_user_org_access_checker.validate_access(auth_header, [TEST_ORG_UUID])
+    assert len(responses.calls) == 1
+
+    monkeypatch.setattr('time.time', lambda: 1010.0)
+    cached_user_org_access_checker.validate_access(auth_header, [TEST_ORG_UUID])
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_user_orgs_not_cached_on_service_error(cached_user_org_access_checker):
+    responses.add(responses.GET, FAKE_PERMISSION_URL, status=500)
+    with pytest.raises(PermissionServiceError):
+        cached_user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    responses.reset()
+    _set_positive_permission_service_mock()
+    cached_user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+    assert len(responses.calls) == 1
+
+
+def test_user_orgs_cache_disabled_stats(user_org_access_checker):
+    assert user_org_access_checker.stats() == {'lookups': {'executions': 0, 'shared': 0}}
+
+
+@pytest.mark.parametrize('service_status, expected_error', [
+    (200, None),
+    (500, PermissionServiceError),
+])
+def test_concurrent_user_orgs_lookups_coalesced(user_org_access_checker, service_status,
+                                                expected_error):
+    lookup_count = 5
+    lookups_started = threading.Barrier(lookup_count + 1)
+    response = MagicMock(status_code=service_status)
+    response.json.return_value = [{'organization': {'metadata': {'guid': TEST_ORG_UUID}}}]
+
+    def get_permissions(*_, **__):
+        # waiting for the other lookups to start waiting for this one
+        while user_org_access_checker._user_orgs_lookups.shared < lookup_count - 1:
+            time.sleep(0.001)
+        return response
+
+    errors = []
+    def validate_access():
+        lookups_started.wait()
+        try:
+            user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+        except PermissionServiceError as ex:
+            errors.append(ex)
+
+    with patch('data_acquisition.cf_app_utils.auth.org_check.requests.get',
+               side_effect=get_permissions) as get_mock:
+        threads = [threading.Thread(target=validate_access) for _ in range(lookup_count)]
+        for thread in threads:
+            thread.start()
+        lookups_started.wait()
+        for thread in threads:
+            thread.join(5)
+
+    assert get_mock.call_count == 1
+    assert len(errors) == (lookup_count if expected_error else 0)
+    assert user_org_access_checker.stats() == {
+        'lookups': {'executions': 1, 'shared': lookup_count - 1}}
+
+
+@pytest.fixture(scope='function')
+def shared_cache_redis():
+    redis_mock = MagicMock()
+    redis_mock.get.return_value = None
+    return redis_mock
+
+
+@pytest.fixture(scope='function')
+def shared_cache_checker(shared_cache_redis):
+    return UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL, cache_size=10,
+                                shared_cache_redis=shared_cache_redis, shared_cache_ttl=30)
+
+
+def _get_shared_cache_key(auth_header):
+    return UserOrgAccessChecker.SHARED_CACHE_KEY_PREFIX + hashlib.sha256(
+        auth_header.encode()).hexdigest()
+
+
+@responses.activate
+def test_user_orgs_from_shared_cache(shared_cache_checker, shared_cache_redis):
+    shared_cache_redis.get.return_value = json.dumps([TEST_ORG_UUID]).encode()
+
+    shared_cache_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+    shared_cache_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    assert not responses.calls
+    shared_cache_redis.get.assert_called_once_with(_get_shared_cache_key(TEST_AUTH_HEADER))
+    assert shared_cache_checker.stats()['shared_cache'] == {'hits': 1, 'misses': 0, 'errors': 0}
+    assert shared_cache_checker.stats()['cache']['hits'] == 1
+
+
+@pytest.mark.parametrize('claims, expected_ttl', [
+    ({}, 30),
+    ({'exp': 1010}, 10),
+])
+@responses.activate
+def test_user_orgs_put_in_shared_cache(shared_cache_checker, shared_cache_redis, monkeypatch,
+                                       claims, expected_ttl):
+    monkeypatch.setattr('time.time', lambda: 1000.0)
+    _set_positive_permission_service_mock()
+    auth_header = _get_auth_header(**claims)
+
+    shared_cache_checker.validate_access(auth_header, [TEST_ORG_UUID])
+
+    assert len(responses.calls) == 1
+    shared_cache_redis.set.assert_called_once_with(
+        _get_shared_cache_key(auth_header), json.dumps([TEST_ORG_UUID]), ex=expected_ttl)
+    assert shared_cache_checker.stats()['shared_cache'] == {'hits': 0, 'misses': 1, 'errors': 0}
+
+
+@responses.activate
+def test_user_orgs_not_put_in_shared_cache_for_expiring_token(
+        shared_cache_checker, shared_cache_redis, monkeypatch):
+    monkeypatch.setattr('time.time', lambda: 1000.0)
+    _set_positive_permission_service_mock()
+
+    shared_cache_checker.validate_access(_get_auth_header(exp=1000), [TEST_ORG_UUID])
+
+    assert not shared_cache_redis.set.called
+
+
+@responses.activate
+def test_shared_cache_errors_ignored(shared_cache_checker, shared_cache_redis):
+    _set_positive_permission_service_mock()
+    shared_cache_redis.get.side_effect = redis.exceptions.ConnectionError()
+    shared_cache_redis.set.side_effect = redis.exceptions.ConnectionError()
+
+    shared_cache_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    assert len(responses.calls) == 1
+    assert shared_cache_checker.stats()['shared_cache'] == {'hits': 0, 'misses': 0, 'errors': 2}
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ConnectionError(),
+    requests.exceptions.ReadTimeout(),
+    requests.exceptions.ChunkedEncodingError(),
+])
+def test_user_in_org_service_unreachable(error):
+    http_client_mock = MagicMock()
+    http_client_mock.get.side_effect = error
+    user_org_access_checker = UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL,
+                                                   http_client=http_client_mock)
+
+    with pytest.raises(PermissionServiceError):
+        user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+    http_client_mock.get.assert_called_once_with(FAKE_PERMISSION_URL,
+                                                 headers={'Authorization': TEST_AUTH_HEADER})
+
+
+@responses.activate
+def test_user_in_org_circuit_breaker_opened():
+    responses.add(responses.GET, FAKE_PERMISSION_URL, status=500)
+    user_org_access_checker = UserOrgAccessChecker(
+        FAKE_PERMISSION_SERVICE_URL,
+        circuit_breaker=CircuitBreaker(failure_threshold=2))
+
+    for _ in range(3):
+        with pytest.raises(PermissionServiceError):
+            user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    assert len(responses.calls) == 2
+    assert user_org_access_checker.stats()['circuit_breaker'] == {
+        'state': 'open',
+        'consecutive_failures': 2,
+        'times_opened': 1,
+        'rejected': 1,
+    }
+
+
+def test_user_in_org_circuit_breaker_trial_failed_by_request_error():
+    http_client_mock = MagicMock()
+    http_client_mock.get.side_effect = requests.exceptions.TooManyRedirects()
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    circuit_breaker.record_failure()
+    user_org_access_checker = UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL,
+                                                   http_client=http_client_mock,
+                                                   circuit_breaker=circuit_breaker)
+
+    with pytest.raises(PermissionServiceError):
+        user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    assert circuit_breaker.stats()['times_opened'] == 2
+
+
+@responses.activate
+def test_user_in_org_circuit_breaker_closed_by_client_error():
+    responses.add(responses.GET, FAKE_PERMISSION_URL, status=401)
+    circuit_breaker = CircuitBreaker(failure_threshold=1)
+    user_org_access_checker = UserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL,
+                                                   circuit_breaker=circuit_breaker)
+
+    with pytest.raises(PermissionServiceError):
+        user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
+
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
 @pytest.fixture(scope='function')
 def falcon_user_org_access_checker():
     return FalconUserOrgAccessChecker(FAKE_PERMISSION_SERVICE_URL)
@@ -139,6 +533,11 @@ def test_falcon_user_in_org_no_service(falcon_user_org_access_checker):
         falcon_user_org_access_checker.validate_access(TEST_AUTH_HEADER, [TEST_ORG_UUID])
 
 
+def test_falcon_admin_access_not_admin(falcon_user_org_access_checker):
+    with pytest.raises(falcon.HTTPForbidden):
+        falcon_user_org_access_checker.validate_admin_access(TEST_AUTH_HEADER)
+
+
 def test_log_settings(capsys):
     data_acquisition.cf_app_utils.logs.configure_logging(logging.DEBUG)
 
@@ -0,0 +1,69 @@
+from data_acquisition.cf_app_utils import LruCache
+
+
+def test_get_missing():
+    cache = LruCache(2)
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+    assert cache.stats() == {'size': 0, 'max_size': 2, 'hits': 0, 'misses': 2}
+
+
+def test_put_and_get():
+    cache = LruCache(2)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    assert cache.stats() == {'size': 1, 'max_size': 2, 'hits': 1, 'misses': 0}
+
+
+def test_least_recently_used_evicted():
+    cache = LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+def test_ttl_expiration(monkeypatch):
+    monkeypatch.setattr('time.time', lambda: 100.0)
+    cache = LruCache(3, ttl=10)
+    cache.put('a', 1)
+    cache.put('b', 2, expires_at=105.0)
+    cache.put('c', 3, expires_at=200.0)
+
+    monkeypatch.setattr('time.time', lambda: 106.0)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+    monkeypatch.setattr('time.time', lambda: 110.0)
+    assert cache.get('a') is None
+    assert cache.get('c') is None
+
+
+def test_pop_and_clear():
+    cache = LruCache(3)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.pop('a')
+    cache.pop('not-there')
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+    cache.clear()
+    assert cache.get('b') is None
+
+
+def test_entries_with_sizes():
+    cache = LruCache(5)
+    cache.put('a', [1, 2], size=2)
+    cache.put('b', [3, 4, 5], size=3)
+    cache.put('a', [1, 2, 6], size=3)
+
+    assert cache.get('b') is None
+    assert cache.stats()['size'] == 3
+    cache.put('c', list(range(6)), size=6)
+    assert cache.get('c') is None
+    assert cache.get('a') == [1, 2, 6]
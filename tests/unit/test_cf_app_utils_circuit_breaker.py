@@ -0,0 +1,95 @@
+import pytest
+
+from data_acquisition.cf_app_utils import CircuitBreaker
+import data_acquisition.cf_app_utils.circuit_breaker
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    current_time = [100.0]
+    monkeypatch.setattr(data_acquisition.cf_app_utils.circuit_breaker.time, 'monotonic',
+                        lambda: current_time[0])
+    return current_time
+
+
+def test_closed_circuit_allows_requests():
+    circuit_breaker = CircuitBreaker(failure_threshold=2)
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.allow_request()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_success_resets_failures():
+    circuit_breaker = CircuitBreaker(failure_threshold=2)
+    circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_after_failures(fake_time):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    assert not circuit_breaker.allow_request()
+    fake_time[0] += 29
+    assert not circuit_breaker.allow_request()
+    assert circuit_breaker.stats() == {
+        'state': 'open',
+        'consecutive_failures': 2,
+        'times_opened': 1,
+        'rejected': 2,
+    }
+
+
+def test_half_open_circuit_allows_single_trial(fake_time):
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    circuit_breaker.record_failure()
+    fake_time[0] += 30
+
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    assert circuit_breaker.allow_request()
+    assert not circuit_breaker.allow_request()
+
+
+def test_trial_without_outcome_given_up(fake_time):
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    circuit_breaker.record_failure()
+    fake_time[0] += 30
+    circuit_breaker.allow_request()
+
+    fake_time[0] += 29
+    assert not circuit_breaker.allow_request()
+    fake_time[0] += 1
+    assert circuit_breaker.allow_request()
+    assert not circuit_breaker.allow_request()
+
+
+def test_successful_trial_closes_circuit(fake_time):
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    circuit_breaker.record_failure()
+    fake_time[0] += 30
+    circuit_breaker.allow_request()
+
+    circuit_breaker.record_success()
+
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+    assert circuit_breaker.allow_request()
+
+
+def test_failed_trial_opens_circuit(fake_time):
+    circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        circuit_breaker.record_failure()
+    fake_time[0] += 30
+    circuit_breaker.allow_request()
+
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == CircuitBreaker.OPEN
+    assert not circuit_breaker.allow_request()
+    assert circuit_breaker.stats()['times_opened'] == 2
@@ -0,0 +1,131 @@
+import threading
+
+import pytest
+
+from data_acquisition.cf_app_utils import AdaptiveConcurrencyLimiter
+import data_acquisition.cf_app_utils.concurrency
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    current_time = [100.0]
+    monkeypatch.setattr(data_acquisition.cf_app_utils.concurrency.time, 'monotonic',
+                        lambda: current_time[0])
+    return current_time
+
+
+def _start_waiting_acquire(limiter):
+    """Starts a thread blocked on `acquire`, so that the limiter is saturated."""
+    acquired = threading.Event()
+    def acquire():
+        limiter.acquire()
+        acquired.set()
+    thread = threading.Thread(target=acquire, daemon=True)
+    thread.start()
+    while limiter.stats()['waiting'] != 1:
+        pass
+    return acquired
+
+
+def test_acquire_blocks_at_limit():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=1)
+    limiter.acquire()
+    acquired = _start_waiting_acquire(limiter)
+
+    assert not acquired.wait(0.05)
+    limiter.release(0.1)
+    assert acquired.wait(1)
+    assert limiter.stats()['in_flight'] == 1
+
+
+def test_acquire_timeout():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=1)
+    assert limiter.acquire(timeout=0.01)
+
+    assert not limiter.acquire(timeout=0.01)
+    assert limiter.stats()['in_flight'] == 1
+    assert limiter.stats()['waiting'] == 0
+
+
+def test_release_without_call():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=10)
+    limiter.acquire()
+    acquired = _start_waiting_acquire(limiter)
+
+    limiter.release()
+
+    assert acquired.wait(1)
+    assert limiter.stats()['limit'] == 1
+    assert limiter.stats()['min_latency'] is None
+
+
+def test_limit_increased_when_saturated():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=10)
+    limiter.acquire()
+    acquired = _start_waiting_acquire(limiter)
+
+    limiter.release(0.1)
+
+    assert acquired.wait(1)
+    assert limiter.stats()['limit'] == 2
+    assert limiter.stats()['increases'] == 1
+
+
+def test_limit_not_increased_without_waiting_calls():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=2, max_limit=10)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(0.1)
+
+    assert limiter.stats()['limit'] == 2
+    assert limiter.stats()['increases'] == 0
+
+
+def test_limit_not_above_max():
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=1)
+    limiter.acquire()
+    acquired = _start_waiting_acquire(limiter)
+
+    limiter.release(0.1)
+
+    assert acquired.wait(1)
+    assert limiter.stats()['limit'] == 1
+
+
+@pytest.mark.parametrize('latency, failed', [
+    (0.3, False),
+    (0.1, True),
+])
+def test_limit_decreased(fake_time, latency, failed):
+    limiter = AdaptiveConcurrencyLimiter(min_limit=2, max_limit=20, initial_limit=8)
+    limiter.acquire()
+    limiter.release(0.1)
+
+    limiter.acquire()
+    limiter.release(latency, failed)
+
+    assert limiter.stats()['limit'] == 6
+    assert limiter.stats()['decreases'] == 1
+
+
+def test_limit_decreased_once_per_latency(fake_time):
+    limiter = AdaptiveConcurrencyLimiter(min_limit=1, max_limit=20, initial_limit=16)
+    limiter.acquire()
+    limiter.release(0.1)
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.5)
+    fake_time[0] += 0.5
+    limiter.acquire()
+    limiter.release(0.5)
+
+    assert limiter.stats()['limit'] == 9
+    assert limiter.stats()['decreases'] == 2
+
+
+def test_limit_not_below_min(fake_time):
+    limiter = AdaptiveConcurrencyLimiter(min_limit=2, max_limit=4, initial_limit=2)
+    limiter.acquire()
+    limiter.release(0.1, failed=True)
+
+    assert limiter.stats()['limit'] == 2
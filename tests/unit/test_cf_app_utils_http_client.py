@@ -0,0 +1,56 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+
+import pytest
+import requests.exceptions
+
+from data_acquisition.cf_app_utils import HttpClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.5)
+        body = (self.headers.get('Cookie') or 'no cookie').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Set-Cookie', 'session=some-user')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.yield_fixture
+def stub_url():
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    server_thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    server_thread.start()
+    yield 'http://127.0.0.1:{}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_reused(stub_url):
+    http_client = HttpClient()
+    for _ in range(3):
+        assert http_client.get(stub_url + '/fast').ok
+
+    assert http_client.stats() == {
+        stub_url: {'requests': 3, 'new_connections': 1, 'reused_connections': 2}}
+
+
+def test_cookies_not_kept(stub_url):
+    http_client = HttpClient()
+    http_client.get(stub_url + '/fast')
+    assert http_client.get(stub_url + '/fast').text == 'no cookie'
+
+
+def test_timeout(stub_url):
+    http_client = HttpClient(read_timeout=0.1)
+    with pytest.raises(requests.exceptions.Timeout):
+        http_client.get(stub_url + '/slow')
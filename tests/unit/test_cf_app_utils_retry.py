@@ -0,0 +1,26 @@
+import pytest
+
+from data_acquisition.cf_app_utils import RetryPolicy
+import data_acquisition.cf_app_utils.retry
+
+
+@pytest.mark.parametrize('retry_number, max_delay', [
+    (1, 0.5),
+    (2, 1.0),
+    (3, 2.0),
+    (5, 3.0),
+])
+def test_delay_bounds(monkeypatch, retry_number, max_delay):
+    monkeypatch.setattr(data_acquisition.cf_app_utils.retry.random, 'uniform',
+                        lambda low, high: (low, high))
+    retry_policy = RetryPolicy(max_attempts=6, base_delay=0.5, max_delay=3.0)
+
+    assert retry_policy.get_delay(retry_number) == (0, max_delay)
+
+
+def test_delay_jittered():
+    retry_policy = RetryPolicy(base_delay=1.0)
+    delays = [retry_policy.get_delay(1) for _ in range(100)]
+
+    assert all(0 <= delay <= 1.0 for delay in delays)
+    assert len(set(delays)) > 1
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from data_acquisition.cf_app_utils import SingleFlight
+
+
+def test_sequential_calls_executed():
+    single_flight = SingleFlight()
+
+    assert single_flight.do('key', lambda value: value * 2, 2) == 4
+    assert single_flight.do('key', lambda value: value * 3, value=2) == 6
+    assert single_flight.stats() == {'executions': 2, 'shared': 0}
+
+
+def test_error_raised():
+    def fail():
+        raise ValueError('test error')
+
+    with pytest.raises(ValueError):
+        SingleFlight().do('key', fail)
+
+
+def test_concurrent_calls_share_execution():
+    single_flight = SingleFlight()
+    executing = threading.Event()
+    finish = threading.Event()
+    results = []
+
+    def function(value):
+        executing.set()
+        finish.wait(5)
+        return value
+
+    def call(value):
+        results.append(single_flight.do('key', function, value))
+
+    first_call = threading.Thread(target=call, args=('first',))
+    first_call.start()
+    executing.wait(5)
+    other_calls = [threading.Thread(target=call, args=('other',)) for _ in range(3)]
+    for thread in other_calls:
+        thread.start()
+    while single_flight.shared < 3:
+        time.sleep(0.001)
+    other_key_result = single_flight.do('other-key', lambda: 'not shared')
+    finish.set()
+    for thread in [first_call] + other_calls:
+        thread.join(5)
+
+    assert results == ['first'] * 4
+    assert other_key_result == 'not shared'
+    assert single_flight.stats() == {'executions': 2, 'shared': 3}
@@ -37,9 +37,50 @@ def test_config_creation():
     assert config.user_management_url == 'http://user-management.example.com' + USER_MANAGEMENT_PATH
     assert config.verification_key_url == 'http://uaa.example.com/token_key'
 
+    assert config.requests_cache_size == 10000
+    assert config.requests_cache_ttl == 300
+    assert config.permissions_cache_size == 10000
+    assert config.permissions_cache_ttl == 60
+    assert config.permissions_shared_cache_ttl == 30
+    assert config.token_cache_size == 10000
+    assert config.verification_key_refresh_interval == 300
+    assert config.http_pool_size == 10
+    assert config.http_connect_timeout == 3.05
+    assert config.http_read_timeout == 30
+    assert config.job_queue_size == 1000
+    assert config.download_coalescing_ttl == 3600
+    assert config.acquired_sources_cache_size == 0
+    assert config.acquired_sources_cache_ttl == 21600
+    assert config.idempotency_key_ttl == 86400
+    assert config.worker_min_concurrency == 2
+    assert config.worker_max_concurrency == 32
+    assert config.worker_latency_tolerance == 2
+    assert config.downloader_max_concurrency == 16
+    assert config.metadata_parser_max_concurrency == 16
+    assert config.worker_name == 'worker-0'
+    assert config.retry_max_attempts == 3
+    assert config.retry_base_delay == 0.5
+    assert config.retry_max_delay == 10
+    assert config.circuit_breaker_failure_threshold == 5
+    assert config.circuit_breaker_reset_timeout == 30
+
     assert config is DasConfig.get_config()
 
 
+def test_config_without_route():
+    os.environ['VCAP_SERVICES'] = TEST_VCAP_SERVICES
+    os.environ['VCAP_APPLICATION'] = json.dumps({'uris': []})
+    os.environ['VCAP_APP_PORT'] = '12345'
+    os.environ['CF_INSTANCE_INDEX'] = '3'
+    try:
+        config = DasConfig._gather_configuration()
+    finally:
+        del os.environ['CF_INSTANCE_INDEX']
+
+    assert config.self_url is None
+    assert config.worker_name == 'worker-3'
+
+
 def test_config_bad_service():
     with pytest.raises(NoServiceConfigurationError):
         DasConfig._get_service_value(
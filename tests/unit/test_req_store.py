@@ -1,10 +1,13 @@
 import copy
 import json
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, call
 
 import pytest
 
-from data_acquisition.acquisition_request import AcquisitionRequest, AcquisitionRequestStore
+from data_acquisition.acquisition_request import (AcquisitionRequest, AcquisitionRequestStore,
+                                                  RequestNotFoundError, RequestIdTakenError,
+                                                  InvalidCursorError,
+                                                  RequestState, encode_request, decode_request)
 from tests.consts import TEST_ACQUISITION_REQ, TEST_ACQUISITION_REQ_STR, TEST_ACQUISITION_REQ_JSON
 
 
@@ -24,36 +27,289 @@ def test_get_request_redis_id(req_store):
 
 
 def test_put(req_store, redis_mock):
+    script_mock = redis_mock.register_script.return_value
+    script_mock.return_value = 1
+
     req_store.put(TEST_ACQUISITION_REQ)
-    redis_mock.hset.assert_called_with(
-        AcquisitionRequestStore.REDIS_HASH_NAME,
-        AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ),
-        TEST_ACQUISITION_REQ_STR)
 
+    script_mock.assert_called_once_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+              AcquisitionRequestStore.REDIS_ID_INDEX_NAME,
+              AcquisitionRequestStore.get_org_index_name(TEST_ACQUISITION_REQ.orgUUID)],
+        args=[TEST_ACQUISITION_REQ.id,
+              AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ),
+              encode_request(TEST_ACQUISITION_REQ),
+              AcquisitionRequestStore.REDIS_INVALIDATION_CHANNEL])
+
+
+def test_put_id_taken(req_store, redis_mock):
+    redis_mock.register_script.return_value.return_value = 0
+
+    with pytest.raises(RequestIdTakenError):
+        req_store.put(TEST_ACQUISITION_REQ)
+
+
+def test_delete(req_store, redis_mock):
+    req_store.delete(TEST_ACQUISITION_REQ)
+    pipe_mock = redis_mock.pipeline.return_value
+    request_redis_id = AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ)
+    assert pipe_mock.hdel.call_args_list == [
+        call(AcquisitionRequestStore.REDIS_HASH_NAME, request_redis_id),
+        call(AcquisitionRequestStore.REDIS_ID_INDEX_NAME, TEST_ACQUISITION_REQ.id),
+    ]
+    pipe_mock.srem.assert_called_once_with(
+        AcquisitionRequestStore.get_org_index_name(TEST_ACQUISITION_REQ.orgUUID),
+        request_redis_id)
+    pipe_mock.publish.assert_called_once_with(
+        AcquisitionRequestStore.REDIS_INVALIDATION_CHANNEL, request_redis_id)
+
+
+def test_build_index(req_store, redis_mock):
+    redis_mock.get.return_value = None
+    redis_mock.hscan_iter.return_value = [(b'fake-org-uuid:fake-id', b'{}'),
+                                          (b'other-org-uuid:other-id', b'{}')]
+
+    req_store.build_index()
 
-def _get_store_id(acquisition_req):
-    return '{}:{}'.format(acquisition_req.orgUUID, acquisition_req.id).encode()
+    pipe_mock = redis_mock.pipeline.return_value
+    assert pipe_mock.hset.call_args_list == [
+        call(AcquisitionRequestStore.REDIS_ID_INDEX_NAME, 'fake-id', b'fake-org-uuid:fake-id'),
+        call(AcquisitionRequestStore.REDIS_ID_INDEX_NAME, 'other-id', b'other-org-uuid:other-id'),
+    ]
+    assert pipe_mock.sadd.call_args_list == [
+        call(AcquisitionRequestStore.get_org_index_name('fake-org-uuid'), b'fake-org-uuid:fake-id'),
+        call(AcquisitionRequestStore.get_org_index_name('other-org-uuid'),
+             b'other-org-uuid:other-id'),
+    ]
+    pipe_mock.set.assert_called_once_with(AcquisitionRequestStore.REDIS_INDEX_VERSION_KEY,
+                                          AcquisitionRequestStore.INDEX_VERSION)
+
+
+def test_build_index_up_to_date(req_store, redis_mock):
+    redis_mock.get.return_value = str(AcquisitionRequestStore.INDEX_VERSION).encode()
+    req_store.build_index()
+    assert not redis_mock.hscan_iter.called
 
 
 def test_get_for_org(req_store, redis_mock):
-    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(3)]
-    test_requests[1].orgUUID = 'other-fake-uuid'
-    test_requests[2].id = 'other-fake-id'
-    redis_mock.hgetall.return_value = {_get_store_id(req): str(req).encode()
-                                       for req in test_requests}
+    test_requests = [copy.deepcopy(TEST_ACQUISITION_REQ) for _ in range(2)]
+    test_requests[1].id = 'other-fake-id'
+    get_for_org_script_mock = redis_mock.register_script.return_value
+    get_for_org_script_mock.return_value = [str(req).encode() for req in test_requests]
 
     acquisition_requests = req_store.get_for_org('fake-org-uuid')
 
-    assert test_requests[0] in acquisition_requests
-    assert test_requests[2] in acquisition_requests
+    assert acquisition_requests == test_requests
+    get_for_org_script_mock.assert_called_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+              AcquisitionRequestStore.get_org_index_name('fake-org-uuid')])
+
+
+def test_get_for_orgs(req_store, redis_mock):
+    get_for_orgs_script_mock = redis_mock.register_script.return_value
+    get_for_orgs_script_mock.return_value = [TEST_ACQUISITION_REQ_STR.encode()]
+
+    acquisition_requests = req_store.get_for_orgs(['fake-org-uuid', 'other-org-uuid'])
+
+    assert acquisition_requests == [TEST_ACQUISITION_REQ]
+    get_for_orgs_script_mock.assert_called_once_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+              AcquisitionRequestStore.get_org_index_name('fake-org-uuid'),
+              AcquisitionRequestStore.get_org_index_name('other-org-uuid')])
+
+
+def test_get_for_orgs_no_orgs(req_store, redis_mock):
+    assert req_store.get_for_orgs([]) == []
+    assert not redis_mock.register_script.return_value.called
 
 
 def test_get_from_old_base(req_store, redis_mock):
     old_request = dict(TEST_ACQUISITION_REQ_JSON)
     old_request.update({'unnecessary_field': 'blablabla'})
-    redis_mock.hgetall.return_value = {b'fake-org-uuid:fake-id': json.dumps(old_request).encode()}
+    get_script_mock = redis_mock.register_script.return_value
+    get_script_mock.return_value = json.dumps(old_request).encode()
 
     acquisition_req = req_store.get('fake-id')
 
     assert acquisition_req == AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
-    redis_mock.hgetall.assert_called_with(AcquisitionRequestStore.REDIS_HASH_NAME)
\ No newline at end of file
+    get_script_mock.assert_called_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME, AcquisitionRequestStore.REDIS_ID_INDEX_NAME],
+        args=['fake-id'])
+
+
+def test_get_not_found(req_store, redis_mock):
+    redis_mock.register_script.return_value.return_value = None
+    redis_mock.hscan_iter.return_value = iter([(b'fake-org-uuid:other-fake-id', b'{}')])
+    with pytest.raises(RequestNotFoundError):
+        req_store.get('fake-id')
+    assert not redis_mock.pipeline.called
+
+
+def test_get_unindexed(req_store, redis_mock):
+    get_script_mock = redis_mock.register_script.return_value
+    get_script_mock.side_effect = [None, TEST_ACQUISITION_REQ_STR.encode()]
+    redis_mock.hscan_iter.return_value = iter([(b'fake-org-uuid:fake-id', b'{}')])
+
+    assert req_store.get('fake-id') == TEST_ACQUISITION_REQ
+
+    redis_mock.hscan_iter.assert_called_once_with(
+        AcquisitionRequestStore.REDIS_HASH_NAME, match='*:fake-id',
+        count=AcquisitionRequestStore.INDEX_BUILD_BATCH_SIZE)
+    pipe_mock = redis_mock.pipeline.return_value
+    pipe_mock.hsetnx.assert_called_once_with(
+        AcquisitionRequestStore.REDIS_ID_INDEX_NAME, 'fake-id', b'fake-org-uuid:fake-id')
+    pipe_mock.sadd.assert_called_once_with(
+        AcquisitionRequestStore.get_org_index_name('fake-org-uuid'), b'fake-org-uuid:fake-id')
+    assert pipe_mock.execute.called
+
+
+def test_get_unindexed_id_escaped(req_store, redis_mock):
+    redis_mock.register_script.return_value.return_value = None
+    redis_mock.hscan_iter.return_value = iter([])
+
+    with pytest.raises(RequestNotFoundError):
+        req_store.get('fake-*id?')
+
+    assert redis_mock.hscan_iter.call_args[1]['match'] == r'*:fake-\*id\?'
+
+def test_transition(req_store, redis_mock, monkeypatch):
+    monkeypatch.setattr('time.time', lambda: 234.25)
+    transitioned_request = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+    transitioned_request.state = 'ERROR'
+    transitioned_request.timestamps['ERROR'] = 234
+    transition_script_mock = redis_mock.register_script.return_value
+    transition_script_mock.return_value = str(transitioned_request).encode()
+
+    acquisition_req = req_store.transition('fake-id', 'ERROR')
+
+    assert acquisition_req == transitioned_request
+    transition_script_mock.assert_called_once_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME, AcquisitionRequestStore.REDIS_ID_INDEX_NAME],
+        args=['fake-id', 'ERROR', 234, 4, 1, AcquisitionRequestStore.REDIS_INVALIDATION_CHANNEL])
+
+
+def test_transition_not_found(req_store, redis_mock):
+    redis_mock.register_script.return_value.return_value = None
+    with pytest.raises(RequestNotFoundError):
+        req_store.transition('fake-id', 'ERROR')
+
+
+def test_get_page_for_orgs(req_store, redis_mock):
+    get_page_script_mock = redis_mock.register_script.return_value
+    get_page_script_mock.side_effect = [
+        [b'0', [TEST_ACQUISITION_REQ_STR.encode(), None]],
+        [b'17', [TEST_ACQUISITION_REQ_STR.encode()]],
+    ]
+
+    acquisition_requests, next_cursor = req_store.get_page_for_orgs(
+        ['fake-org-uuid', 'other-org-uuid'], limit=2)
+
+    assert acquisition_requests == [TEST_ACQUISITION_REQ, TEST_ACQUISITION_REQ]
+    assert next_cursor == '1-17'
+    assert get_page_script_mock.call_args_list == [
+        call(keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+                   AcquisitionRequestStore.get_org_index_name('fake-org-uuid')],
+             args=[0, 2]),
+        call(keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+                   AcquisitionRequestStore.get_org_index_name('other-org-uuid')],
+             args=[0, 1]),
+    ]
+
+
+def test_get_page_for_orgs_last_page(req_store, redis_mock):
+    get_page_script_mock = redis_mock.register_script.return_value
+    get_page_script_mock.return_value = [b'0', [TEST_ACQUISITION_REQ_STR.encode()]]
+
+    acquisition_requests, next_cursor = req_store.get_page_for_orgs(
+        ['fake-org-uuid', 'other-org-uuid'], cursor='1-17', limit=10)
+
+    assert acquisition_requests == [TEST_ACQUISITION_REQ]
+    assert next_cursor is None
+    get_page_script_mock.assert_called_once_with(
+        keys=[AcquisitionRequestStore.REDIS_HASH_NAME,
+              AcquisitionRequestStore.get_org_index_name('other-org-uuid')],
+        args=[17, 10])
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', '1', '1-2-3', '2-0', '-1-0', '0--1'])
+def test_get_page_for_orgs_invalid_cursor(req_store, cursor):
+    with pytest.raises(InvalidCursorError):
+        req_store.get_page_for_orgs(['fake-org-uuid', 'other-org-uuid'], cursor=cursor)
+
+
+def test_iter_all(req_store, redis_mock):
+    redis_mock.hscan_iter.return_value = iter([
+        (b'fake-org-uuid:fake-id', TEST_ACQUISITION_REQ_STR.encode())])
+
+    assert list(req_store.iter_all(batch_size=10)) == [TEST_ACQUISITION_REQ]
+    redis_mock.hscan_iter.assert_called_once_with(AcquisitionRequestStore.REDIS_HASH_NAME, count=10)
+
+
+def test_request_json_round_trip():
+    acquisition_req = copy.deepcopy(TEST_ACQUISITION_REQ)
+    acquisition_req.set_downloaded()
+
+    deserialized_req = AcquisitionRequest.from_json(acquisition_req.to_json().encode())
+
+    assert deserialized_req == acquisition_req
+    assert deserialized_req.state is RequestState.DOWNLOADED
+    assert json.loads(acquisition_req.to_json()) == dict(
+        TEST_ACQUISITION_REQ_JSON,
+        state='DOWNLOADED',
+        timestamps=acquisition_req.timestamps)
+
+
+def test_request_json_with_non_integer_timestamps():
+    acquisition_req = AcquisitionRequest(**dict(TEST_ACQUISITION_REQ_JSON,
+                                                timestamps={'NEW': True, 'VALIDATED': 1.5}))
+
+    assert json.loads(acquisition_req.to_json())['timestamps'] == {'NEW': True,
+                                                                   'VALIDATED': 1.5}
+
+
+def test_request_from_dict_ignores_unknown_fields():
+    req_dict = dict(TEST_ACQUISITION_REQ_JSON, unnecessary_field='blablabla')
+    assert AcquisitionRequest.from_dict(req_dict) == TEST_ACQUISITION_REQ
+
+
+def test_request_state_is_enum():
+    acquisition_req = copy.deepcopy(TEST_ACQUISITION_REQ)
+    acquisition_req.state = 'ERROR'
+
+    assert acquisition_req.state is RequestState.ERROR
+    assert acquisition_req.state == 'ERROR'
+    with pytest.raises(ValueError):
+        acquisition_req.state = 'NOT_A_STATE'
+
+
+def test_request_has_no_dict():
+    with pytest.raises(AttributeError):
+        TEST_ACQUISITION_REQ.__dict__ #pylint: disable=pointless-statement
+
+
+def test_encode_request():
+    acquisition_req = copy.deepcopy(TEST_ACQUISITION_REQ)
+    acquisition_req.set_downloaded()
+    acquisition_req.set_error()
+
+    encoded_req = encode_request(acquisition_req)
+
+    assert encoded_req[0] == 1
+    assert len(encoded_req) < len(acquisition_req.to_json())
+    assert decode_request(encoded_req) == acquisition_req
+
+
+def test_encode_request_unknown_timestamp_state():
+    acquisition_req = AcquisitionRequest(**dict(TEST_ACQUISITION_REQ_JSON,
+                                                timestamps={'VALIDATED': 1, 'OLD_STATE': 2}))
+
+    assert decode_request(encode_request(acquisition_req)) == acquisition_req
+
+
+def test_decode_request_json():
+    assert decode_request(TEST_ACQUISITION_REQ_STR.encode()) == TEST_ACQUISITION_REQ
+
+
+def test_decode_request_unknown_format():
+    with pytest.raises(ValueError):
+        decode_request(b'\xff' + encode_request(TEST_ACQUISITION_REQ)[1:])
@@ -0,0 +1,144 @@
+import copy
+from unittest.mock import MagicMock
+
+import pytest
+import redis
+
+from data_acquisition.acquisition_request import AcquisitionRequestStore, encode_request
+from data_acquisition.request_cache import CachedAcquisitionRequestStore
+from tests.consts import TEST_ACQUISITION_REQ
+
+
+@pytest.fixture
+def redis_mock():
+    return MagicMock()
+
+
+@pytest.fixture
+def script_mock(redis_mock):
+    return redis_mock.register_script.return_value
+
+
+@pytest.fixture
+def cached_store(redis_mock):
+    return CachedAcquisitionRequestStore(redis_mock, max_size=100)
+
+
+def test_get_cached(cached_store, script_mock):
+    script_mock.return_value = encode_request(TEST_ACQUISITION_REQ)
+
+    assert cached_store.get(TEST_ACQUISITION_REQ.id) == TEST_ACQUISITION_REQ
+    assert cached_store.get(TEST_ACQUISITION_REQ.id) == TEST_ACQUISITION_REQ
+
+    assert script_mock.call_count == 1
+    assert cached_store.stats()['hits'] == 1
+    assert cached_store.stats()['misses'] == 1
+
+
+def test_get_for_orgs_cached(cached_store, script_mock):
+    other_org_req = copy.deepcopy(TEST_ACQUISITION_REQ)
+    other_org_req.id, other_org_req.orgUUID = 'other-fake-id', 'other-org-uuid'
+    script_mock.return_value = [encode_request(TEST_ACQUISITION_REQ)]
+    assert cached_store.get_for_orgs([TEST_ACQUISITION_REQ.orgUUID]) == [TEST_ACQUISITION_REQ]
+
+    script_mock.return_value = [encode_request(other_org_req)]
+    acquisition_requests = cached_store.get_for_orgs(
+        ['other-org-uuid', TEST_ACQUISITION_REQ.orgUUID, 'empty-org-uuid'])
+
+    assert acquisition_requests == [other_org_req, TEST_ACQUISITION_REQ]
+    script_mock.assert_called_with(keys=[
+        AcquisitionRequestStore.REDIS_HASH_NAME,
+        AcquisitionRequestStore.get_org_index_name('other-org-uuid'),
+        AcquisitionRequestStore.get_org_index_name('empty-org-uuid')])
+    assert cached_store.get_for_orgs(['empty-org-uuid']) == []
+    assert script_mock.call_count == 2
+
+
+@pytest.mark.parametrize('change', [
+    lambda store: store.put(TEST_ACQUISITION_REQ),
+    lambda store: store.delete(TEST_ACQUISITION_REQ),
+    lambda store: store.transition(TEST_ACQUISITION_REQ.id, 'ERROR'),
+    lambda store: store._invalidate(AcquisitionRequestStore.get_request_redis_id(
+        TEST_ACQUISITION_REQ)),
+])
+def test_changes_invalidate(change, cached_store, script_mock):
+    script_mock.return_value = encode_request(TEST_ACQUISITION_REQ)
+    cached_store.get(TEST_ACQUISITION_REQ.id)
+    script_mock.return_value = [encode_request(TEST_ACQUISITION_REQ)]
+    cached_store.get_for_orgs([TEST_ACQUISITION_REQ.orgUUID])
+
+    script_mock.return_value = encode_request(TEST_ACQUISITION_REQ)
+    change(cached_store)
+
+    assert cached_store._cache.stats()['size'] == 0
+    assert cached_store.stats()['invalidations'] == 1
+
+
+def test_read_overlapping_invalidation_not_cached(cached_store, script_mock):
+    def get_script(**_):
+        cached_store._invalidate(AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ))
+        return encode_request(TEST_ACQUISITION_REQ)
+    script_mock.side_effect = get_script
+
+    cached_store.get(TEST_ACQUISITION_REQ.id)
+
+    assert cached_store._cache.stats()['size'] == 0
+
+
+def test_invalidation_listener(cached_store, redis_mock):
+    cached_store._cache.put(('request', TEST_ACQUISITION_REQ.id), TEST_ACQUISITION_REQ)
+    pubsub_mock = redis_mock.pubsub.return_value
+
+    def listen():
+        assert cached_store._cache.stats()['size'] == 0
+        cached_store._cache.put(('request', TEST_ACQUISITION_REQ.id), TEST_ACQUISITION_REQ)
+        yield {'type': 'message',
+               'data': AcquisitionRequestStore.get_request_redis_id(TEST_ACQUISITION_REQ).encode()}
+        assert cached_store._cache.stats()['size'] == 0
+        raise redis.exceptions.ConnectionError()
+    def listen_with_unexpected_error():
+        cached_store._cache.put(('request', TEST_ACQUISITION_REQ.id), TEST_ACQUISITION_REQ)
+        raise ValueError()
+        yield #pylint: disable=unreachable
+    listeners = [listen(), listen_with_unexpected_error(), listen()]
+    pubsub_mock.listen.side_effect = lambda: listeners.pop(0)
+
+    class StopListening(Exception):
+        pass
+    cached_store.RECONNECT_DELAY = 0
+    pubsub_mock.reset.side_effect = [None, None, StopListening()]
+
+    with pytest.raises(StopListening):
+        cached_store._listen_for_invalidations()
+
+    # the listener reconnected after losing the connection and after an unexpected error
+    assert pubsub_mock.subscribe.call_count == 3
+    assert cached_store._cache.stats()['size'] == 0
+    pubsub_mock.subscribe.assert_called_with(AcquisitionRequestStore.REDIS_INVALIDATION_CHANNEL)
+    assert cached_store.stats()['invalidations'] == 2
+
+
+def test_nothing_cached_after_listener_stopped(cached_store, redis_mock, script_mock):
+    redis_mock.pubsub.side_effect = SystemExit()
+    with pytest.raises(SystemExit):
+        cached_store._listen_for_invalidations()
+
+    script_mock.return_value = encode_request(TEST_ACQUISITION_REQ)
+    cached_store.get(TEST_ACQUISITION_REQ.id)
+
+    assert cached_store._cache.stats()['size'] == 0
+
+
+def test_org_lists_sized_by_requests(redis_mock, script_mock):
+    cached_store = CachedAcquisitionRequestStore(redis_mock, max_size=2)
+    other_req = copy.deepcopy(TEST_ACQUISITION_REQ)
+    other_req.id = 'other-fake-id'
+    script_mock.return_value = [encode_request(TEST_ACQUISITION_REQ)] * 3
+    cached_store.get_for_orgs([TEST_ACQUISITION_REQ.orgUUID])
+    assert cached_store._cache.stats()['size'] == 0
+
+    script_mock.return_value = [encode_request(TEST_ACQUISITION_REQ), encode_request(other_req)]
+    cached_store.get_for_orgs([TEST_ACQUISITION_REQ.orgUUID])
+    assert cached_store._cache.stats()['size'] == 2
+    cached_store.get_for_orgs([TEST_ACQUISITION_REQ.orgUUID])
+    assert script_mock.call_count == 2
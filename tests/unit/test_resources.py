@@ -9,20 +9,28 @@ from bravado_falcon import FalconHttpClient
 import falcon
 import pytest
 import pytest_falcon.plugin
-import responses
+import redis
 import yaml
 
-from data_acquisition.acquisition_request import AcquisitionRequest, RequestNotFoundError
+import data_acquisition.app
+from data_acquisition.acquisition_request import (AcquisitionRequest, RequestNotFoundError,
+                                                  RequestIdTakenError, InvalidCursorError)
+from data_acquisition.cf_app_utils.auth.falcon import JwtMiddleware
+from data_acquisition.download_coalescer import WaitingRequest
+from data_acquisition.job_queue import QueueFullError
+from data_acquisition.source_cache import AcquiredSource
 from data_acquisition.consts import (ACQUISITION_PATH, DOWNLOAD_CALLBACK_PATH,
-                                     METADATA_PARSER_CALLBACK_PATH, GET_REQUEST_PATH)
+                                     METADATA_PARSER_CALLBACK_PATH, GET_REQUEST_PATH,
+                                     NEXT_CURSOR_HEADER, ADMIN_REQUESTS_PATH, STATS_PATH,
+                                     UPLOADER_REQUEST_PATH, IDEMPOTENT_REPLAYED_HEADER)
 from data_acquisition.resources import (get_download_callback_url, get_metadata_callback_url,
                                         AcquisitionResource)
 import tests
 from tests.consts import (TEST_DOWNLOAD_REQUEST, TEST_DOWNLOAD_CALLBACK, TEST_ACQUISITION_REQ,
-                          TEST_ACQUISITION_REQ_JSON)
+                          TEST_ACQUISITION_REQ_JSON, TEST_AUTH_HEADER, TEST_ADMIN_AUTH_HEADER,
+                          TEST_ORG_UUID, RSA_2048_PUB_KEY)
 
 FAKE_TIME = 234.25
-FAKE_TIMESTAMP = 234
 
 
 @pytest.fixture(scope='function')
@@ -54,8 +62,8 @@ def client_swagger(falcon_api, swagger_spec):
 
 
 @pytest.fixture(scope='function')
-def acquisition_requests_resource(das_config, mock_executor, mock_req_store, fake_time):
-    return AcquisitionResource(mock_req_store, mock_executor, das_config)
+def acquisition_requests_resource(das_config, mock_job_queue, mock_req_store, fake_time):
+    return AcquisitionResource(mock_req_store, mock_job_queue, das_config)
 
 
 @pytest.fixture(scope='function')
@@ -79,13 +87,22 @@ def test_get_metadata_callback_url():
     assert callback_url == 'https://some-test-das-url/v1/das/callback/metadata/some-test-id'
 
 
-@responses.activate
-def test_external_service_call_not_ok(acquisition_requests_resource):
-    test_url = 'https://some-fake-url/'
-    responses.add(responses.POST, test_url, status=404)
+def test_acquisition_request_enqueued(das_api, client, mock_req_store, mock_job_queue):
+    das_api.acquisition_res._org_checker = MagicMock()
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
 
-    assert not acquisition_requests_resource._external_service_call(
-        url=test_url, data={'a': 'b'}, token='bearer fake-token', request_id='some-fake-id')
+    assert response.status == falcon.HTTP_202
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_job_queue.enqueue.assert_called_once_with(
+        das_api.acquisition_res._config.downloader_url,
+        {
+            'source': TEST_DOWNLOAD_REQUEST['source'],
+            'callback': get_download_callback_url('http://my-fake-url', stored_request.id)
+        },
+        None,
+        stored_request.id,
+        stored_request.orgUUID)
 
 
 def test_processing_acquisition_request_for_hdfs(acquisition_requests_resource, mock_req_store):
@@ -115,7 +132,101 @@ def test_acquisition_bad_request(client_no_req_validation):
         client_no_req_validation.rest.submitAcquisitionRequest(body=broken_request).result()
 
 
-def test_downloader_callback_failed(client, fake_time, mock_req_store, req_store_get):
+def test_acquisition_request_invalid_state(client):
+    response = client.post(ACQUISITION_PATH, dict(TEST_DOWNLOAD_REQUEST, state='NOT_A_STATE'))
+    assert response.status == falcon.HTTP_400
+
+
+def test_acquisition_request_id_generated(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+
+    response = client.post(ACQUISITION_PATH, dict(TEST_DOWNLOAD_REQUEST, id='other-request-id'))
+
+    assert response.status == falcon.HTTP_202
+    stored_request = mock_req_store.put.call_args[0][0]
+    assert stored_request.id != 'other-request-id'
+    assert json.loads(response.body)['id'] == stored_request.id
+
+
+def test_uploader_request_id_taken(client, mock_req_store, mock_job_queue):
+    mock_req_store.put.side_effect = RequestIdTakenError()
+
+    response = client.post(UPLOADER_REQUEST_PATH,
+                           dict(TEST_DOWNLOAD_REQUEST, idInObjectStore='fake-object-id',
+                                id=TEST_ACQUISITION_REQ.id))
+
+    assert response.status == falcon.HTTP_409
+    assert not mock_job_queue.enqueue.called
+
+
+@pytest.mark.parametrize('invalid_fields', [
+    {'timestamps': {'VALIDATED': 'abc'}},
+    {'timestamps': {'X': 1}},
+    {'timestamps': 'abc'},
+])
+def test_acquisition_request_invalid_fields(client, mock_req_store, invalid_fields):
+    response = client.post(ACQUISITION_PATH, dict(TEST_DOWNLOAD_REQUEST, **invalid_fields))
+
+    assert response.status == falcon.HTTP_400
+    assert not mock_req_store.put.called
+
+
+def test_downloader_callback(client, mock_req_store, mock_job_queue):
+    downloaded_request = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+    downloaded_request.state = 'DOWNLOADED'
+    mock_req_store.transition.return_value = downloaded_request
+
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=TEST_DOWNLOAD_CALLBACK)
+
+    assert response.status == falcon.HTTP_200
+    mock_req_store.transition.assert_called_once_with(TEST_ACQUISITION_REQ.id, 'DOWNLOADED')
+    assert not mock_req_store.put.called
+    metadata_req = mock_job_queue.enqueue.call_args[0][1]
+    assert metadata_req['idInObjectStore'] == TEST_DOWNLOAD_CALLBACK['savedObjectId']
+
+
+def test_acquisition_request_queue_full(das_api, client, mock_req_store, mock_job_queue):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_job_queue.enqueue.side_effect = QueueFullError()
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_503
+    assert response.headers['retry-after'] == '10'
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.delete.assert_called_once_with(stored_request)
+
+
+def test_uploader_request_queue_full(client, mock_req_store, mock_job_queue):
+    mock_job_queue.enqueue.side_effect = QueueFullError()
+
+    response = client.post(UPLOADER_REQUEST_PATH,
+                           dict(TEST_DOWNLOAD_REQUEST, idInObjectStore='fake-object-id'))
+
+    assert response.status == falcon.HTTP_503
+    assert response.headers['retry-after'] == '10'
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.delete.assert_called_once_with(stored_request)
+
+
+def test_downloader_callback_queue_full(client, mock_req_store, mock_job_queue):
+    mock_req_store.transition.return_value = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+    mock_job_queue.enqueue.side_effect = QueueFullError()
+
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=TEST_DOWNLOAD_CALLBACK)
+
+    assert response.status == falcon.HTTP_503
+    assert mock_req_store.transition.call_args_list == [
+        call(TEST_ACQUISITION_REQ.id, 'DOWNLOADED'),
+        call(TEST_ACQUISITION_REQ.id, 'ERROR'),
+    ]
+
+
+def test_downloader_callback_failed(client, mock_req_store):
     failed_callback_req = dict(TEST_DOWNLOAD_CALLBACK)
     failed_callback_req['state'] = 'ERROR'
 
@@ -124,23 +235,306 @@ def test_downloader_callback_failed(client, fake_time, mock_req_store, req_store
         data=failed_callback_req)
 
     assert response.status == falcon.HTTP_200
+    mock_req_store.transition.assert_called_once_with(TEST_ACQUISITION_REQ.id, 'ERROR')
+    assert not mock_req_store.put.called
+
+
+@pytest.fixture
+def mock_download_coalescer(das_api):
+    download_coalescer = MagicMock()
+    download_coalescer.join.return_value = None
+    download_coalescer.complete.return_value = []
+    das_api.acquisition_res._download_coalescer = download_coalescer
+    das_api.download_callback_res._download_coalescer = download_coalescer
+    return download_coalescer
+
 
-    updated_request = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
-    updated_request.state = 'ERROR'
-    updated_request.timestamps['ERROR'] = FAKE_TIMESTAMP
-    mock_req_store.put.assert_called_with(updated_request)
+def test_acquisition_request_starts_download(das_api, client, mock_req_store, mock_job_queue,
+                                             mock_download_coalescer):
+    das_api.acquisition_res._org_checker = MagicMock()
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_202
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_download_coalescer.join.assert_called_once_with(TEST_DOWNLOAD_REQUEST['source'],
+                                                         stored_request.id, None)
+    assert mock_job_queue.enqueue.call_args[0][0] == das_api.acquisition_res._config.downloader_url
+
+
+def test_acquisition_request_waits_for_download(das_api, client, mock_req_store, mock_job_queue,
+                                                mock_download_coalescer):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_download_coalescer.join.return_value = 'other-fake-id'
 
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_202
+    assert json.loads(response.body)['state'] == 'VALIDATED'
+    assert mock_req_store.put.called
+    assert not mock_job_queue.enqueue.called
+
+
+def test_acquisition_request_queue_full_fails_waiting_requests(
+        das_api, client, mock_req_store, mock_job_queue, mock_download_coalescer):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_job_queue.enqueue.side_effect = QueueFullError()
+    mock_download_coalescer.complete.return_value = [WaitingRequest('waiting-id', 'bearer token')]
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_503
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.delete.assert_called_once_with(stored_request)
+    mock_download_coalescer.complete.assert_called_once_with(stored_request.id)
+    mock_req_store.transition.assert_called_once_with('waiting-id', 'ERROR')
+
+
+def test_downloader_callback_fanned_out(client, mock_req_store, mock_job_queue,
+                                        mock_download_coalescer):
+    mock_download_coalescer.complete.return_value = [
+        WaitingRequest('waiting-id-1', 'bearer token-1'),
+        WaitingRequest('deleted-id', 'bearer token-2'),
+        WaitingRequest('waiting-id-3', 'bearer token-3'),
+    ]
+    def transition(req_id, new_state):
+        if req_id == 'deleted-id':
+            raise RequestNotFoundError()
+        return AcquisitionRequest(**dict(TEST_ACQUISITION_REQ_JSON, id=req_id, state=new_state))
+    mock_req_store.transition.side_effect = transition
+
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=TEST_DOWNLOAD_CALLBACK)
+
+    assert response.status == falcon.HTTP_200
+    mock_download_coalescer.complete.assert_called_once_with(TEST_ACQUISITION_REQ.id)
+    assert mock_req_store.transition.call_args_list == [
+        call(req_id, 'DOWNLOADED')
+        for req_id in ['waiting-id-1', 'deleted-id', 'waiting-id-3', TEST_ACQUISITION_REQ.id]]
+    enqueued_calls = [(args[1]['id'], args[1]['idInObjectStore'], args[2])
+                      for args, _ in mock_job_queue.enqueue.call_args_list]
+    assert enqueued_calls == [
+        ('waiting-id-1', TEST_DOWNLOAD_CALLBACK['savedObjectId'], 'bearer token-1'),
+        ('waiting-id-3', TEST_DOWNLOAD_CALLBACK['savedObjectId'], 'bearer token-3'),
+        (TEST_ACQUISITION_REQ.id, TEST_DOWNLOAD_CALLBACK['savedObjectId'], None),
+    ]
+
+
+def test_downloader_callback_fanned_out_queue_full(client, mock_req_store, mock_job_queue,
+                                                   mock_download_coalescer):
+    mock_download_coalescer.complete.return_value = [WaitingRequest('waiting-id', 'bearer token')]
+    mock_req_store.transition.side_effect = lambda req_id, new_state: AcquisitionRequest(
+        **dict(TEST_ACQUISITION_REQ_JSON, id=req_id, state=new_state))
+    mock_job_queue.enqueue.side_effect = [QueueFullError(), None]
+
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=TEST_DOWNLOAD_CALLBACK)
+
+    assert response.status == falcon.HTTP_200
+    assert mock_req_store.transition.call_args_list == [
+        call('waiting-id', 'DOWNLOADED'),
+        call('waiting-id', 'ERROR'),
+        call(TEST_ACQUISITION_REQ.id, 'DOWNLOADED'),
+    ]
+    assert mock_job_queue.enqueue.call_count == 2
+
+
+def test_downloader_callback_retried_without_waiting_requests(client, mock_req_store,
+                                                             mock_job_queue,
+                                                             mock_download_coalescer):
+    mock_download_coalescer.complete.side_effect = [
+        [WaitingRequest('waiting-id', 'bearer token')], []]
+    mock_req_store.transition.side_effect = lambda req_id, new_state: AcquisitionRequest(
+        **dict(TEST_ACQUISITION_REQ_JSON, id=req_id, state=new_state))
+    mock_job_queue.enqueue.side_effect = [None, QueueFullError(), None]
+
+    responses = [client.post(path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+                             data=TEST_DOWNLOAD_CALLBACK)
+                 for _ in range(2)]
+
+    assert [response.status for response in responses] == [falcon.HTTP_503, falcon.HTTP_200]
+    enqueued_ids = [call_args[0][3] for call_args in mock_job_queue.enqueue.call_args_list]
+    assert enqueued_ids == ['waiting-id', TEST_ACQUISITION_REQ.id, TEST_ACQUISITION_REQ.id]
+
+
+def test_downloader_callback_failed_fanned_out(client, mock_req_store, mock_job_queue,
+                                               mock_download_coalescer):
+    mock_download_coalescer.complete.return_value = [WaitingRequest('waiting-id', 'bearer token')]
+    failed_callback_req = dict(TEST_DOWNLOAD_CALLBACK, state='ERROR')
 
-def test_metadata_callback_failed(client, fake_time, mock_req_store, req_store_get):
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=failed_callback_req)
+
+    assert response.status == falcon.HTTP_200
+    assert mock_req_store.transition.call_args_list == [
+        call('waiting-id', 'ERROR'),
+        call(TEST_ACQUISITION_REQ.id, 'ERROR'),
+    ]
+    assert not mock_job_queue.enqueue.called
+
+
+@pytest.fixture
+def mock_source_cache(das_api):
+    source_cache = MagicMock()
+    source_cache.get.return_value = None
+    das_api.acquisition_res._source_cache = source_cache
+    das_api.download_callback_res._source_cache = source_cache
+    return source_cache
+
+
+def test_acquisition_of_cached_source(das_api, client, mock_req_store, mock_job_queue,
+                                      mock_source_cache, mock_download_coalescer):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_source_cache.get.return_value = AcquiredSource('fake-guid/000000_1',
+                                                        'hdfs://some-fake-hdfs-path', 1000.0)
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_202
+    assert json.loads(response.body)['state'] == 'DOWNLOADED'
+    mock_source_cache.get.assert_called_once_with(TEST_DOWNLOAD_REQUEST['source'])
+    assert mock_req_store.put.call_args[0][0].state == 'DOWNLOADED'
+    assert not mock_download_coalescer.join.called
+    url, metadata_req = mock_job_queue.enqueue.call_args[0][:2]
+    assert url == das_api.acquisition_res._config.metadata_parser_url
+    assert metadata_req['idInObjectStore'] == 'fake-guid/000000_1'
+
+
+def test_acquisition_of_uncached_source(das_api, client, mock_req_store, mock_job_queue,
+                                        mock_source_cache):
+    das_api.acquisition_res._org_checker = MagicMock()
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_202
+    assert json.loads(response.body)['state'] == 'VALIDATED'
+    assert mock_job_queue.enqueue.call_args[0][0] == das_api.acquisition_res._config.downloader_url
+
+
+def test_downloader_callback_caches_source(client, mock_req_store, mock_source_cache):
+    mock_req_store.transition.return_value = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
+
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=TEST_DOWNLOAD_CALLBACK)
+
+    assert response.status == falcon.HTTP_200
+    mock_source_cache.put.assert_called_once_with(TEST_ACQUISITION_REQ.source,
+                                                  TEST_DOWNLOAD_CALLBACK['savedObjectId'],
+                                                  TEST_DOWNLOAD_CALLBACK['objectStoreId'])
+
+
+def test_failed_download_not_cached(client, mock_req_store, mock_source_cache):
+    response = client.post(
+        path=DOWNLOAD_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
+        data=dict(TEST_DOWNLOAD_CALLBACK, state='ERROR'))
+
+    assert response.status == falcon.HTTP_200
+    assert not mock_source_cache.put.called
+
+
+@pytest.fixture
+def idempotent_client(das_api, das_config, falcon_api):
+    das_config.idempotency_key_ttl = 60
+    das_api.acquisition_res._org_checker = MagicMock()
+    client = pytest_falcon.plugin.Client(falcon_api)
+    client.post = (lambda path, data, idempotency_key, post=client.post:
+                   post(path, json.dumps(data), headers={'Content-Type': 'application/json',
+                                                         'Idempotency-Key': idempotency_key}))
+    return client
+
+
+def test_acquisition_request_with_new_idempotency_key(idempotent_client, mock_req_store,
+                                                      mock_job_queue):
+    mock_req_store.claim_idempotency_key.return_value = None
+
+    response = idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'some-key')
+
+    assert response.status == falcon.HTTP_202
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.claim_idempotency_key.assert_called_once_with(
+        TEST_ORG_UUID, 'some-key', stored_request.id, 60)
+    assert mock_job_queue.enqueue.called
+    assert IDEMPOTENT_REPLAYED_HEADER.lower() not in response.headers
+
+
+def test_acquisition_request_replayed(idempotent_client, mock_req_store, mock_job_queue):
+    mock_req_store.claim_idempotency_key.return_value = (TEST_ACQUISITION_REQ.id,
+                                                         TEST_ACQUISITION_REQ)
+
+    response = idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'some-key')
+
+    assert response.status == falcon.HTTP_202
+    assert json.loads(response.body) == TEST_ACQUISITION_REQ_JSON
+    assert response.headers[IDEMPOTENT_REPLAYED_HEADER.lower()] == 'true'
+    assert not mock_req_store.put.called
+    assert not mock_job_queue.enqueue.called
+
+
+def test_acquisition_request_replayed_while_processed(idempotent_client, mock_req_store,
+                                                      mock_job_queue):
+    mock_req_store.claim_idempotency_key.return_value = (TEST_ACQUISITION_REQ.id, None)
+
+    response = idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'some-key')
+
+    assert response.status == falcon.HTTP_409
+    assert not mock_req_store.put.called
+    assert not mock_job_queue.enqueue.called
+
+
+def test_idempotency_key_released_when_queue_full(idempotent_client, mock_req_store,
+                                                  mock_job_queue):
+    mock_req_store.claim_idempotency_key.return_value = None
+    mock_job_queue.enqueue.side_effect = QueueFullError()
+
+    response = idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'some-key')
+
+    assert response.status == falcon.HTTP_503
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.release_idempotency_key.assert_called_once_with(
+        TEST_ORG_UUID, 'some-key', stored_request.id)
+
+
+def test_idempotency_key_released_on_store_error(idempotent_client, mock_req_store):
+    mock_req_store.claim_idempotency_key.return_value = None
+    mock_req_store.put.side_effect = redis.exceptions.ConnectionError()
+
+    with pytest.raises(redis.exceptions.ConnectionError):
+        idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'some-key')
+
+    stored_request = mock_req_store.put.call_args[0][0]
+    mock_req_store.release_idempotency_key.assert_called_once_with(
+        TEST_ORG_UUID, 'some-key', stored_request.id)
+
+
+def test_idempotency_key_too_long(idempotent_client, mock_req_store):
+    response = idempotent_client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST, 'k' * 256)
+
+    assert response.status == falcon.HTTP_400
+    assert not mock_req_store.claim_idempotency_key.called
+    assert not mock_req_store.put.called
+
+
+def test_idempotency_keys_disabled(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+
+    response = client.post(ACQUISITION_PATH, TEST_DOWNLOAD_REQUEST)
+
+    assert response.status == falcon.HTTP_202
+    assert not mock_req_store.claim_idempotency_key.called
+
+
+def test_metadata_callback_failed(client, mock_req_store):
     response = client.post(
         path=METADATA_PARSER_CALLBACK_PATH.format(req_id=TEST_ACQUISITION_REQ.id),
         data={'state': 'FAILED'})
 
     assert response.status == falcon.HTTP_200
-    updated_request = AcquisitionRequest(**TEST_ACQUISITION_REQ_JSON)
-    updated_request.state = 'ERROR'
-    updated_request.timestamps['ERROR'] = FAKE_TIMESTAMP
-    mock_req_store.put.assert_called_with(updated_request)
+    mock_req_store.transition.assert_called_once_with(TEST_ACQUISITION_REQ.id, 'ERROR')
+    assert not mock_req_store.put.called
 
 
 def test_get_request(das_api, client_swagger, req_store_get):
@@ -182,7 +576,7 @@ def test_delete_request_not_found(client, mock_req_store):
 def test_get_requests_for_org(org_ids, acquisition_requests,
                               das_api, client, mock_req_store):
     das_api.acquisition_res._org_checker = MagicMock()
-    mock_req_store.get_for_org.return_value = acquisition_requests
+    mock_req_store.get_for_orgs.return_value = acquisition_requests * len(org_ids)
 
     response = client.get(path=ACQUISITION_PATH,
                           query_string='orgs=' + ','.join(org_ids))
@@ -190,4 +584,140 @@ def test_get_requests_for_org(org_ids, acquisition_requests,
     returned_requests = [AcquisitionRequest(**req_json) for req_json in response.json]
     assert response.status == falcon.HTTP_200
     assert returned_requests == acquisition_requests * len(org_ids)
-    assert mock_req_store.get_for_org.call_args_list == [call(id) for id in org_ids]
+    mock_req_store.get_for_orgs.assert_called_once_with(org_ids)
+
+
+def test_get_requests_page(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_req_store.get_page_for_orgs.return_value = ([TEST_ACQUISITION_REQ], '0-123')
+
+    response = client.get(path=ACQUISITION_PATH,
+                          query_string='orgs=id-1,id-2&limit=10&cursor=0-12')
+
+    assert response.status == falcon.HTTP_200
+    assert [AcquisitionRequest(**req_json) for req_json in response.json] == [TEST_ACQUISITION_REQ]
+    assert response.headers[NEXT_CURSOR_HEADER] == '0-123'
+    mock_req_store.get_page_for_orgs.assert_called_once_with(
+        ['id-1', 'id-2'], cursor='0-12', limit=10)
+
+
+def test_get_requests_last_page(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_req_store.get_page_for_orgs.return_value = ([TEST_ACQUISITION_REQ], None)
+
+    response = client.get(path=ACQUISITION_PATH, query_string='orgs=id-1&cursor=0-12')
+
+    assert response.status == falcon.HTTP_200
+    assert NEXT_CURSOR_HEADER not in response.headers
+    mock_req_store.get_page_for_orgs.assert_called_once_with(
+        ['id-1'], cursor='0-12', limit=AcquisitionResource.DEFAULT_PAGE_SIZE)
+
+
+@pytest.mark.parametrize('query_string', [
+    'orgs=id-1&limit=0',
+    'orgs=id-1&limit={}'.format(AcquisitionResource.MAX_PAGE_SIZE + 1),
+    'orgs=id-1&cursor=bad-cursor',
+])
+def test_get_requests_bad_pagination(query_string, das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_req_store.get_page_for_orgs.side_effect = InvalidCursorError()
+
+    response = client.get(path=ACQUISITION_PATH, query_string=query_string)
+
+    assert response.status == falcon.HTTP_400
+
+
+def test_get_requests_streamed(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+    other_request = copy.deepcopy(TEST_ACQUISITION_REQ)
+    other_request.id = 'other-fake-id'
+    mock_req_store.get_page_for_orgs.side_effect = [
+        ([TEST_ACQUISITION_REQ, other_request], '0-5'),
+        ([], '1-0'),
+        ([TEST_ACQUISITION_REQ], None),
+    ]
+
+    response = client.get(path=ACQUISITION_PATH, query_string='orgs=id-1,id-2&stream=true')
+
+    assert response.status == falcon.HTTP_200
+    returned_requests = [AcquisitionRequest(**req_json) for req_json in response.json]
+    assert returned_requests == [TEST_ACQUISITION_REQ, other_request, TEST_ACQUISITION_REQ]
+    assert mock_req_store.get_page_for_orgs.call_args_list[1] == call(
+        ['id-1', 'id-2'], cursor='0-5', limit=AcquisitionResource.STREAM_BATCH_SIZE)
+
+
+def test_get_requests_streamed_empty(das_api, client, mock_req_store):
+    das_api.acquisition_res._org_checker = MagicMock()
+    mock_req_store.get_page_for_orgs.return_value = ([], None)
+
+    response = client.get(path=ACQUISITION_PATH, query_string='orgs=id-1&stream=true')
+
+    assert response.json == []
+
+
+def test_get_all_requests(client, mock_req_store):
+    other_request = copy.deepcopy(TEST_ACQUISITION_REQ)
+    other_request.id = 'other-fake-id'
+    mock_req_store.iter_all.return_value = iter([TEST_ACQUISITION_REQ, other_request])
+
+    response = client.get(path=ADMIN_REQUESTS_PATH,
+                          headers={'Authorization': TEST_ADMIN_AUTH_HEADER})
+
+    assert response.status == falcon.HTTP_200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    returned_requests = [AcquisitionRequest(**json.loads(line))
+                         for line in response.body.splitlines()]
+    assert returned_requests == [TEST_ACQUISITION_REQ, other_request]
+
+
+def test_get_all_requests_not_admin(client, mock_req_store):
+    response = client.get(path=ADMIN_REQUESTS_PATH, headers={'Authorization': TEST_AUTH_HEADER})
+
+    assert response.status == falcon.HTTP_403
+    assert not mock_req_store.iter_all.called
+
+
+def test_get_stats(das_api, client):
+    cache_mock = MagicMock()
+    cache_mock.stats.return_value = {'hits': 5, 'misses': 2}
+    das_api.stats_res._stats_sources['requests_cache'] = cache_mock
+
+    response = client.get(path=STATS_PATH, headers={'Authorization': TEST_ADMIN_AUTH_HEADER})
+
+    assert response.status == falcon.HTTP_200
+    assert response.json['requests_cache'] == {'hits': 5, 'misses': 2}
+
+
+def test_get_stats_not_admin(client):
+    response = client.get(path=STATS_PATH, headers={'Authorization': TEST_AUTH_HEADER})
+
+    assert response.status == falcon.HTTP_403
+
+
+def test_get_stats_permissions(das_config, mock_req_store, mock_job_queue):
+    das_config.permissions_cache_size = 10
+    das_api = data_acquisition.app.DasApi(mock_req_store, mock_job_queue, das_config)
+    client = pytest_falcon.plugin.Client(das_api.api)
+
+    response = client.get(path=STATS_PATH, headers={'Authorization': TEST_ADMIN_AUTH_HEADER})
+
+    assert das_api.acquisition_res._org_checker is das_api.request_management_res._org_checker
+    assert response.json['permissions']['cache'] == {'size': 0, 'max_size': 10, 'hits': 0,
+                                                     'misses': 0}
+
+
+def test_token_claims_passed_to_org_checker(das_config, mock_req_store, mock_job_queue):
+    auth_middleware = JwtMiddleware()
+    auth_middleware._add_verification_key({'value': RSA_2048_PUB_KEY})
+    das_api = data_acquisition.app.DasApi(mock_req_store, mock_job_queue, das_config,
+                                          auth_middleware)
+    das_api.request_management_res._org_checker = MagicMock()
+    mock_req_store.get.return_value = TEST_ACQUISITION_REQ
+    client = pytest_falcon.plugin.Client(das_api.api)
+
+    client.get(path=GET_REQUEST_PATH.format(req_id='fake-id'),
+               headers={'Authorization': TEST_AUTH_HEADER})
+
+    das_api.request_management_res._org_checker.validate_access.assert_called_once_with(
+        TEST_AUTH_HEADER, [TEST_ACQUISITION_REQ.orgUUID],
+        {'a': 'b', 'scope': ['nothing'], 'aud': ['something']})
@@ -0,0 +1,377 @@
+import threading
+import time
+from unittest.mock import MagicMock, call
+
+import pytest
+import redis
+import requests
+import requests.exceptions
+import responses
+
+from data_acquisition.cf_app_utils import AdaptiveConcurrencyLimiter, CircuitBreaker, RetryPolicy
+from data_acquisition.acquisition_request import RequestNotFoundError
+from data_acquisition.download_coalescer import WaitingRequest
+from data_acquisition.job_queue import ServiceCall
+from data_acquisition.worker import JobWorker
+import data_acquisition.worker
+
+TEST_JOB = ServiceCall(url='https://some-fake-url/', data={'a': 'b'}, token='bearer fake-token',
+                       request_id='some-fake-id', org_id='some-fake-org', enqueued_at=time.time())
+
+
+@pytest.fixture
+def mock_http_client():
+    return MagicMock()
+
+
+@pytest.fixture
+def worker(mock_job_queue, mock_req_store, mock_http_client):
+    return JobWorker(mock_job_queue, mock_req_store, mock_http_client, 2, 'test-worker')
+
+
+@responses.activate
+def test_call_service(mock_job_queue, mock_req_store):
+    responses.add(responses.POST, TEST_JOB.url, status=202)
+    worker = JobWorker(mock_job_queue, mock_req_store, requests, 1, 'test-worker')
+
+    assert worker._call_service(TEST_JOB)
+    assert responses.calls[0].request.headers['Authorization'] == TEST_JOB.token
+    assert not mock_req_store.transition.called
+
+
+@responses.activate
+def test_call_service_not_ok(mock_job_queue, mock_req_store):
+    responses.add(responses.POST, TEST_JOB.url, status=404)
+    worker = JobWorker(mock_job_queue, mock_req_store, requests, 1, 'test-worker')
+
+    assert not worker._call_service(TEST_JOB)
+    mock_req_store.transition.assert_called_once_with('some-fake-id', 'ERROR')
+
+
+def test_call_service_failure_fanned_out(mock_job_queue, mock_req_store, mock_http_client):
+    download_coalescer = MagicMock()
+    download_coalescer.complete.return_value = [WaitingRequest('waiting-id', 'bearer token'),
+                                                WaitingRequest('deleted-id', 'bearer token')]
+    def transition(req_id, new_state):
+        if req_id == 'deleted-id':
+            raise RequestNotFoundError()
+    mock_req_store.transition.side_effect = transition
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker',
+                       download_coalescer=download_coalescer)
+    mock_http_client.post.return_value = MagicMock(ok=False, status_code=404)
+
+    assert not worker._call_service(TEST_JOB)
+    download_coalescer.complete.assert_called_once_with('some-fake-id')
+    assert mock_req_store.transition.call_args_list == [call('waiting-id', 'ERROR'),
+                                                        call('deleted-id', 'ERROR'),
+                                                        call('some-fake-id', 'ERROR')]
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ConnectionError(),
+    requests.exceptions.ReadTimeout(),
+    requests.exceptions.ChunkedEncodingError(),
+    requests.exceptions.InvalidURL(),
+])
+def test_call_service_error(worker, mock_http_client, mock_req_store, error):
+    mock_http_client.post.side_effect = error
+
+    assert not worker._call_service(TEST_JOB)
+    mock_http_client.post.assert_called_once_with(
+        'https://some-fake-url/', json={'a': 'b'}, headers={'Authorization': 'bearer fake-token'})
+    mock_req_store.transition.assert_called_once_with('some-fake-id', 'ERROR')
+
+
+@pytest.fixture
+def retrying_worker(mock_job_queue, mock_req_store, mock_http_client):
+    return JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker',
+                     RetryPolicy(max_attempts=3, base_delay=0),
+                     {TEST_JOB.url: CircuitBreaker(failure_threshold=2)})
+
+
+@pytest.mark.parametrize('first_error', [
+    requests.exceptions.ConnectionError(),
+    MagicMock(ok=False, status_code=503),
+])
+def test_call_service_retried(retrying_worker, mock_http_client, mock_req_store, first_error):
+    mock_http_client.post.side_effect = [first_error, MagicMock(ok=True, status_code=202)]
+
+    assert retrying_worker._call_service(TEST_JOB)
+    assert mock_http_client.post.call_count == 2
+    assert not mock_req_store.transition.called
+    worker_stats = retrying_worker.stats()
+    assert worker_stats['retries'] == 1
+    assert worker_stats['circuit_breakers'] == {TEST_JOB.url: {
+        'state': 'closed',
+        'consecutive_failures': 0,
+        'times_opened': 0,
+        'rejected': 0,
+    }}
+
+
+def test_call_service_client_error_not_retried(retrying_worker, mock_http_client,
+                                               mock_req_store):
+    mock_http_client.post.return_value = MagicMock(ok=False, status_code=400)
+
+    assert not retrying_worker._call_service(TEST_JOB)
+    assert mock_http_client.post.call_count == 1
+    mock_req_store.transition.assert_called_once_with('some-fake-id', 'ERROR')
+
+
+def test_call_service_circuit_opened(retrying_worker, mock_http_client, mock_req_store):
+    mock_http_client.post.side_effect = requests.exceptions.ConnectionError()
+
+    assert not retrying_worker._call_service(TEST_JOB)
+    assert not retrying_worker._call_service(TEST_JOB)
+
+    assert mock_http_client.post.call_count == 2
+    assert mock_req_store.transition.call_args_list == [call('some-fake-id', 'ERROR')] * 2
+    breaker_stats = retrying_worker.stats()['circuit_breakers'][TEST_JOB.url]
+    assert breaker_stats['state'] == 'open'
+    assert breaker_stats['rejected'] == 2
+
+
+def test_unexpected_error_fails_circuit_trial(mock_job_queue, mock_req_store, mock_http_client):
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    circuit_breaker.record_failure()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker',
+                       circuit_breakers={TEST_JOB.url: circuit_breaker})
+    mock_http_client.post.side_effect = Exception('unexpected')
+
+    with pytest.raises(Exception):
+        worker._call_service(TEST_JOB)
+    assert circuit_breaker.stats()['times_opened'] == 2
+
+
+def test_maintenance(worker, mock_job_queue):
+    worker.STATS_REPORT_INTERVAL = 0.01
+    def report_worker_stats(worker_id, worker_stats, ttl):
+        worker.stop()
+    mock_job_queue.report_worker_stats.side_effect = report_worker_stats
+    mock_job_queue.requeue_abandoned.return_value = 1
+
+    worker._maintain()
+
+    worker_id, worker_stats = mock_job_queue.report_worker_stats.call_args[0]
+    assert worker_id.startswith('test-worker.')
+    assert worker_stats == worker.stats()
+    mock_job_queue.renew_lease.assert_called_once_with(worker_id, JobWorker.LEASE_TTL)
+    assert mock_job_queue.requeue_abandoned.called
+
+
+def test_calls_limited(mock_job_queue, mock_req_store, mock_http_client):
+    concurrency_limiter = MagicMock()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 4, 'test-worker',
+                       concurrency_limiters={TEST_JOB.url: concurrency_limiter})
+    mock_http_client.post.side_effect = [MagicMock(ok=True, status_code=202),
+                                         MagicMock(ok=False, status_code=500),
+                                         requests.exceptions.ConnectionError()]
+
+    for _ in range(3):
+        worker._call_service(TEST_JOB)
+
+    assert concurrency_limiter.acquire.call_args_list == [call(JobWorker.SERVICE_SLOT_TIMEOUT)] * 3
+    assert [kwargs['failed'] for _, kwargs in concurrency_limiter.release.call_args_list] == [
+        False, True, True]
+
+
+def test_calls_to_other_services_not_limited(mock_job_queue, mock_req_store, mock_http_client):
+    concurrency_limiter = AdaptiveConcurrencyLimiter(1, 1)
+    concurrency_limiter.acquire()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 4, 'test-worker',
+                       concurrency_limiters={'https://other-fake-url/': concurrency_limiter})
+    mock_http_client.post.return_value = MagicMock(ok=True, status_code=202)
+
+    assert worker._call_service(TEST_JOB)
+
+
+def test_retry_waits_for_slot(mock_job_queue, mock_req_store, mock_http_client):
+    concurrency_limiter = MagicMock()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 4, 'test-worker',
+                       RetryPolicy(max_attempts=2, base_delay=0),
+                       concurrency_limiters={TEST_JOB.url: concurrency_limiter})
+    mock_http_client.post.side_effect = [MagicMock(ok=False, status_code=503),
+                                         MagicMock(ok=True, status_code=202)]
+
+    assert worker._call_service(TEST_JOB)
+    assert concurrency_limiter.acquire.call_args_list == [call(JobWorker.SERVICE_SLOT_TIMEOUT),
+                                                          call(JobWorker.RETRY_SLOT_TIMEOUT)]
+
+
+def test_job_postponed_when_worker_stopped_before_retry(retrying_worker, mock_job_queue,
+                                                        mock_http_client, mock_req_store):
+    mock_job_queue.take.return_value = TEST_JOB
+    def post(url, **_):
+        retrying_worker.stop()
+        return MagicMock(ok=False, status_code=503)
+    mock_http_client.post.side_effect = post
+
+    retrying_worker._consume('test-worker:0')
+
+    assert mock_http_client.post.call_count == 1
+    mock_job_queue.postpone.assert_called_once_with('test-worker:0')
+    assert not mock_job_queue.finish.called
+    assert not mock_req_store.transition.called
+    assert retrying_worker.stats()['retries'] == 0
+
+
+def test_slot_given_back_when_circuit_open(mock_job_queue, mock_req_store, mock_http_client):
+    concurrency_limiter = AdaptiveConcurrencyLimiter(1, 1)
+    circuit_breaker = CircuitBreaker(failure_threshold=1)
+    circuit_breaker.record_failure()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 4, 'test-worker',
+                       circuit_breakers={TEST_JOB.url: circuit_breaker},
+                       concurrency_limiters={TEST_JOB.url: concurrency_limiter})
+
+    assert not worker._call_service(TEST_JOB)
+    assert not mock_http_client.post.called
+    assert concurrency_limiter.stats()['in_flight'] == 0
+
+
+def test_job_for_busy_service_postponed(mock_job_queue, mock_req_store, mock_http_client):
+    busy_limiter = AdaptiveConcurrencyLimiter(1, 1)
+    busy_limiter.acquire()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker',
+                       concurrency_limiters={TEST_JOB.url: busy_limiter})
+    worker.SERVICE_SLOT_TIMEOUT = 0.01
+    other_job = TEST_JOB._replace(url='https://other-fake-url/')
+    jobs = [TEST_JOB, other_job]
+    def take(consumer_name, timeout):
+        if len(mock_job_queue.take.call_args_list) == len(jobs):
+            worker.stop()
+        return jobs[len(mock_job_queue.take.call_args_list) - 1]
+    mock_job_queue.take.side_effect = take
+    mock_http_client.post.return_value = MagicMock(ok=True, status_code=202)
+
+    worker._consume('test-worker:0')
+
+    mock_job_queue.postpone.assert_called_once_with('test-worker:0')
+    mock_job_queue.finish.assert_called_once_with('test-worker:0')
+    mock_http_client.post.assert_called_once_with(
+        other_job.url, json=other_job.data, headers={'Authorization': other_job.token})
+    assert not mock_req_store.transition.called
+    worker_stats = worker.stats()
+    assert worker_stats['postponed'] == 1
+    assert worker_stats['org_wait_times'][TEST_JOB.org_id]['jobs'] == 1
+    assert worker_stats['concurrency'][TEST_JOB.url]['in_flight'] == 1
+
+
+def test_consume(worker, mock_job_queue, mock_req_store, mock_http_client):
+    def take(consumer_name, timeout):
+        if len(mock_job_queue.take.call_args_list) == 3:
+            worker.stop()
+        return TEST_JOB
+    mock_job_queue.take.side_effect = take
+    mock_http_client.post.side_effect = [Exception('unexpected'),
+                                         MagicMock(ok=True, status_code=202),
+                                         MagicMock(ok=True, status_code=202)]
+
+    worker._consume('test-worker:0')
+
+    assert mock_http_client.post.call_count == 3
+    assert mock_job_queue.finish.call_args_list == [call('test-worker:0')] * 3
+    mock_req_store.transition.assert_called_once_with('some-fake-id', 'ERROR')
+
+
+def test_org_wait_times(worker, mock_job_queue, mock_http_client, monkeypatch):
+    monkeypatch.setattr(data_acquisition.worker.time, 'time', lambda: 1000.0)
+    jobs = [TEST_JOB._replace(org_id='org-a', enqueued_at=999.0),
+            TEST_JOB._replace(org_id='org-b', enqueued_at=998.0),
+            TEST_JOB._replace(org_id='org-a', enqueued_at=997.0)]
+    def take(consumer_name, timeout):
+        if len(mock_job_queue.take.call_args_list) == len(jobs):
+            worker.stop()
+        return jobs[len(mock_job_queue.take.call_args_list) - 1]
+    mock_job_queue.take.side_effect = take
+    mock_http_client.post.return_value = MagicMock(ok=True, status_code=202)
+
+    worker._consume('test-worker:0')
+
+    assert worker.stats()['org_wait_times'] == {
+        'org-a': {'jobs': 2, 'average_wait_time': 2.0, 'max_wait_time': 3.0},
+        'org-b': {'jobs': 1, 'average_wait_time': 2.0, 'max_wait_time': 2.0},
+    }
+
+
+def test_consume_redis_error(worker, mock_job_queue):
+    worker.RECONNECT_DELAY = 0
+    def take(consumer_name, timeout):
+        if len(mock_job_queue.take.call_args_list) == 1:
+            raise redis.exceptions.ConnectionError()
+        worker.stop()
+    mock_job_queue.take.side_effect = take
+
+    worker._consume('test-worker:0')
+
+    assert mock_job_queue.take.call_count == 2
+    assert not mock_job_queue.finish.called
+
+
+def test_job_left_taken_after_redis_error_in_postpone(mock_job_queue, mock_req_store,
+                                                      mock_http_client):
+    busy_limiter = AdaptiveConcurrencyLimiter(1, 1)
+    busy_limiter.acquire()
+    worker = JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker',
+                       concurrency_limiters={TEST_JOB.url: busy_limiter})
+    worker.SERVICE_SLOT_TIMEOUT = 0
+    worker.RECONNECT_DELAY = 0
+    def take(consumer_name, timeout):
+        if mock_job_queue.take.call_count == 2:
+            worker.stop()
+            return None
+        return TEST_JOB
+    mock_job_queue.take.side_effect = take
+    mock_job_queue.postpone.side_effect = redis.exceptions.ConnectionError()
+
+    worker._consume('test-worker:0')
+
+    # the job stays in the consumer's processing list, the next take puts it back in the queue
+    assert mock_job_queue.take.call_count == 2
+    assert not mock_job_queue.finish.called
+
+
+def test_job_left_taken_after_redis_error_in_failing_request(worker, mock_job_queue,
+                                                             mock_req_store, mock_http_client):
+    worker.RECONNECT_DELAY = 0
+    def take(consumer_name, timeout):
+        if mock_job_queue.take.call_count == 2:
+            worker.stop()
+            return None
+        return TEST_JOB
+    mock_job_queue.take.side_effect = take
+    mock_http_client.post.return_value = MagicMock(ok=False, status_code=400)
+    mock_req_store.transition.side_effect = redis.exceptions.ConnectionError()
+
+    worker._consume('test-worker:0')
+
+    assert mock_job_queue.take.call_count == 2
+    assert not mock_job_queue.finish.called
+
+
+def test_run(worker, mock_job_queue):
+    consumers = []
+    consumers_lock = threading.Lock()
+    def take(consumer_name, timeout):
+        with consumers_lock:
+            if consumer_name not in consumers:
+                consumers.append(consumer_name)
+            if len(consumers) == 2:
+                worker.stop()
+    mock_job_queue.take.side_effect = take
+    mock_job_queue.requeue_abandoned.return_value = 1
+
+    worker.run()
+
+    worker_id = mock_job_queue.renew_lease.call_args[0][0]
+    assert worker_id.startswith('test-worker.')
+    assert mock_job_queue.requeue_abandoned.called
+    assert sorted(consumers) == [worker_id + ':0', worker_id + ':1']
+    mock_job_queue.release_lease.assert_called_once_with(worker_id)
+
+
+def test_workers_with_same_name_have_different_ids(mock_job_queue, mock_req_store,
+                                                    mock_http_client):
+    workers = [JobWorker(mock_job_queue, mock_req_store, mock_http_client, 1, 'test-worker')
+               for _ in range(2)]
+
+    assert workers[0]._id != workers[1]._id